@@ -0,0 +1,172 @@
+"""
+Anonymizes a recorded archive (benchmarks.cycle --record, WebWrapper.start_recording) so captured game pages
+can be shared and added to the extractor corpus (benchmarks.corpus)
+The archive is read twice: the first pass learns the session tokens, the player, tribe and village names and ids
+from the game data of every page, the second pass replaces them everywhere (pages, urls) with stable aliases.
+Request bodies, cookies and all headers but the content type are dropped.
+Names of other players are only replaced when passed with --replace, check the output before sharing it
+
+Usage:
+    python -m benchmarks.anonymize cache/session.jsonl.gz benchmarks/data/corpus.jsonl.gz
+    python -m benchmarks.anonymize cache/session.jsonl.gz out.jsonl.gz --replace "Neighbour=Player 2"
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import re
+import sys
+from urllib.parse import urlparse, parse_qsl, urlencode, urlunparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from core import tokens
+from core.extractors import EXTRACTORS
+from pages.overview import OverviewPage
+
+HOST = "anon.tribalwars.local"
+TOKEN = "0000anon"
+# query parameters that hold session data
+DROPPED_PARAMETERS = ["h", "_", "client_time", "sitter", "t"]
+
+
+class Anonymizer:
+    """
+    Learns the identifying values of a recorded session and replaces them with stable aliases
+    """
+
+    def __init__(self, replacements=None):
+        # value -> alias, longest values are replaced first so names that contain other names stay intact
+        self.replacements = dict(replacements or {})
+        self.ids = {}
+        self.hosts = set()
+        self.villages = 0
+
+    def alias(self, value, alias):
+        value = str(value)
+        if value and value not in self.replacements:
+            self.replacements[value] = alias
+
+    def alias_id(self, value):
+        """
+        Ids are replaced by ids of the same length, pages keep parsing as numbers
+        """
+        value = str(value)
+        # short numbers are everywhere on a page
+        if value.isdigit() and len(value) >= 4 and value not in self.ids:
+            self.ids[value] = str(10 ** (len(value) - 1) + len(self.ids) + 1)
+
+    def alias_village(self, name):
+        if name and name not in self.replacements:
+            self.villages += 1
+            self.alias(name, f"Village {self.villages:03d}")
+
+    def learn(self, entry, text):
+        """
+        First pass, collects the identifying values of a single page
+        """
+        self.hosts.add(urlparse(entry["url"]).netloc)
+        if entry.get("response_url"):
+            self.hosts.add(urlparse(entry["response_url"]).netloc)
+        for token in (tokens.csrf_token(text), tokens.h_token(text)):
+            if token:
+                self.alias(token, TOKEN)
+        state = EXTRACTORS["game_state"].extract(text) if "TribalWars.updateGameData(" in text else None
+        if not isinstance(state, dict):
+            return
+        player = state.get("player") or {}
+        self.alias(player.get("name", ""), "player")
+        self.alias_id(player.get("id", ""))
+        self.alias_id(player.get("ally", ""))
+        if player.get("sitter") not in (None, "0", 0):
+            self.alias_id(player["sitter"])
+        village = state.get("village") or {}
+        self.alias_id(village.get("id", ""))
+        self.alias_village(village.get("name"))
+        if state.get("csrf"):
+            self.alias(state["csrf"], TOKEN)
+        if 'id="production_table"' in text:
+            # every village of the player
+            for own in OverviewPage.iter_villages(text):
+                self.alias_id(own.village_id)
+                self.alias_village(own.village_name)
+
+    def pattern(self):
+        names = sorted(self.replacements, key=len, reverse=True)
+        ids = sorted(self.ids, key=len, reverse=True)
+        parts = [re.escape(name) for name in names]
+        parts += [rf"(?<!\d){re.escape(value)}(?!\d)" for value in ids]
+        return re.compile("|".join(parts)) if parts else None
+
+    def rewrite(self, text, pattern):
+        if not pattern:
+            return text
+        return pattern.sub(lambda match: self.replacements.get(match.group()) or self.ids[match.group()], text)
+
+    def rewrite_url(self, url, pattern):
+        parsed = urlparse(url)
+        query = urlencode([
+            (k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k not in DROPPED_PARAMETERS
+        ])
+        return self.rewrite(urlunparse(parsed._replace(netloc=HOST, query=query)), pattern)
+
+    def anonymize(self, entries):
+        """
+        Returns anonymized copies of the archive entries
+        """
+        texts = []
+        for entry in entries:
+            text = base64.b64decode(entry["content"]).decode("utf-8", errors="replace")
+            texts.append(text)
+            self.learn(entry, text)
+        for host in self.hosts:
+            self.alias(host, HOST)
+        pattern = self.pattern()
+        output = []
+        for index, (entry, text) in enumerate(zip(entries, texts)):
+            headers = {k: v for k, v in entry.get("headers", {}).items() if k.lower() == "content-type"}
+            output.append({
+                "ts": index,
+                "method": entry["method"],
+                "url": self.rewrite_url(entry["url"], pattern),
+                "body": None,
+                "status": entry["status"],
+                "response_url": self.rewrite_url(entry.get("response_url") or entry["url"], pattern),
+                "headers": headers,
+                "content": base64.b64encode(self.rewrite(text, pattern).encode("utf-8")).decode("ascii"),
+                "elapsed": entry.get("elapsed", 0),
+            })
+        return output
+
+
+def read_archive(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_archive(path, entries):
+    # mtime=0 keeps the file identical between runs
+    with open(path, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as archive:
+        for entry in entries:
+            archive.write((json.dumps(entry, sort_keys=True) + "\n").encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Anonymize a recorded archive")
+    parser.add_argument("source", help="recorded archive")
+    parser.add_argument("target", help="anonymized archive to write")
+    parser.add_argument("--replace", action="append", default=[], metavar="VALUE=ALIAS",
+                        help="extra value to replace (other players, tribes)")
+    args = parser.parse_args()
+
+    anonymizer = Anonymizer(dict(item.split("=", 1) for item in args.replace))
+    entries = anonymizer.anonymize(read_archive(args.source))
+    write_archive(args.target, entries)
+    print(f"Wrote {len(entries)} pages to {args.target}, replaced {len(anonymizer.replacements)} values "
+          f"and {len(anonymizer.ids)} ids")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+"""
+Extractor benchmark and regression runner over a corpus of game pages
+Every extractor (the registered page fields and the parsers in game/) runs over the corpus pages that hold
+its marker. The runner reports throughput (pages/s, MB/s) and the peak allocation per page (tracemalloc)
+and compares the results with a stored baseline:
+- the output digest flags extractors whose result changed
+- time and allocations are flagged when they grow more than the tolerance, every timed repeat is paired
+  with a run of a fixed calibration workload and the time relative to it is compared, so the load of the
+  machine (and a baseline from another machine) mostly cancels out. The spread of the repeats widens the
+  allowed growth of noisy extractors
+
+The default corpus (benchmarks/data/corpus.jsonl.gz) is generated by the fake world and anonymized,
+captured pages can be added with benchmarks.anonymize
+
+Usage:
+    python -m benchmarks.corpus
+    python -m benchmarks.corpus --update
+    python -m benchmarks.corpus --build
+    python -m benchmarks.corpus --corpus cache/anonymized.jsonl.gz --baseline cache/baseline.json --update
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from benchmarks.anonymize import Anonymizer, read_archive, write_archive
+from benchmarks.fakeserver import FakeWorld
+from core import tokens
+from core.extractors import COMMAND_FORM_ID, EXTRACTORS, Extractor
+from game.reports import ReportManager
+from game.resources import ResourceManager
+from game.snobber import SnobManager
+from pages.overview import OverviewPage
+
+DATA = os.path.join(os.path.dirname(os.path.realpath(__file__)), "data")
+CORPUS = os.path.join(DATA, "corpus.jsonl.gz")
+BASELINE = os.path.join(DATA, "baseline.json")
+
+
+def attack_report(text):
+    manager = ReportManager()
+    manager.logger = logging.getLogger("Reports")
+    manager.game_state = Extractor.game_state(text)
+    return manager.parse_attack_report(text)
+
+
+def snob(text):
+    manager = SnobManager()
+    return manager.need_reserve(text), SnobManager.recruitable(text)
+
+
+def cases():
+    """
+    Extractor name -> (marker, function), an extractor runs over the pages that contain its marker
+    """
+    table = {f"field:{name}": (extractor.anchor, extractor.extract) for name, extractor in EXTRACTORS.items()}
+    table.update({
+        "tokens": ("", lambda text: (tokens.csrf_token(text), tokens.h_token(text))),
+        "attack_form": (f'id="{COMMAND_FORM_ID}"', Extractor.attack_form),
+        "units_in_total": ('<table id="units_home"', Extractor.units_in_total),
+        "production_table": ('id="production_table"', lambda text: list(OverviewPage.iter_villages(text))),
+        "attack_report": ('class="report_ReportAttack', attack_report),
+        "market_offers": ("<!-- insert the offer -->", ResourceManager.market_offers),
+        "market_incoming": ("Aankomend:", ResourceManager.incoming_resources),
+        "market_own_offers": ('data-village="', ResourceManager.own_offers),
+        "snob": ("train.storage_item = ", snob),
+    })
+    return table
+
+
+def build(path=CORPUS, villages=20, detailed=3):
+    """
+    Generates the synthetic corpus: the pages of a few villages of a fake world, anonymized like a capture
+    """
+    world = FakeWorld(villages=villages)
+    entries = []
+
+    def add(village, screen, body, **params):
+        query = "&".join([f"village={village['id']}", f"screen={screen}"] + [f"{k}={v}" for k, v in params.items()])
+        content = world.page(village, screen, body).encode("utf-8")
+        entries.append({
+            "ts": 0, "method": "GET", "url": f"https://bench.tribalwars.local/game.php?{query}", "body": None,
+            "status": 200, "response_url": None, "headers": {"content-type": "text/html; charset=UTF-8"},
+            "content": base64.b64encode(content).decode("ascii"), "elapsed": 0,
+        })
+
+    for village in list(world.villages.values())[:detailed]:
+        add(village, "overview", "")
+        add(village, "main", world.screen_main(village, {}))
+        for building in ("barracks", "stable", "garage"):
+            add(village, building, world.screen_train(village, {}, building))
+        add(village, "smith", world.screen_smith(village, {}))
+        add(village, "snob", world.screen_snob(village, {}))
+        add(village, "place", world.place_form(village))
+        add(village, "place", world.place_confirm(village), **{"try": "confirm"})
+        add(village, "place", world.place_units(village), mode="units")
+        add(village, "report", world.report_list(village), mode="all")
+        for report_id in range(village["id"] * 100, village["id"] * 100 + 4):
+            add(village, "report", world.report_view(village, report_id), mode="all", view=report_id)
+        for mode in ("own_offer", "other_offer", "all_own_offer"):
+            add(village, "market", world.screen_market(village, {"mode": mode}), mode=mode)
+        add(village, "map", world.map_sectors(village))
+        add(village, "overview", world.quests(village), quests=1)
+        add(village, "barracks", world.train_queue(village, "barracks"), queue=1)
+        add(village, "place", world.scavenge(village), mode="scavenge")
+        add(village, "flags", world.flags(village))
+        add(village, "market", world.premium_exchange(village), mode="exchange")
+    village = next(iter(world.villages.values()))
+    for mode in ("prod", "units", "buildings"):
+        add(village, "overview_villages", world.screen_overview_villages(village, {"mode": mode}), mode=mode)
+    entries = Anonymizer().anonymize(entries)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    write_archive(path, entries)
+    return entries
+
+
+def load(path=CORPUS):
+    if not os.path.exists(path) and path == CORPUS:
+        build(path)
+    texts = []
+    for entry in read_archive(path):
+        if "json" in entry.get("headers", {}).get("content-type", ""):
+            continue
+        texts.append(base64.b64decode(entry["content"]).decode("utf-8", errors="replace"))
+    return texts
+
+
+def _plain(value):
+    if hasattr(value, "__dict__"):
+        return vars(value)
+    return str(value)
+
+
+def digest(results):
+    """
+    Stable digest of the extractor output over the corpus
+    """
+    return hashlib.sha1(json.dumps(results, sort_keys=True, default=_plain).encode("utf-8")).hexdigest()[:16]
+
+
+CALIBRATION_TEXT = '<td class="unit-item">12</td><span class="res wood">1.234</span>' * 2000
+CALIBRATION_PATTERN = re.compile(r'<span class="res (\w+)">([\d.]+)</span>')
+
+
+def calibrate(rounds=10):
+    """
+    Time (us) of a fixed regex and string workload, the reference the extractor times are divided by
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        CALIBRATION_PATTERN.findall(CALIBRATION_TEXT)
+        CALIBRATION_TEXT.find("missing")
+        CALIBRATION_TEXT.replace("unit-item", "unit")
+    return (time.perf_counter() - start) * 1e6
+
+
+def spread(values):
+    """
+    Relative noise of repeated measurements: the median absolute deviation scaled to a standard deviation
+    """
+    middle = statistics.median(values)
+    if not middle:
+        return 0.0
+    return 1.4826 * statistics.median(abs(value - middle) for value in values) / middle
+
+
+def measure(func, pages, rounds, repeats=15):
+    """
+    Runs an extractor over its pages, returns the results and the timings:
+    us per page, time relative to the calibration workload, its noise, MB/s and peak KB per page
+    Every repeat runs right after a calibration run (interleaved, so both see the same machine load),
+    the medians of the repeats are used
+    """
+    results = [func(text) for text in pages]
+    size = sum(len(text.encode("utf-8")) for text in pages)
+    timings = []
+    calibrations = []
+    for _ in range(repeats):
+        calibrations.append(calibrate(rounds=2))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text in pages:
+                func(text)
+        timings.append((time.perf_counter() - start) * 1e6 / (rounds * len(pages)))
+    relative = [timing / calibration for timing, calibration in zip(timings, calibrations)]
+    tracemalloc.start()
+    peaks = 0
+    for text in pages:
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        func(text)
+        peaks += tracemalloc.get_traced_memory()[1] - current
+    tracemalloc.stop()
+    per_page = statistics.median(timings)
+    return results, {
+        "us_per_page": per_page,
+        "relative": statistics.median(relative),
+        "noise": spread(relative),
+        "mb_per_s": size / len(pages) / per_page,
+        "peak_kb": peaks / len(pages) / 1024,
+    }
+
+
+def compare(name, current, baseline, scale, tolerance):
+    """
+    Returns the regressions of an extractor compared to its baseline entry
+    """
+    if not baseline:
+        return ["new"]
+    flags = []
+    if current["digest"] != baseline["digest"] or current["pages"] != baseline["pages"]:
+        flags.append("OUTPUT CHANGED")
+    if "relative" in baseline:
+        ratio = current["relative"] / baseline["relative"]
+        # three standard deviations of both measurements are within the noise
+        noise = 3 * (current["noise"] ** 2 + baseline.get("noise", 0.0) ** 2) ** 0.5
+    else:
+        # baselines stored before the interleaved runs only have the time, scaled by the calibration
+        ratio = current["us_per_page"] / (baseline["us_per_page"] * scale)
+        noise = 3 * current["noise"]
+    if ratio > 1 + tolerance + noise:
+        flags.append(f"SLOWER {ratio:.2f}x")
+    if current["peak_kb"] > baseline["peak_kb"] * (1 + tolerance) + 1:
+        flags.append(f"ALLOCATES {current['peak_kb'] / max(baseline['peak_kb'], 0.1):.2f}x")
+    return flags
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extractor benchmark and regression runner")
+    parser.add_argument("--corpus", default=CORPUS, help="archive with the corpus pages")
+    parser.add_argument("--baseline", default=BASELINE, help="stored baseline to compare with")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--build", action="store_true", help="regenerate the synthetic corpus first")
+    parser.add_argument("--filter", default="", help="only run extractors whose name contains this")
+    parser.add_argument("--rounds", type=int, default=5, help="runs over the pages per timed repeat")
+    parser.add_argument("--repeats", type=int, default=15, help="timed repeats, the median is compared")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="allowed growth of time (on top of the measured noise) and allocations")
+    args = parser.parse_args()
+
+    # report dates are parsed in local time
+    os.environ["TZ"] = "UTC"
+    if hasattr(time, "tzset"):
+        time.tzset()
+    if args.build:
+        print(f"Built {len(build(args.corpus))} pages")
+    pages = load(args.corpus)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    calibration = statistics.median(calibrate() for _ in range(5))
+    scale = calibration / baseline["calibration_us"] if baseline.get("calibration_us") else 1.0
+    print(f"{len(pages)} pages, {sum(len(text) for text in pages) / 1024 / 1024:.1f} MB, "
+          f"machine speed {1 / scale:.2f}x baseline")
+    print(f"{'extractor':28s} {'pages':>5} {'us/page':>9} {'noise':>6} {'pages/s':>9} {'MB/s':>7} {'peak KB':>8}  status")
+
+    results = {}
+    regressions = 0
+    for name, (marker, func) in cases().items():
+        if args.filter not in name:
+            continue
+        selected = [text for text in pages if marker in text]
+        if not selected:
+            print(f"{name:28s} {0:>5}  no pages with {marker!r}")
+            continue
+        output, timing = measure(func, selected, args.rounds, args.repeats)
+        per_page = timing["us_per_page"]
+        results[name] = {
+            "pages": len(selected), "us_per_page": round(per_page, 2), "mb_per_s": round(timing["mb_per_s"], 1),
+            "relative": round(timing["relative"], 6), "noise": round(timing["noise"], 3),
+            "peak_kb": round(timing["peak_kb"], 1), "digest": digest(output),
+        }
+        flags = compare(name, results[name], baseline.get("extractors", {}).get(name), scale, args.tolerance)
+        if flags and flags != ["new"]:
+            regressions += 1
+        print(
+            f"{name:28s} {len(selected):>5} {per_page:9.1f} {timing['noise']:6.1%} {1e6 / per_page:9.0f} "
+            f"{timing['mb_per_s']:7.1f} {timing['peak_kb']:8.1f}  {', '.join(flags) or 'ok'}"
+        )
+
+    if args.update:
+        if args.filter:
+            results = {**baseline.get("extractors", {}), **results}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "calibration_us": round(calibration, 1),
+                "python": platform.python_version(),
+                "extractors": results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Stored the baseline in {args.baseline}")
+    elif regressions:
+        print(f"{regressions} extractor(s) regressed")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Offline throughput benchmark of a full bot cycle
+Runs the village pipelines against the local FakeWorld (or a recorded archive) with virtualized sleeps
+and reports requests per village, bytes transferred, parse time and cycle time
+
+Usage:
+    python -m benchmarks.cycle
+    python -m benchmarks.cycle --villages 1 10 100 --cycles 2
+    python -m benchmarks.cycle --villages 10 --record cache/bench_10.jsonl.gz
+    python -m benchmarks.cycle --villages 10 --replay cache/bench_10.jsonl.gz
+"""
+
+import argparse
+import copy
+import functools
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlparse, parse_qsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from benchmarks.fakeserver import FakeWorld
+from core.cachestore import CacheStore
+from core.extractors import Extractor
+from core.filemanager import FileManager
+from core.reportarchive import ReportArchive
+from core.request import WebWrapper
+from game.village import Village
+from pages.overview import OverviewIngestion, OverviewPage
+
+ENDPOINT = "https://bench.tribalwars.local/game.php"
+
+CACHE_DIRECTORIES = ["cache/world", "cache/logs", "cache/managed", "cache/hunter"]
+
+
+class VirtualClock:
+    """
+    Replaces sleeping by advancing a virtual clock, the cycle runs at full speed while the
+    time the bot would have waited is still accounted for
+    """
+
+    def __init__(self):
+        self.offset = 0.0
+        self.lock = threading.Lock()
+        self._sleep = time.sleep
+
+    def monotonic(self):
+        return time.monotonic() + self.offset
+
+    def sleep(self, seconds):
+        if seconds > 0:
+            with self.lock:
+                self.offset += seconds
+
+    def __enter__(self):
+        time.sleep = self.sleep
+        return self
+
+    def __exit__(self, *args):
+        time.sleep = self._sleep
+
+
+class ParseTimer:
+    """
+    Measures the time spent in the page extractors and parsers
+    """
+    targets = [
+        (Extractor, [name for name, value in vars(Extractor).items() if isinstance(value, staticmethod)]),
+        (OverviewPage, ["parse_production_table", "parse_header_info"]),
+        (OverviewIngestion, ["parse_units", "parse_buildings", "parse_incomings"]),
+    ]
+
+    def __init__(self):
+        self.elapsed = 0.0
+        self.calls = Counter()
+        self.originals = []
+        self.lock = threading.Lock()
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self.lock:
+                    self.elapsed += time.perf_counter() - start
+                    self.calls[name] += 1
+        return timed
+
+    def __enter__(self):
+        for owner, names in self.targets:
+            for name in names:
+                raw = vars(owner)[name]
+                self.originals.append((owner, name, raw))
+                if isinstance(raw, staticmethod):
+                    setattr(owner, name, staticmethod(self.wrap(name, raw.__func__)))
+                else:
+                    setattr(owner, name, self.wrap(name, raw))
+        return self
+
+    def __exit__(self, *args):
+        for owner, name, raw in self.originals:
+            setattr(owner, name, raw)
+        self.originals = []
+
+
+class TrafficCounter:
+    """
+    Response hook counting requests and bytes per village
+    """
+
+    def __init__(self):
+        self.requests = Counter()
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, response, *args, **kwargs):
+        params = dict(parse_qsl(urlparse(response.request.url).query))
+        with self.lock:
+            self.requests[params.get("village", "global")] += 1
+            self.bytes += len(response.content)
+        return response
+
+
+def bench_config(village_ids, concurrency=1):
+    """
+    The example configuration with the features that need a populated world (farming, market, gathering) disabled
+    """
+    config = FileManager.load_json_file("config.example.json")
+    config["server"]["endpoint"] = ENDPOINT
+    config["bot"]["concurrent_villages"] = concurrency
+    config["bot"]["delay_factor"] = 1.0
+    config["farms"]["farm"] = False
+    config["market"]["auto_trade"] = False
+    config["world"]["quests_enabled"] = False
+    config["world"]["flags_enabled"] = False
+    config["villages"] = {vid: copy.deepcopy(config["village_template"]) for vid in village_ids}
+    return config
+
+
+def run_cycle(wrapper, villages, config, unavailable=None):
+    """
+    A single bot cycle, the same steps as TWB.run
+    """
+    wrapper.page_cache.clear()
+    overview_page = OverviewPage(wrapper)
+    ingestion = None
+    if config["bot"].get("overview_ingestion", True) and len(villages) > 1:
+        ingestion = OverviewIngestion(wrapper, overview_page, unavailable)
+        ingestion.ingest()
+    rm = None
+    for village in villages:
+        if not rm:
+            rm = village.rep_man
+        else:
+            village.rep_man = rm
+        village.overview = ingestion.get(village.village_id) if ingestion else None
+        village.run(config=config)
+
+
+def benchmark(amount, cycles=1, record=None, replay=None, concurrency=1, premium=True):
+    """
+    Runs a benchmark for an amount of villages and returns the measurements
+    """
+    world = FakeWorld(villages=amount, premium=premium)
+    wrapper = WebWrapper(ENDPOINT, server="bench", endpoint=ENDPOINT)
+    wrapper.replay(path=replay, fallback=world) if replay else wrapper.replay(adapter=world)
+    if record:
+        wrapper.start_recording(record)
+    wrapper.metrics.dump_interval = 0
+    traffic = TrafficCounter()
+    wrapper.web.hooks["response"].append(traffic)
+
+    config = bench_config(list(world.villages), concurrency=concurrency)
+    wrapper.concurrency = concurrency
+    villages = [Village(village_id=vid, wrapper=wrapper) for vid in world.villages]
+
+    clock = VirtualClock()
+    wrapper.pacer.clock = clock.monotonic
+    wrapper.pacer.sleep = clock.sleep
+    wrapper.retry.sleep = clock.sleep
+    existing = {d: set(os.listdir(FileManager.get_path(d))) for d in CACHE_DIRECTORIES}
+    # the report, farm and map caches of the generated villages go to a throwaway database
+    store_directory = tempfile.mkdtemp(prefix="twb-bench-")
+    previous_store = CacheStore.use(CacheStore(os.path.join(store_directory, "cache.db"), migrate=False))
+    previous_archive = ReportArchive.use(ReportArchive(os.path.join(store_directory, "reports"), migrate=False))
+    cycle_times = []
+    unavailable = set()
+    try:
+        with clock, ParseTimer() as parser:
+            for _ in range(cycles):
+                start = time.perf_counter()
+                run_cycle(wrapper, villages, config, unavailable)
+                cycle_times.append(time.perf_counter() - start)
+    finally:
+        if record:
+            wrapper.stop_recording()
+        FileManager.flush()
+        CacheStore.use(previous_store).close()
+        ReportArchive.use(previous_archive).close()
+        shutil.rmtree(store_directory, ignore_errors=True)
+        # remove the cache files of the generated villages
+        for directory, files in existing.items():
+            for created in set(os.listdir(FileManager.get_path(directory))) - files:
+                FileManager.remove_file(os.path.join(directory, created))
+
+    total = sum(traffic.requests.values())
+    return {
+        "villages": amount,
+        "cycles": cycles,
+        "requests": total,
+        "requests_per_village": round(total / (amount * cycles), 2),
+        "bytes": traffic.bytes,
+        "bytes_per_village": int(traffic.bytes / (amount * cycles)),
+        "parse_seconds": round(parser.elapsed, 4),
+        "cycle_seconds": round(sum(cycle_times) / cycles, 4),
+        "virtual_wait_seconds": round(clock.offset, 1),
+        "cache": wrapper.page_cache.stats(),
+        "screens": dict(world.requests.most_common()),
+        "metrics": wrapper.metrics.snapshot()["endpoints"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TWB offline cycle benchmark")
+    parser.add_argument("--villages", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--cycles", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--no-premium", action="store_true", help="world without the premium overview screens")
+    parser.add_argument("--record", help="record the traffic of the (single) run to this archive")
+    parser.add_argument("--replay", help="answer requests from this archive, unknown requests go to the fake world")
+    parser.add_argument("--json", action="store_true", help="print the raw measurements")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    FileManager.create_directories(CACHE_DIRECTORIES)
+
+    results = []
+    for amount in args.villages:
+        results.append(benchmark(
+            amount, cycles=args.cycles, record=args.record, replay=args.replay,
+            concurrency=args.concurrency, premium=not args.no_premium,
+        ))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'villages':>8} {'req/village':>12} {'KB/village':>11} {'parse s':>9} {'cycle s':>9} {'waited s':>9}")
+    for result in results:
+        print(
+            f"{result['villages']:>8} {result['requests_per_village']:>12} "
+            f"{result['bytes_per_village'] / 1024:>11.1f} {result['parse_seconds']:>9} "
+            f"{result['cycle_seconds']:>9} {result['virtual_wait_seconds']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
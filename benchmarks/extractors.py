@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of the page extractors
+Compares the previous unanchored regex search per field with the anchored PageScanner lookups
+
+Usage:
+    python -m benchmarks.extractors
+    python -m benchmarks.extractors --archive cache/bench_10.jsonl.gz
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from benchmarks.tokens import load_pages
+from core.extractors import EXTRACTORS, PageScanner
+
+# fields the managers read from the same page
+PROFILES = {
+    "main": ("game_state", "building_data", "active_building_queue"),
+    "train": ("game_state", "recruit_data", "active_recruit_queue"),
+    "recruit": ("recruit_data",),
+    "overview": ("game_state", "village_ids"),
+}
+
+
+def previous_recruit_data(text):
+    """
+    Quoted the keys with a substitution over the whole blob
+    """
+    match = re.search(r'(?s)unit_managers.units = (\{.+?\});', text)
+    if match:
+        return json.loads(re.sub(r'([\{\s,])(\w+)(:)', r'\1"\2"\3', match.group(1)), strict=False)
+    return None
+
+
+PREVIOUS = {"recruit_data": previous_recruit_data}
+
+
+def previous(text, fields):
+    """
+    One re.search / re.findall over the full page per field
+    """
+    result = {}
+    for name in fields:
+        extractor = EXTRACTORS[name]
+        if name in PREVIOUS:
+            result[name] = PREVIOUS[name](text)
+        elif extractor.multiple:
+            result[name] = extractor.finish(re.findall(extractor.pattern, text))
+        else:
+            match = re.search(extractor.pattern, text)
+            result[name] = extractor.finish(match.group(1) if match else None)
+    return result
+
+
+def scanned(text, fields):
+    page = PageScanner.get(fields).scan(text)
+    return {name: getattr(page, name) for name in fields}
+
+
+def measure(func, texts, fields, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            func(text, fields)
+    return (time.perf_counter() - start) / (rounds * len(texts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extractor micro-benchmark")
+    parser.add_argument("--archive", help="recorded archive (benchmarks.cycle --record)")
+    parser.add_argument("--rounds", type=int, default=100)
+    args = parser.parse_args()
+
+    texts = [page.text for page in load_pages(args.archive) if "json" not in page.headers.get("content-type", "")]
+    size = sum(len(text) for text in texts) / len(texts)
+    print(f"{len(texts)} pages, {size / 1024:.1f} KB average")
+    for profile, fields in PROFILES.items():
+        mismatches = sum(1 for text in texts if previous(text, fields) != scanned(text, fields))
+        before = measure(previous, texts, fields, args.rounds)
+        after = measure(scanned, texts, fields, args.rounds)
+        print(
+            f"{profile:9s} previous: {before * 1e6:8.1f} us/page  "
+            f"scanner: {after * 1e6:8.1f} us/page ({before / after:.1f}x)  {mismatches} mismatches"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,507 @@
+"""
+Local stand-in for a game world
+Mounted as a transport adapter on the WebWrapper session, it generates deterministic game pages for
+any amount of villages so a bot cycle can be measured without hitting a live world
+"""
+
+import json
+import random
+import re
+import threading
+from collections import Counter
+from urllib.parse import urlparse, parse_qsl
+
+from requests.adapters import BaseAdapter
+
+from core.recorder import build_response
+
+BUILDINGS = {
+    "main": 10, "barracks": 5, "stable": 3, "garage": 1, "snob": 0, "smith": 5, "place": 1,
+    "statue": 0, "market": 5, "wood": 15, "stone": 15, "iron": 15, "farm": 12, "storage": 12,
+    "hide": 3, "wall": 5,
+}
+
+UNITS = ["spear", "sword", "axe", "archer", "spy", "light", "marcher", "heavy", "ram", "catapult", "knight", "snob"]
+
+UNIT_COSTS = {
+    "spear": (50, 30, 10, 1), "sword": (30, 30, 70, 1), "axe": (60, 30, 40, 1), "archer": (100, 30, 60, 1),
+    "spy": (50, 50, 20, 2), "light": (125, 100, 250, 4), "marcher": (250, 100, 150, 5),
+    "heavy": (200, 150, 600, 6), "ram": (300, 200, 200, 5), "catapult": (320, 400, 100, 8),
+}
+
+UNIT_BUILDING = {
+    "spear": "barracks", "sword": "barracks", "axe": "barracks", "archer": "barracks", "spy": "stable",
+    "light": "stable", "marcher": "stable", "heavy": "stable", "ram": "garage", "catapult": "garage",
+}
+
+
+class FakeWorld(BaseAdapter):
+    """
+    Transport adapter that answers game requests with generated pages
+    Every village gets its own (seeded) resources, buildings and units, the world does not change
+    """
+
+    def __init__(self, villages=1, seed=0, premium=True, padding=30000):
+        super().__init__()
+        self.premium = premium
+        self.padding = self.filler(padding)
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        rnd = random.Random(seed)
+        self.villages = {}
+        for index in range(villages):
+            # ids far outside of the range of real worlds, the bot writes per village cache files
+            village_id = str(900000000 + index)
+            self.villages[village_id] = {
+                "id": int(village_id),
+                "name": f"Bench {index + 1:03d}",
+                "x": 500 + index % 10,
+                "y": 500 + index // 10,
+                "points": rnd.randint(2000, 9000),
+                "wood": rnd.randint(1000, 40000),
+                "stone": rnd.randint(1000, 40000),
+                "iron": rnd.randint(1000, 40000),
+                "storage_max": 40000,
+                "pop": rnd.randint(500, 2000),
+                "pop_max": 2400,
+                "buildings": {k: str(v) for k, v in BUILDINGS.items()},
+                "units": {u: rnd.randint(0, 200) for u in UNITS if u not in ("knight", "snob")},
+            }
+
+    @staticmethod
+    def filler(size):
+        """
+        Static markup (menus, scripts, ...) that makes pages as large as real game pages
+        """
+        block = '<tr><td class="menu-item"><a href="/game.php?screen=overview">Overview</a></td></tr>\n'
+        return "<table id=\"menu_row\">" + block * max(0, size // len(block)) + "</table>"
+
+    @staticmethod
+    def amount(value):
+        """
+        Resource amounts use a grey dot as thousands separator
+        """
+        return f"{value:,}".replace(",", '<span class="grey">.</span>')
+
+    def village_for(self, params):
+        village_id = params.get("village")
+        if village_id not in self.villages:
+            village_id = next(iter(self.villages))
+        return self.villages[village_id]
+
+    def game_data(self, village, screen):
+        state = {
+            "player": {
+                "id": "1", "name": "bench", "incomings": "0", "supports": "0",
+                "villages": str(len(self.villages)), "premium": self.premium,
+            },
+            "village": {k: v for k, v in village.items() if k != "units"},
+            "screen": screen,
+            "link_base_pure": f"/game.php?village={village['id']}&screen=",
+            "csrf": "benchcsrf",
+        }
+        return state
+
+    def page(self, village, screen, body):
+        return (
+            '<!DOCTYPE html><html><head><meta content="benchcsrf" name="csrf-token"/></head><body>'
+            '<a id="logout" href="/game.php?screen=&amp;action=logout&h=benchcsrf">Logout</a>'
+            f'{self.padding}<div id="content_value">{body}</div>'
+            f'<script>TribalWars.updateGameData({json.dumps(self.game_data(village, screen))});</script>'
+            '</body></html>'
+        )
+
+    def send(self, request, **kwargs):
+        params = dict(parse_qsl(urlparse(request.url).query, keep_blank_values=True))
+        screen = params.get("screen", "overview")
+        with self.lock:
+            self.requests[screen] += 1
+        if screen == "api":
+            return build_response(request, 200, json.dumps(self.api(params)).encode("utf-8"),
+                                  {"content-type": "application/json"})
+        village = self.village_for(params)
+        handler = getattr(self, f"screen_{screen}", None)
+        body = handler(village, params) if handler else ""
+        if body is None:
+            body = ""
+        content = self.page(village, screen, body).encode("utf-8")
+        return build_response(request, 200, content, {"content-type": "text/html; charset=UTF-8"})
+
+    def api(self, params):
+        village = self.village_for(params)
+        return {"game_data": self.game_data(village, "api"), "response": {}}
+
+    def screen_overview_villages(self, village, params):
+        mode = params.get("mode", "prod")
+        if mode == "prod":
+            rows = []
+            for vil in self.villages.values():
+                rows.append(
+                    '<tr class="nowrap row_a">'
+                    f'<td>\n<span class="quickedit-vn" data-id="{vil["id"]}"><a href="/game.php?village={vil["id"]}&amp;screen=overview">'
+                    f'<span class="quickedit-label">{vil["name"]} ({vil["x"]}|{vil["y"]}) K55</span></a></span></td>'
+                    f'<td>{vil["points"]:,}</td>'.replace(",", ".") +
+                    f'<td><span class="res wood">{self.amount(vil["wood"])}</span> '
+                    f'<span class="res stone">{self.amount(vil["stone"])}</span> '
+                    f'<span class="res iron">{self.amount(vil["iron"])}</span></td>'
+                    f'<td>{vil["storage_max"]}</td><td>{vil["pop"]}/{vil["pop_max"]}</td></tr>'
+                )
+            return (
+                '<table id="production_table"><tr><th>Village</th><th>Points</th><th>Resources</th>'
+                f'<th>Storage</th><th>Farm</th></tr>{"".join(rows)}</table>'
+            )
+        if not self.premium:
+            return "<p>Premium account required</p>"
+        if mode == "units":
+            header = "".join(f'<th><img src="/graphic/unit/unit_{u}.png"></th>' for u in UNITS[:10])
+            bodies = []
+            for vil in self.villages.values():
+                rows = []
+                for row in range(5):
+                    cells = "".join(
+                        f'<td class="unit-item">{vil["units"][u] if row in (0, 1, 4) else 0}</td>' for u in UNITS[:10]
+                    )
+                    rows.append(f"<tr><td>row</td>{cells}</tr>")
+                bodies.append(
+                    f'<tbody class="row_marker"><tr><td><span class="quickedit-vn" data-id="{vil["id"]}"></span></td></tr>'
+                    f'{"".join(rows)}</tbody>'
+                )
+            return f'<table id="units_table"><thead><tr><th>Village</th>{header}</tr></thead>{"".join(bodies)}</table>'
+        if mode == "buildings":
+            rows = []
+            for vil in self.villages.values():
+                cells = "".join(
+                    f'<td class="upgrade_building b_{b}">{level}</td>' for b, level in vil["buildings"].items()
+                )
+                rows.append(f'<tr><td><span class="quickedit-vn" data-id="{vil["id"]}"></span></td>{cells}</tr>')
+            return f'<table id="buildings_table">{"".join(rows)}</table>'
+        if mode == "incomings":
+            return '<table id="incomings_table"><tr><th>Command</th></tr></table>'
+        return ""
+
+    def screen_main(self, village, params):
+        buildings = {}
+        for index, (building, level) in enumerate(village["buildings"].items()):
+            buildings[building] = {
+                "id": building, "level": level, "level_next": int(level) + 1, "max_level": 30,
+                "wood": 500 + index * 10, "stone": 500, "iron": 400, "pop": 5,
+                "can_build": True, "build_time": 600,
+            }
+        return (
+            '<table id="build_queue"></table>'
+            f'<script>BuildingMain.buildings = {json.dumps(buildings)};</script>'
+        )
+
+    def screen_place(self, village, params):
+        if params.get("mode") == "units":
+            return self.place_units(village)
+        if params.get("try") == "confirm":
+            return self.place_confirm(village)
+        return self.place_form(village)
+
+    def place_units(self, village):
+        """
+        Units in and outside of the village, rows of the other villages start with a village anchor
+        """
+        def cells(units):
+            return "".join(
+                f"<td class='unit-item unit-item-{u}{' hidden' if not amount else ''}'>{amount}</td>"
+                for u, amount in units.items()
+            )
+
+        def anchor(other):
+            return (
+                f'<td><span class="village_anchor contexted" data-player="1" data-id="{other["id"]}">'
+                f'<a href="#">{other["name"]} ({other["x"]}|{other["y"]}) K55</a></span></td>'
+            )
+
+        others = [other for other in self.villages.values() if other is not village]
+        support = "".join(f"<tr>{anchor(other)}{cells(other['units'])}</tr>" for other in others)
+        away = "".join(
+            f"<tr>{anchor(other)}{cells({u: amount // 4 for u, amount in village['units'].items()})}</tr>"
+            for other in others
+        )
+        return (
+            '<table id="units_home"><tr><th>Village</th></tr>'
+            f"<tr><td>From this village</td>{cells(village['units'])}</tr>{support}</table>"
+            f'<table id="units_away"><tr><th>Village</th></tr>{away}</table>'
+        )
+
+    def place_form(self, village):
+        """
+        The rally point command form, with the search form and unit links the real screen has around it
+        """
+        units = "".join(
+            f'<td><a href="#" class="unit_link" data-unit="{u}"><img src="/graphic/unit/unit_{u}.png"></a>'
+            f'<input id="unit_input_{u}" name="{u}" type="text" style="width: 40px" tabindex="1" value="" '
+            f'class="unitsInput" data-all-count="{amount}"><a href="#" id="units_entry_all_{u}">({amount})</a></td>'
+            for u, amount in village["units"].items()
+        )
+        return (
+            '<form id="village_search" action="/game.php?screen=overview_villages" method="post">'
+            '<input type="text" name="search" placeholder="Village"><input type="submit" value="Search"></form>'
+            f'<form id="command-data-form" action="/game.php?village={village["id"]}&amp;screen=place&amp;try=confirm"'
+            ' method="post"><input type="hidden" name="benchf0a1" value="c0ffee42">'
+            f'<input type="hidden" name="template_id" value=""><input type="hidden" name="source_village" '
+            f'value="{village["id"]}"><table id="command-units"><tr>{units}</tr></table>'
+            '<input type="text" name="input" value="" placeholder="123|456" class="target-input-field">'
+            '<input id="target_attack" class="attack btn btn-attack" name="attack" type="submit" value="Attack">'
+            '<input id="target_support" class="support btn btn-support" name="support" type="submit" value="Support">'
+            '</form>'
+        )
+
+    def place_confirm(self, village):
+        """
+        The confirmation screen, the cb input has no value attribute
+        """
+        units = "".join(
+            f'<input type="hidden" name="{u}" value="{min(amount, 5)}">' for u, amount in village["units"].items()
+        )
+        return (
+            '<span class="relative_time" data-duration="1200">0:20:00</span>'
+            f'<form id="command-data-form" action="/game.php?village={village["id"]}&amp;screen=place&amp;'
+            'action=command&amp;h=benchcsrf" method="post"><input type="hidden" name="attack" value="true">'
+            '<input type="hidden" name="ch" value="5f1e:9a7c&amp;1"><input type="hidden" name="cb">'
+            f'<input type="hidden" name="x" value="{village["x"] + 3}"><input type="hidden" name="y" value="{village["y"]}">'
+            f'<input type="hidden" name="source_village" value="{village["id"]}">{units}'
+            '<input type="checkbox" name="save_default_attack_building" value="1">'
+            '<input id="troop_confirm_submit" class="btn btn-attack" type="submit" value="Send attack"></form>'
+        )
+
+    def screen_train(self, village, params, building):
+        units = {}
+        for unit, (wood, stone, iron, pop) in UNIT_COSTS.items():
+            if UNIT_BUILDING[unit] != building:
+                continue
+            units[unit] = {
+                "wood": wood, "stone": stone, "iron": iron, "pop": pop,
+                "build_time": 300, "requirements_met": True,
+            }
+        # the game writes this object with unquoted keys
+        literal = re.sub(r'"(\w+)":', r'\1:', json.dumps(units))
+        return f"<script>unit_managers.units = {literal};</script>"
+
+    def screen_barracks(self, village, params):
+        return self.screen_train(village, params, "barracks")
+
+    def screen_stable(self, village, params):
+        return self.screen_train(village, params, "stable")
+
+    def screen_garage(self, village, params):
+        return self.screen_train(village, params, "garage")
+
+    def train_queue(self, village, building, orders=3):
+        """
+        A recruit screen with orders still in the queue
+        """
+        cancel = "".join(
+            f'<tr class="sortable_row"><td>{index + 1} units</td><td><a class="btn btn-cancel" href="#" '
+            f'onclick="TrainOverview.cancelOrder({village["id"] * 10 + index}); return false">Cancel</a></td></tr>'
+            for index in range(orders)
+        )
+        return f'<table id="trainqueue_wrap_{building}">{cancel}</table>' + self.screen_train(village, {}, building)
+
+    def quests(self, village):
+        """
+        Quest and reward data as the game embeds it in every screen (and the quest popup)
+        """
+        quests = {
+            str(1000 + index): {"goals_completed": index % 2, "goals_total": 1, "title": f"Quest {index}"}
+            for index in range(12)
+        }
+        rewards = [
+            {"id": index, "status": "unlocked" if index % 3 == 0 else "locked", "reward": {"wood": 100, "stone": 100}}
+            for index in range(6)
+        ]
+        return (
+            f"<script>Quests.setQuestData({json.dumps(quests)});</script>"
+            f"<script>RewardSystem.setRewards( {json.dumps(rewards)}, 1);</script>"
+        )
+
+    def scavenge(self, village):
+        """
+        The scavenge screen keeps its options in a village object
+        """
+        options = {
+            str(index): {"is_locked": index > 2, "scavenging_squad": None, "unlock_time": None}
+            for index in range(1, 5)
+        }
+        data = {"village_id": village["id"], "unit_counts_home": village["units"], "options": options}
+        return f"<script>\n\tvar village = {json.dumps(data)};\n</script>"
+
+    def flags(self, village):
+        """
+        The flag screen, flag counts per type and level
+        """
+        counts = {str(flag): {str(level): (flag * level) % 4 for level in range(1, 10)} for flag in range(1, 9)}
+        return (
+            f'<div id="current_flag"><img src="/graphic/flags/small/1_2.png"><p>Resource production</p></div>'
+            f"<script>FlagsScreen.setFlagCounts({json.dumps(counts)});</script>"
+        )
+
+    def premium_exchange(self, village):
+        """
+        The premium exchange market screen
+        """
+        data = {
+            "stock": {"wood": 8000, "stone": 7000, "iron": 9000},
+            "capacity": {"wood": 20000, "stone": 20000, "iron": 20000},
+            "tax": {"buy": 0, "sell": 0.1},
+            "constants": {"resource_base_price": 0.017, "resource_price_elasticity": 0.0034, "stock_size_modifier": 20000},
+            "duration": 7200, "merchants": 12,
+        }
+        return f"<script>PremiumExchange.receiveData({json.dumps(data)});</script>"
+
+    def screen_smith(self, village, params):
+        techs = {"available": {
+            unit: {"level": "1", "level_highest": 3, "can_research": False, "wood": 100, "stone": 100, "iron": 100}
+            for unit in UNIT_COSTS
+        }}
+        return f"<script>BuildingSmith.techs = {json.dumps(techs)};</script>"
+
+    def screen_report(self, village, params):
+        if params.get("view"):
+            return self.report_view(village, params["view"])
+        return '<table id="report_list"><tr><th>Subject</th></tr></table>'
+
+    def report_list(self, village, reports=12):
+        """
+        A filled report list, the cycle uses the empty one so no report cache is written
+        """
+        rows = "".join(
+            f'<tr><td><input name="id_{report_id}" type="checkbox"><span class="quickedit" data-id="{report_id}">'
+            f'<a href="/game.php?village={village["id"]}&amp;screen=report&amp;view={report_id}" '
+            f'class="report-link" data-id="{report_id}"><span class="quickedit-label">Bench attacks</span></a>'
+            f'</span></td><td class="nowrap">01.02.24 10:{index:02d}:00</td></tr>'
+            for index, report_id in enumerate(range(village["id"] * 100, village["id"] * 100 + reports))
+        )
+        return f'<table id="report_list"><tr><th>Subject</th><th>Received</th></tr>{rows}</table>'
+
+    def report_view(self, village, report_id):
+        """
+        An attack report on a barbarian village, with scouted resources and buildings
+        """
+        rnd = random.Random(f"{village['id']}:{report_id}")
+        sent = {u: rnd.randint(0, 50) for u in UNITS}
+        lost = {u: rnd.randint(0, amount // 5) for u, amount in sent.items()}
+        defence = {u: rnd.randint(0, 10) for u in UNITS}
+
+        def unit_table(table_id, rows):
+            header = "".join(
+                f'<td width="35"><a href="#" class="unit_link" data-unit="{u}">'
+                f'<img src="/graphic/unit/unit_{u}.png"></a></td>' for u in UNITS
+            )
+            body = "".join(
+                f"<tr><td>{label}</td>" + "".join(
+                    f'<td style="text-align:center" data-unit-count="{units[u]}" '
+                    f'class="unit-item unit-item-{u}{"" if units[u] else " hidden"}">{units[u]}</td>' for u in UNITS
+                ) + "</tr>"
+                for label, units in rows
+            )
+            return f'<table id="{table_id}" class="vis"><tr class="center"><td></td>{header}</tr>{body}</table>'
+
+        def resources(values):
+            return " ".join(
+                f'<span class="nowrap"><span class="icon header {r}" title=""> </span>{self.amount(amount)}</span>'
+                for r, amount in values.items()
+            )
+
+        buildings = json.dumps([
+            {"id": b, "name": b.title(), "level": str(rnd.randint(0, int(level)))}
+            for b, level in village["buildings"].items()
+        ]).replace('"', "&quot;")
+        target = 800000000 + rnd.randint(0, 5000)
+        return (
+            '<table class="report_ReportAttack vis"><tr><td>Sent</td>'
+            f'<td>{rnd.randint(1, 28):02d}.02.24 {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:'
+            f'{rnd.randint(0, 59):02d}<span class="small grey">:{rnd.randint(0, 999):03d}</span></td></tr></table>'
+            '<table id="attack_info_att" width="100%"><tr><th>Attacker:</th>'
+            f'<th><a href="#">bench</a></th></tr><tr><td>Origin:</td><td><span class="village_anchor contexted" '
+            f'data-player="1" data-id="{village["id"]}"><a href="#">{village["name"]}</a></span></td></tr>'
+            f'<tr><td colspan="2">{unit_table("attack_info_att_units", (("Quantity:", sent), ("Losses:", lost)))}'
+            '</td></tr></table>'
+            '<table id="attack_info_def" width="100%"><tr><th>Defender:</th><th>---</th></tr>'
+            f'<tr><td>Destination:</td><td><span class="village_anchor contexted" data-player="0" data-id="{target}">'
+            f'<a href="#">Barbarian village</a></span></td></tr>'
+            f'<tr><td colspan="2">{unit_table("attack_info_def_units", (("Quantity:", defence), ("Losses:", defence)))}'
+            '</td></tr></table>'
+            '<table id="attack_results"><tr><th>Haul:</th><td>'
+            f'{resources({r: rnd.randint(0, 2000) for r in ("wood", "stone", "iron")})}</td></tr></table>'
+            '<table id="attack_spy_resources"><tr><th>Resources scouted:</th><td>'
+            f'{resources({r: rnd.randint(0, 20000) for r in ("wood", "stone", "iron")})}</td></tr></table>'
+            f'<input id="attack_spy_building_data" type="hidden" value="{buildings}">'
+            f'<table id="attack_spy_away">{unit_table("attack_spy_away_units", (("Outside:", defence),))}</table>'
+        )
+
+    def screen_market(self, village, params):
+        mode = params.get("mode", "own_offer")
+        rnd = random.Random(village["id"])
+        if mode == "other_offer":
+            offers = []
+            for index in range(10):
+                offered, wanted = rnd.sample(["wood", "stone", "iron"], 2)
+                amount = rnd.randint(1, 10) * 500
+                offers.append(
+                    "<!-- insert the offer -->\n\n    <tr>"
+                    f'<td><span class="icon header {offered}" title=""></span>{self.amount(amount)}</td>'
+                    f'<td><span class="icon header {wanted}" title=""></span>{self.amount(amount // 2 + 250)}</td>'
+                    f'<td><a href="#">Player {index}</a></td><td>{rnd.randint(1, 4)}:00:00</td>'
+                    f'<td><span class="icon header ratio" title=""></span>{rnd.randint(50, 150) / 100}</td>'
+                    '<td><form action="#" method="post"><input type="text" name="count" value="1">'
+                    f'<input type="hidden" name="id" value="{7000 + index}"></form></td></tr>'
+                )
+            return (
+                '<table class="vis"><tr><th>Aankomend: <span class="icon header wood" title=""></span>'
+                f'{self.amount(rnd.randint(100, 3000))} </th></tr>\n</table>'
+                f'<table id="market_offers" class="vis"><tr><th>Offer</th><th>For</th></tr>{"".join(offers)}</table>'
+            )
+        if mode == "all_own_offer":
+            rows = "".join(
+                f'<tr class="offer_container"><td><input type="checkbox" name="id_{6000 + index}" '
+                f'data-id="{6000 + index}" data-village="{village["id"]}"></td><td>1.000</td></tr>'
+                for index in range(3)
+            )
+            return f'<table class="vis">{rows}</table>'
+        return (
+            '<table class="vis"><tr><th>Merchants:</th><td>'
+            f'<span id="market_merchant_available_count">{rnd.randint(0, 20)}</span>/20</td></tr></table>'
+        )
+
+    def screen_snob(self, village, params):
+        storage = {"wood": 28000, "stone": 30000, "iron": 25000}
+        return (
+            '<table class="vis"><tr><th colspan="3">Noblemen</th></tr><tr><td>'
+            '<a href="#" class="unit_link" data-unit="snob"><img src="/graphic/unit/unit_snob.png"></a></td>'
+            '<td class="nowrap">\n 2 x</td><td>Storage</td></tr></table>'
+            '<table class="vis"><tr><th>Can be recruited</th><th>0</th></tr>\n</table><br />'
+            f"<script>train.storage_item = {{wood: {storage['wood']}, stone: {storage['stone']}, "
+            f"iron: {storage['iron']}, 'id': 'storage'}};</script>"
+        )
+
+    def screen_map(self, village, params):
+        return "<script>TWMap.sectorPrefech = [];</script>"
+
+    def map_sectors(self, village, sectors=4):
+        """
+        A map with barbarian villages around the village, the cycle uses the empty one so no map cache is written
+        """
+        rnd = random.Random(village["id"])
+        tiles = []
+        for sector in range(sectors):
+            x, y = village["x"] - 10 + sector % 2 * 20, village["y"] - 10 + sector // 2 * 20
+            columns = {}
+            for lon in range(20):
+                cells = {}
+                for lat in rnd.sample(range(1, 20), 4):
+                    vid = str(800000000 + rnd.randint(0, 99999))
+                    cells[str(lat)] = [
+                        vid, 1, "Barbarian village", self.amount(rnd.randint(26, 3000)).replace(
+                            '<span class="grey">.</span>', "."
+                        ), "0", "100", None, None, None, None, None, "0"
+                    ]
+                columns[str(lon)] = cells
+            tiles.append({"x": x, "y": y, "data": {"x": x, "y": y, "villages": columns}})
+        return f"<script>TWMap.sectorPrefech = {json.dumps(tiles)};</script>"
+
+    def close(self):
+        pass
@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of the rally point form extraction (Extractor.attack_form)
+Every attack, support and snipe reads the place form and the confirmation form,
+compares the previous input regex with the form tokenizer per attack (both pages)
+
+Usage:
+    python -m benchmarks.forms
+    python -m benchmarks.forms --archive cache/bench_10.jsonl.gz
+    python -m benchmarks.forms --rounds 50 --repeats 31
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from benchmarks.fakeserver import FakeWorld
+from core.extractors import Extractor
+
+
+def load_attacks(archive=None, villages=10):
+    """
+    (place page, confirm page) pairs from a recorded archive, or generated by the fake world
+    """
+    if archive:
+        with gzip.open(archive, "rt", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        place = [
+            base64.b64decode(e["content"]).decode("utf-8", errors="replace")
+            for e in entries if "screen=place" in e["url"] and "mode=" not in e["url"]
+        ]
+        confirm = [text for text in place if "try=confirm" not in text and "action=command" in text]
+        place = [text for text in place if text not in confirm]
+        return list(zip(place, confirm))
+    world = FakeWorld(villages=villages)
+    return [
+        (
+            world.page(village, "place", world.place_form(village)),
+            world.page(village, "place", world.place_confirm(village)),
+        )
+        for village in world.villages.values()
+    ]
+
+
+def previous(text):
+    """
+    The input regex the tokenizer replaced
+    """
+    return dict(re.findall(r'(?s)<input.+?name="(.+?)".+?value="(.*?)"', text))
+
+
+def per_attack(func, attacks, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for place, confirm in attacks:
+            func(place)
+            func(confirm)
+    return (time.perf_counter() - start) / (rounds * len(attacks))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attack form extraction micro-benchmark")
+    parser.add_argument("--archive", help="recorded archive with rally point pages")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=21, help="interleaved runs, the median is reported")
+    args = parser.parse_args()
+
+    attacks = load_attacks(args.archive)
+    if not attacks:
+        print("No rally point pages found")
+        return
+    place, confirm = attacks[0]
+    for name, text in (("place", place), ("confirm", confirm)):
+        before, after = previous(text), Extractor.attack_form(text)
+        print(f"{name} form: {len(after)} fields")
+        for key in sorted(set(before) | set(after)):
+            if before.get(key) != after.get(key):
+                print(f"  {key!r}: previous={before.get(key)!r} tokenizer={after.get(key)!r}")
+    # interleaved so a noisy machine slows both down, not only the one that runs second
+    befores, afters = [], []
+    for _ in range(args.repeats):
+        befores.append(per_attack(previous, attacks, args.rounds))
+        afters.append(per_attack(Extractor.attack_form, attacks, args.rounds))
+    before, after = statistics.median(befores), statistics.median(afters)
+    print(f"{len(attacks)} attacks, {sum(len(p) + len(c) for p, c in attacks) / len(attacks) / 1024:.1f} KB per attack")
+    print(f"previous:  {before * 1e6:8.1f} us/attack (median of {args.repeats}, min {min(befores) * 1e6:.1f})")
+    print(f"tokenizer: {after * 1e6:8.1f} us/attack (median of {args.repeats}, min {min(afters) * 1e6:.1f}, "
+          f"{before / after:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark of the overview_villages production table parser
+Compares the streaming parser with the previous BeautifulSoup tree (requires beautifulsoup4),
+reports time and peak memory (tracemalloc) per page
+
+Usage:
+    python -m benchmarks.overview
+    python -m benchmarks.overview --villages 10 300 1000
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from benchmarks.fakeserver import FakeWorld
+from pages.overview import Farm, OverviewPage, Storage, Village
+
+try:
+    from bs4 import BeautifulSoup
+
+    HAS_BS4 = True
+except ImportError:
+    HAS_BS4 = False
+
+
+def overview_page(villages):
+    world = FakeWorld(villages=villages)
+    village = next(iter(world.villages.values()))
+    return world.page(village, "overview_villages", world.screen_overview_villages(village, {}))
+
+
+def previous(text):
+    """
+    The BeautifulSoup implementation the streaming parser replaced
+    """
+    soup = BeautifulSoup(text, "html.parser")
+    production_table = soup.find("table", id="production_table")
+    villages = {}
+    for row in production_table.find_all("tr"):
+        if row.find_all("td"):
+            cells = row.find_all("td")
+            idx_offset = 1 if len(cells[0].contents) == 0 else 0
+            village_id = cells[idx_offset].contents[1].attrs["data-id"]
+            name, coordinates, continent = OverviewPage._extract_name_cords_continent(cells[idx_offset].text.strip())
+            storage = Storage(cells[2 + idx_offset].text.strip(), cells[3 + idx_offset].text.strip())
+            farm = Farm(cells[4 + idx_offset].text.strip())
+            villages[village_id] = Village(
+                village_id, name, coordinates, continent, cells[1 + idx_offset].text.strip(), storage, farm
+            )
+    return villages
+
+
+def current(text):
+    return {village.village_id: village for village in OverviewPage.iter_villages(text)}
+
+
+def measure(func, text, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(text)
+    elapsed = (time.perf_counter() - start) / rounds
+    tracemalloc.start()
+    func(text)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def summary(villages):
+    return {
+        village_id: (
+            village.village_name, str(village.coordinates), village.continent, village.points,
+            vars(village.storage), vars(village.farm)
+        )
+        for village_id, village in villages.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Production table parser benchmark")
+    parser.add_argument("--villages", type=int, nargs="+", default=[10, 300, 1000])
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'villages':>8} {'KB':>8} {'parser':>10} {'ms':>9} {'peak KB':>9}")
+    for villages in args.villages:
+        text = overview_page(villages)
+        parsers = [("streaming", current)]
+        if HAS_BS4:
+            parsers.insert(0, ("bs4", previous))
+            if summary(previous(text)) != summary(current(text)):
+                print(f"{villages:>8} parsers disagree")
+        for name, func in parsers:
+            elapsed, peak = measure(func, text, args.rounds)
+            print(f"{villages:>8} {len(text) / 1024:8.1f} {name:>10} {elapsed * 1000:9.2f} {peak / 1024:9.1f}")
+
+
+if __name__ == "__main__":
+    main()
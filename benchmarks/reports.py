@@ -0,0 +1,128 @@
+"""
+Micro-benchmark of the farm target checks of the report manager (safe_to_engage, has_resources_left)
+Compares the previous scan over all known reports for every farm with the destination index,
+the previous scan is timed on a sample of the farms and scaled to all of them
+
+Usage:
+    python -m benchmarks.reports
+    python -m benchmarks.reports --reports 50000 --farms 2000 --sample 50
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from game.reports import ReportManager
+
+
+def generate(amount, farms, seed=1):
+    """
+    Report id -> report entry like the report cache holds them, ids increase with the report time
+    """
+    rng = random.Random(seed)
+    targets = [str(100000 + i) for i in range(farms)]
+    start = 1700000000
+    reports = {}
+    for number in range(amount):
+        report_id = str(50000000 + number)
+        dest = rng.choice(targets)
+        sent = {"light": rng.randint(5, 50), "spy": rng.choice([0, 1])}
+        sent = {k: v for k, v in sent.items() if v}
+        roll = rng.random()
+        losses = {}
+        if roll < 0.05:
+            losses = dict(sent)
+        elif roll < 0.15:
+            losses = {"light": 1}
+        extra = {"when": start + number * 60, "units_sent": sent, "units_losses": losses}
+        if rng.random() < 0.2:
+            report_type = "scout"
+            extra["defence_units"] = {}
+            extra["defence_losses"] = {}
+            extra["resources"] = {"wood": str(rng.randint(0, 2000)), "stone": "10", "iron": "0"}
+        else:
+            report_type = "attack"
+            extra["loot"] = {"wood": str(rng.randint(0, 500)), "stone": "10", "iron": "0"}
+        reports[report_id] = {"type": report_type, "origin": "1", "dest": dest, "losses": losses, "extra": extra}
+    return targets, reports
+
+
+def previous_has_resources_left(manager, vid):
+    """
+    The scan the destination index replaced
+    """
+    possible_reports = []
+    for repid in manager.last_reports:
+        entry = manager.last_reports[repid]
+        if vid == entry["dest"] and entry["extra"].get("when", None):
+            possible_reports.append(entry)
+    if len(possible_reports) == 0:
+        return False, {}
+    entry = max(possible_reports, key=lambda attack: datetime.fromtimestamp(int(attack["extra"]["when"])))
+    if entry["extra"].get("resources", None):
+        return True, entry["extra"]["resources"]
+    return False, {}
+
+
+def previous_safe_to_engage(manager, vid):
+    """
+    The scan the destination index replaced, over the reports newest first like the index
+    """
+    for repid in reversed(manager.last_reports):
+        entry = manager.last_reports[repid]
+        if vid == entry["dest"]:
+            verdict = ReportManager.engage_verdict(entry)
+            if verdict is not None:
+                return verdict
+    return -1
+
+
+def measure(func, targets):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [func(vid) for vid in targets]
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report manager farm check micro-benchmark")
+    parser.add_argument("--reports", type=int, default=50000)
+    parser.add_argument("--farms", type=int, default=2000)
+    parser.add_argument("--sample", type=int, default=50, help="farms the previous scan is timed on")
+    args = parser.parse_args()
+
+    targets, reports = generate(args.reports, args.farms)
+    manager = ReportManager()
+    manager.logger = logging.getLogger("Reports")
+    manager.last_reports = reports
+    start = time.perf_counter()
+    manager.index_reports()
+    build = time.perf_counter() - start
+    print(f"{args.reports} reports, {args.farms} farms, index built in {build * 1000:.1f} ms")
+
+    sample = targets[:args.sample]
+    print(f"{'check':20s} {'previous s':>11} {'indexed s':>10} {'cached s':>9}")
+    for name, previous, indexed in (
+            ("has_resources_left", previous_has_resources_left, manager.has_resources_left),
+            ("safe_to_engage", previous_safe_to_engage, manager.safe_to_engage),
+    ):
+        expected, before = measure(lambda vid: previous(manager, vid), sample)
+        results, after = measure(indexed, targets)
+        # a second farming pass without new reports
+        _, cached = measure(indexed, targets)
+        if results[:len(sample)] != expected:
+            print(f"{name:20s} results differ")
+        before *= len(targets) / len(sample)
+        print(f"{name:20s} {before:11.2f} {after:10.4f} {cached:9.4f} ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
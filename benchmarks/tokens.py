@@ -0,0 +1,92 @@
+"""
+Micro-benchmark of the per-response token extraction (WebWrapper.post_process)
+Compares the precompiled, bounded search with the previous whole-page regex searches
+
+Usage:
+    python -m benchmarks.tokens
+    python -m benchmarks.tokens --archive cache/bench_10.jsonl.gz
+"""
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from requests import PreparedRequest
+
+from benchmarks.fakeserver import FakeWorld
+from core import tokens
+from core.recorder import build_response
+
+
+def load_pages(archive=None, villages=10):
+    """
+    Responses from a recorded archive, or generated by the fake world
+    """
+    request = PreparedRequest()
+    request.prepare(method="GET", url="https://bench.tribalwars.local/game.php")
+    if archive:
+        with gzip.open(archive, "rt", encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        return [
+            build_response(request, e["status"], base64.b64decode(e["content"]), e["headers"])
+            for e in entries
+        ]
+    world = FakeWorld(villages=villages)
+    pages = []
+    for village in world.villages.values():
+        for screen in ["overview", "main", "barracks", "smith", "report", "place", "map"]:
+            body = getattr(world, f"screen_{screen}", lambda v, p: "")(village, {"mode": "units"})
+            content = world.page(village, screen, body or "").encode("utf-8")
+            pages.append(build_response(request, 200, content, {"content-type": "text/html; charset=UTF-8"}))
+        api = json.dumps(world.api({"village": str(village["id"])})).encode("utf-8")
+        pages.append(build_response(request, 200, api, {"content-type": "application/json"}))
+    return pages
+
+
+def previous(response):
+    """
+    The token extraction before precompiled patterns (decodes the body twice)
+    """
+    xsrf = re.search('<meta content="(.+?)" name="csrf-token"', response.text)
+    get_h = re.search(r'&h=(\w+)', response.text)
+    return xsrf.group(1) if xsrf else None, get_h.group(1) if get_h else None
+
+
+def current(response):
+    text = response.text
+    return tokens.csrf_token(text) if tokens.is_html(response) else None, tokens.h_token(text)
+
+
+def measure(func, pages, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for page in pages:
+            func(page)
+    return (time.perf_counter() - start) / (rounds * len(pages))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token extraction micro-benchmark")
+    parser.add_argument("--archive", help="recorded archive (benchmarks.cycle --record)")
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    pages = load_pages(args.archive)
+    mismatches = sum(1 for page in pages if previous(page) != current(page))
+    size = sum(len(page.content) for page in pages) / len(pages)
+    before = measure(previous, pages, args.rounds)
+    after = measure(current, pages, args.rounds)
+    print(f"{len(pages)} pages, {size / 1024:.1f} KB average, {mismatches} mismatches")
+    print(f"previous: {before * 1e6:8.1f} us/page")
+    print(f"current:  {after * 1e6:8.1f} us/page ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Micro-benchmark of the rally point units extraction (Extractor.units_in_total)
+Compares the previous whole-page re.sub + findall with reading the unit cells in place,
+the page grows with the amount of villages that support (or are supported by) the village
+
+Usage:
+    python -m benchmarks.units
+    python -m benchmarks.units --villages 10 100 500
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+from benchmarks.fakeserver import FakeWorld
+from core.extractors import Extractor
+
+
+def units_page(villages):
+    world = FakeWorld(villages=villages)
+    village = next(iter(world.villages.values()))
+    return village, world.page(village, "place", world.place_units(village))
+
+
+def previous(text):
+    """
+    The implementation the in place reader replaced, including the summing TroopManager did
+    """
+    text = re.sub(r'(?s)<span class="village_anchor.+?</tr>', '', text)
+    totals = {}
+    for k, v in re.findall(r'(?s)class=\Wunit-item unit-item-([a-z]+)\W.+?(\d+)</td>', text):
+        totals[k] = totals.get(k, 0) + int(v)
+    return totals
+
+
+def measure(func, text, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func(text)
+    return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rally point units extraction micro-benchmark")
+    parser.add_argument("--villages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'villages':>8} {'KB':>8} {'previous us':>12} {'in place us':>12}")
+    for villages in args.villages:
+        village, text = units_page(villages)
+        if previous(text) != Extractor.units_in_total(text):
+            print(f"{villages:>8} results differ")
+        if Extractor.units_in_total(text) != village["units"]:
+            print(f"{villages:>8} totals do not match the village")
+        before = measure(previous, text, args.rounds)
+        after = measure(Extractor.units_in_total, text, args.rounds)
+        print(f"{villages:>8} {len(text) / 1024:8.1f} {before * 1e6:12.1f} {after * 1e6:12.1f} ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Bot protection (captcha) handling
+When the game asks for a captcha every pipeline is parked at its next request until the captcha
+has been solved in the browser and a resume signal arrives, work continues where it stopped
+"""
+
+import logging
+import threading
+import time
+
+from core.filemanager import FileManager
+from core.notification import Notification
+
+# Marker of the forced captcha on a game page
+PROTECTION_MARKER = 'data-bot-protect="forced"'
+
+
+class BotProtection:
+    """
+    Captcha pause state machine: running -> paused -> running
+    Resumes when the resume flag file exists (created by the web manager or manually)
+    """
+    logger = logging.getLogger("BotProtection")
+
+    RUNNING = "running"
+    PAUSED = "paused"
+
+    def __init__(self, status_file="cache/bot_protection.json", resume_flag="cache/resume", poll_interval=5, reporter=None):
+        self.status_file = status_file
+        self.resume_flag = resume_flag
+        self.poll_interval = poll_interval
+        self.reporter = reporter
+        self.state = self.RUNNING
+        self.paused_at = None
+        self.paused_url = None
+        self.pauses = 0
+        self.resumed = threading.Event()
+        self.resumed.set()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def detect(text):
+        """
+        Checks if a page is the bot protection page
+        """
+        return PROTECTION_MARKER in text
+
+    @property
+    def paused(self):
+        return self.state == self.PAUSED
+
+    def pause(self, url=None):
+        """
+        Pauses all pipelines, the notification is only sent once per pause
+        """
+        with self.lock:
+            if self.state == self.PAUSED:
+                return False
+            self.state = self.PAUSED
+            self.paused_at = time.time()
+            self.paused_url = url
+            self.pauses += 1
+            self.resumed.clear()
+        # a flag from an earlier pause does not count
+        FileManager.remove_file(self.resume_flag)
+        self.write_status()
+        self.logger.warning("Bot protection hit! Pausing until the captcha has been solved")
+        if self.reporter:
+            self.reporter.report(
+                0, "TWB_RECAPTCHA", "Pausing bot, resume once the captcha has been solved")
+        Notification.send(
+            "Bot protection hit! Solve the captcha in your browser and press resume in the web manager"
+        )
+        return True
+
+    def resume(self):
+        """
+        Lets all parked pipelines continue
+        """
+        with self.lock:
+            if self.state == self.RUNNING:
+                return False
+            self.state = self.RUNNING
+            paused_for = time.time() - self.paused_at
+            self.paused_at = None
+            self.paused_url = None
+            self.resumed.set()
+        self.write_status()
+        self.logger.info("Resuming after %d seconds of bot protection", paused_for)
+        return True
+
+    def check_resume(self):
+        """
+        Resumes if the resume flag file exists
+        """
+        if FileManager.path_exists(FileManager.get_path(self.resume_flag)):
+            FileManager.remove_file(self.resume_flag)
+            return self.resume()
+        return False
+
+    def wait(self):
+        """
+        Parks the calling pipeline while the bot is paused
+        Returns the time that was waited
+        """
+        if self.resumed.is_set():
+            return 0.0
+        start = time.time()
+        while not self.resumed.wait(self.poll_interval):
+            self.check_resume()
+        return time.time() - start
+
+    def status(self):
+        return {
+            "state": self.state,
+            "paused_at": int(self.paused_at) if self.paused_at else None,
+            "url": self.paused_url,
+            "pauses": self.pauses,
+        }
+
+    def write_status(self):
+        """
+        Shares the state with the web manager
+        """
+        try:
+            FileManager.save_json_file(self.status(), self.status_file)
+        except Exception as e:
+            self.logger.warning("Unable to write bot protection status: %s", str(e))
@@ -0,0 +1,304 @@
+"""
+SQLite store for the farm (attack) and map village caches
+The caches used to be directories with a json file per entry, which made every cache load list and open
+thousands of files. A single database (WAL journal, readers never block the writer) holds one table per cache,
+the entries are stored as json blobs next to a few indexed columns that can be queried without decoding them.
+Existing cache directories are imported once on first use, the files are left in place as a backup
+Writes are buffered (write-behind) and committed in a single transaction when FileManager flushes
+(timer, end of a cycle and exit) or when the buffer is full, reads see the buffered entries
+Single entry reads are served by a bounded LRU cache of the encoded entries, the bot is the only writer
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from core import jsoncodec
+from core.filemanager import FileManager
+from core.lru import LRUCache
+
+# Read cache value of keys that are not in the store
+MISSING = b""
+
+
+def _location(index):
+    def read(entry):
+        location = entry.get("location")
+        return int(location[index]) if location else None
+    return read
+
+
+def _flag(name):
+    return lambda entry: int(bool(entry.get(name)))
+
+
+# Cache table -> indexed columns (name, sql type, read from the entry)
+TABLES = {
+    "attacks": [
+        ("safe", "INTEGER", _flag("safe")),
+        ("high_profile", "INTEGER", _flag("high_profile")),
+        ("low_profile", "INTEGER", _flag("low_profile")),
+        ("last_attack", "INTEGER", lambda entry: entry.get("last_attack")),
+    ],
+    "villages": [
+        ("owner", "TEXT", lambda entry: entry.get("owner")),
+        ("tribe", "TEXT", lambda entry: entry.get("tribe")),
+        ("x", "INTEGER", _location(0)),
+        ("y", "INTEGER", _location(1)),
+    ],
+}
+
+
+class CacheStore:
+    """
+    Key -> json entry tables in a single SQLite database
+    One connection is shared by all threads of the bot, statements are serialized by a lock
+    """
+    logger = logging.getLogger("CacheStore")
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path="cache/cache.db", migrate=True, batch_size=2000, cache_bytes=32 * 1024 * 1024):
+        self.path = path
+        # (table, key) -> encoded entry (or MISSING) of recently used entries
+        self.cache = LRUCache(max_bytes=cache_bytes, name="Cache store")
+        # table -> key -> row of the writes that are not committed yet
+        self.pending = {table: {} for table in TABLES}
+        self.batch_size = batch_size
+        full_path = FileManager.get_path(path)
+        FileManager.create_directory(os.path.dirname(full_path))
+        # autocommit, batches use explicit transactions
+        self.connection = sqlite3.connect(full_path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.lock = threading.RLock()
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.create_tables()
+        if migrate:
+            for table in TABLES:
+                self.migrate(table, f"cache/{table}")
+
+    @classmethod
+    def shared(cls):
+        """
+        The store used by the cache classes, opened on first use
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def use(cls, store):
+        """
+        Replaces the shared store (benchmarks use a temporary database), returns the previous one
+        """
+        with cls._shared_lock:
+            previous, cls._shared = cls._shared, store
+        if previous:
+            previous.flush()
+        return previous
+
+    @classmethod
+    def flush_shared(cls):
+        """
+        Flushes the buffered writes of the shared store, registered with FileManager.flush
+        """
+        store = cls._shared
+        if store:
+            store.flush()
+
+    def create_tables(self):
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        for table, columns in TABLES.items():
+            definitions = "".join(f', "{name}" {sql_type}' for name, sql_type, _ in columns)
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} "
+                f"(key TEXT PRIMARY KEY, data BLOB NOT NULL, updated REAL NOT NULL{definitions})"
+            )
+            self.connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_updated ON {table} (updated)")
+            for name, _, _ in columns:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {table}_{name} ON {table} ("{name}")')
+
+    @staticmethod
+    def row(table, key, entry, updated=None):
+        """
+        Creates the row values of an entry
+        """
+        return (
+            str(key), jsoncodec.dumpb(entry), updated or time.time(),
+            *(read(entry) for _, _, read in TABLES[table])
+        )
+
+    @staticmethod
+    def insert_statement(table):
+        names = "".join(f', "{name}"' for name, _, _ in TABLES[table])
+        marks = ", ?" * len(TABLES[table])
+        return f"INSERT OR REPLACE INTO {table} (key, data, updated{names}) VALUES (?, ?, ?{marks})"
+
+    def get(self, table, key):
+        """
+        Reads a single entry, None if it does not exist
+        """
+        key = str(key)
+        row = self.pending[table].get(key)
+        if row is not None:
+            return jsoncodec.loads(row[1])
+        data = self.cache.get((table, key))
+        if data is None:
+            with self.lock:
+                # a write might have been buffered since the lookup
+                row = self.pending[table].get(key)
+                if row is not None:
+                    return jsoncodec.loads(row[1])
+                row = self.connection.execute(f"SELECT data FROM {table} WHERE key = ?", (key,)).fetchone()
+                data = row[0] if row else MISSING
+                self.cache.put((table, key), data, size=len(data) or 1)
+        return jsoncodec.loads(data) if data else None
+
+    def set(self, table, key, entry):
+        """
+        Creates or replaces an entry, the write is committed with the next flush
+        """
+        row = self.row(table, key, entry)
+        with self.lock:
+            self.pending[table][row[0]] = row
+            self.cache.put((table, row[0]), row[1], size=len(row[1]))
+            full = sum(len(rows) for rows in self.pending.values()) >= self.batch_size
+        if full:
+            self.flush()
+        else:
+            FileManager.schedule_flush()
+
+    def set_many(self, table, entries):
+        """
+        Creates or replaces (key, entry) pairs in a single transaction
+        """
+        rows = [self.row(table, key, entry) for key, entry in entries]
+        with self.lock:
+            for row in rows:
+                self.pending[table][row[0]] = row
+                self.cache.put((table, row[0]), row[1], size=len(row[1]))
+        self.flush()
+
+    def flush(self):
+        """
+        Commits the buffered writes of all tables in a single transaction
+        """
+        with self.lock:
+            if not any(self.pending.values()):
+                return
+            self.connection.execute("BEGIN")
+            try:
+                for table, rows in self.pending.items():
+                    if rows:
+                        self.connection.executemany(self.insert_statement(table), rows.values())
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+            self.pending = {table: {} for table in TABLES}
+
+    def grab(self, table, **where):
+        """
+        Reads all entries (key -> entry) of a table with a single query
+        Keyword arguments filter on the indexed columns: grab("villages", owner="1234")
+        """
+        query = f"SELECT key, data FROM {table}"
+        columns = [name for name, _, _ in TABLES[table]]
+        for name in where:
+            if name not in columns:
+                raise KeyError(f"{name} is not an indexed column of {table}")
+        if where:
+            query += " WHERE " + " AND ".join(f'"{name}" = ?' for name in where)
+        self.flush()
+        with self.lock:
+            rows = self.connection.execute(query, tuple(where.values())).fetchall()
+        return {key: jsoncodec.loads(data) for key, data in rows}
+
+    def count(self, table):
+        self.flush()
+        with self.lock:
+            return self.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def delete(self, table, keys):
+        self.flush()
+        with self.lock:
+            self.connection.executemany(f"DELETE FROM {table} WHERE key = ?", [(str(key),) for key in keys])
+            for key in keys:
+                self.cache.pop((table, str(key)))
+
+    def trim(self, table, keep):
+        """
+        Removes the oldest entries (by last update) until at most keep entries are left
+        Returns the amount of removed entries
+        """
+        self.flush()
+        with self.lock:
+            self.cache.clear()
+            return self.connection.execute(
+                f"DELETE FROM {table} WHERE key NOT IN "
+                f"(SELECT key FROM {table} ORDER BY updated DESC, rowid DESC LIMIT ?)",
+                (int(keep),)
+            ).rowcount
+
+    def legacy_rows(self, table):
+        """
+        Reads the (key, encoded entry, last update) rows of a table that is no longer part of the store, oldest first
+        """
+        with self.lock:
+            exists = self.connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+            ).fetchone()
+            if not exists:
+                return []
+            return self.connection.execute(f"SELECT key, data, updated FROM {table} ORDER BY updated, rowid").fetchall()
+
+    def migrate(self, table, directory):
+        """
+        Imports the json files of a cache directory once, the import is recorded in the meta table
+        Files that do not contain valid json are skipped
+        """
+        marker = f"migrated:{table}"
+        with self.lock:
+            if self.connection.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                return 0
+            full_path = FileManager.get_path(directory)
+            rows = []
+            if os.path.isdir(full_path):
+                for name in os.listdir(full_path):
+                    if not name.endswith(".json"):
+                        continue
+                    file_path = os.path.join(full_path, name)
+                    try:
+                        with open(file_path, "rb") as f:
+                            entry = jsoncodec.loads(f.read())
+                        rows.append(self.row(table, name[:-5], entry, updated=os.path.getctime(file_path)))
+                    except (OSError, ValueError, TypeError, AttributeError, IndexError) as e:
+                        self.logger.warning("Skipping broken cache file %s: %s", file_path, e)
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                # another process might have migrated while the files were read
+                if self.connection.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+                    self.connection.execute("ROLLBACK")
+                    return 0
+                # entries that are already stored are newer than the files
+                self.connection.executemany(self.insert_statement(table).replace("OR REPLACE", "OR IGNORE"), rows)
+                self.connection.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (marker, str(int(time.time()))))
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+        if rows:
+            self.logger.info("Imported %d %s cache files from %s, the directory can be removed", len(rows), table, directory)
+        return len(rows)
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+
+FileManager.register_flush(CacheStore.flush_shared)
@@ -39,3 +39,25 @@ class UnsupportedPythonVersion(Exception):
     You are trying run the bot with an outdated python version
     Updating to Python3 fixes this issue
     """
+
+
+class RequestFailedException(Exception):
+    """
+    A request to the game server failed, transient errors are retried before this is raised
+    """
+
+    def __init__(self, endpoint, reason, transient=False):
+        super().__init__(f"{endpoint}: {reason}")
+        self.endpoint = endpoint
+        self.reason = reason
+        self.transient = transient
+
+
+class CircuitOpenException(RequestFailedException):
+    """
+    Requests to an endpoint are not sent because it failed too often in a short time
+    """
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(endpoint, f"circuit open for {int(retry_after)} more seconds", transient=True)
+        self.retry_after = retry_after
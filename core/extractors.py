@@ -2,62 +2,452 @@
 File used for data extraction
 """
 
-import json
+import dataclasses
+import html
 import re
+from typing import Any, Callable, Dict, List, Optional
+
+from core import jsliteral, jsoncodec
+
+
+def _json(value):
+    return jsoncodec.loads(value, strict=False)
+
+
+UNIT_ITEM_PATTERN = re.compile(r'class=\'unit-item unit-item-(.*?)\'[^>]*>(\d+)</td>')
+TOOLTIP_PATTERN = re.compile(r'\s*tooltip\s*')
+
+
+def _units_home(value):
+    # Filter units with quantity = 0, also for the Paladin,
+    # the name would be "knight tooltip", so we had to remove that.
+    return [
+        (TOOLTIP_PATTERN.sub('', unit_name), int(unit_quantity))
+        for unit_name, unit_quantity in UNIT_ITEM_PATTERN.findall(value)
+        if int(unit_quantity) > 0
+    ]
+
+
+@dataclasses.dataclass
+class FieldExtractor:
+    """A precompiled extractor for a single field of a page."""
+
+    name: str
+    # the pattern has exactly one capturing group, the value of the field
+    pattern: str
+    # literal text every match starts with, located with str.find before the pattern is tried
+    anchor: str
+    convert: Callable[[str], Any] = str
+    # collect every match instead of the first one
+    multiple: bool = False
+    default: Any = None
+
+    def __post_init__(self):
+        self.compiled = re.compile(self.pattern)
+
+    def find(self, text: str) -> Optional[str]:
+        """Returns the raw value of the first match."""
+        position = text.find(self.anchor)
+        while position != -1:
+            match = self.compiled.match(text, position)
+            if match:
+                return match.group(1)
+            position = text.find(self.anchor, position + 1)
+        return None
+
+    def extract(self, text: str) -> Any:
+        """Runs the extractor over a page."""
+        if self.multiple:
+            if self.anchor not in text:
+                return self.finish([])
+            return self.finish(self.compiled.findall(text))
+        return self.finish(self.find(text))
+
+    def finish(self, raw: Any) -> Any:
+        """Converts the raw match(es) into the field value."""
+        if self.multiple:
+            return self.convert(raw)
+        if raw is None:
+            return self.default() if callable(self.default) else self.default
+        return self.convert(raw)
+
+
+class LiteralExtractor(FieldExtractor):
+    """An extractor for a JavaScript object literal assigned or passed right after the anchor."""
+
+    def __init__(self, name: str, anchor: str, default: Any = None):
+        super().__init__(name, re.escape(anchor), anchor, lambda value: value, default=default)
+
+    def find(self, text: str) -> Any:
+        position = text.find(self.anchor)
+        if position == -1:
+            return None
+        return jsliteral.parse(text, position + len(self.anchor))[0]
+
+
+EXTRACTORS: Dict[str, FieldExtractor] = {}
+
+
+def register(extractor: FieldExtractor) -> FieldExtractor:
+    """Adds an extractor to the registry, it can then be used by the PageScanner."""
+    EXTRACTORS[extractor.name] = extractor
+    return extractor
+
+
+register(FieldExtractor(
+    "game_state", r'TribalWars\.updateGameData\((.+?)\);', "TribalWars.updateGameData(", _json
+))
+register(FieldExtractor("village_data", r'var village = (.+);', "var village = ", _json))
+register(FieldExtractor(
+    "building_data", r'(?s:BuildingMain\.buildings = (\{.+?\});)', "BuildingMain.buildings = ", _json
+))
+register(FieldExtractor("quests", r'Quests\.setQuestData\((\{.+?\})\);', "Quests.setQuestData(", _json))
+register(FieldExtractor(
+    "quest_rewards", r'RewardSystem\.setRewards\(\s*(\[\{.+?\}\]),', "RewardSystem.setRewards(", _json, default=list
+))
+register(FieldExtractor(
+    "map_data", r'(?s:TWMap\.sectorPrefech = (\[(?:.+?)\]);)', "TWMap.sectorPrefech = ", _json
+))
+register(FieldExtractor(
+    "smith_data", r'(?s:BuildingSmith\.techs = (\{.+?\});)', "BuildingSmith.techs = ", _json
+))
+register(FieldExtractor(
+    "premium_data", r'(?s:PremiumExchange\.receiveData\((.+?)\);)', "PremiumExchange.receiveData(", _json
+))
+register(LiteralExtractor("recruit_data", "unit_managers.units = "))
+register(LiteralExtractor("storage_item", "train.storage_item = "))
+register(LiteralExtractor("flag_counts", "FlagsScreen.setFlagCounts("))
+register(FieldExtractor(
+    "units_in_village", r'(?s:<table id="units_home".*?</tr>(.*?)</tr>)', '<table id="units_home"',
+    _units_home, default=list
+))
+register(FieldExtractor(
+    "active_building_queue", r'(?s:<table id="build_queue"(.+?)</table>)', '<table id="build_queue"',
+    lambda value: value.count('<a class="btn btn-cancel"'), default=0
+))
+register(FieldExtractor(
+    "active_recruit_queue", r'TrainOverview\.cancelOrder\((\d+)\)', "TrainOverview.cancelOrder(",
+    list, multiple=True
+))
+register(FieldExtractor(
+    "village_ids", r'<span class="quickedit-vn" data-id="(\w+)"', '<span class="quickedit-vn" data-id="',
+    lambda value: list(dict.fromkeys(value)), multiple=True
+))
+register(FieldExtractor(
+    "report_ids", r'class="report-link" data-id="(\d+)"', 'class="report-link" data-id="', list, multiple=True
+))
+register(FieldExtractor(
+    "attack_duration", r'<span class="relative_time" data-duration="(\d+)"',
+    '<span class="relative_time" data-duration="', int, default=0
+))
+
+
+@dataclasses.dataclass
+class PageData:
+    """Typed result bundle of a page scan, fields that were not requested keep their default."""
+
+    game_state: Optional[dict] = None
+    village_data: Optional[dict] = None
+    building_data: Optional[dict] = None
+    quests: Optional[dict] = None
+    quest_rewards: List[dict] = dataclasses.field(default_factory=list)
+    map_data: Optional[list] = None
+    smith_data: Optional[dict] = None
+    premium_data: Optional[dict] = None
+    recruit_data: Optional[dict] = None
+    storage_item: Optional[dict] = None
+    flag_counts: Optional[dict] = None
+    units_in_village: List[tuple] = dataclasses.field(default_factory=list)
+    active_building_queue: int = 0
+    active_recruit_queue: List[str] = dataclasses.field(default_factory=list)
+    village_ids: List[str] = dataclasses.field(default_factory=list)
+    report_ids: List[str] = dataclasses.field(default_factory=list)
+    attack_duration: int = 0
+
+
+class PageScanner:
+    """
+    Extracts a fixed set of fields from a page and returns them as a PageData bundle
+    Every field is located by its literal anchor (a C level str.find) and the pattern is only matched there,
+    one alternation of all patterns was measured to be an order of magnitude slower (benchmarks/extractors.py)
+    """
+    _compiled: Dict[tuple, "PageScanner"] = {}
+
+    def __init__(self, fields):
+        self.fields = [EXTRACTORS[name] for name in fields]
+
+    @classmethod
+    def get(cls, fields) -> "PageScanner":
+        """Returns the (cached) scanner of a set of fields."""
+        key = tuple(fields)
+        scanner = cls._compiled.get(key)
+        if not scanner:
+            scanner = cls._compiled[key] = PageScanner(key)
+        return scanner
+
+    def scan(self, text: str) -> PageData:
+        """Scans a page and returns the requested fields."""
+        result = PageData()
+        for extractor in self.fields:
+            setattr(result, extractor.name, extractor.extract(text))
+        return result
+
+
+class ParsedPage:
+    """
+    Response wrapper returned by the WebWrapper
+    The body is decoded once and every extractor runs at most once per page, all other attributes are
+    those of the response. Extracted data is shared by everyone reading the page, treat it as read-only
+    """
+
+    def __init__(self, response):
+        self.response = response
+        self._text = None
+        self._fields = {}
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.response.text
+        return self._text
+
+    def __contains__(self, needle) -> bool:
+        return needle in self.text
+
+    def __bool__(self) -> bool:
+        return bool(self.response)
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set on the page itself
+        if name == "response":
+            raise AttributeError(name)
+        return getattr(self.response, name)
+
+    def field(self, name: str) -> Any:
+        """Returns the (memoized) value of a registered extractor."""
+        if name not in self._fields:
+            self._fields[name] = EXTRACTORS[name].extract(self.text)
+        return self._fields[name]
+
+    def scan(self, *fields) -> PageData:
+        """Returns the requested fields as a PageData bundle."""
+        result = PageData()
+        for name in fields:
+            setattr(result, name, self.field(name))
+        return result
+
+    def json(self, **kwargs):
+        return jsoncodec.loads(self.text, **kwargs)
+
+
+class PartialPage(ParsedPage):
+    """
+    A page of which only the start was read (WebWrapper.peek_url)
+    complete tells if the text holds the whole body, the requested markers are decided either way
+    """
+
+    def __init__(self, response, text, complete=False, found=None):
+        super().__init__(response)
+        self._text = text
+        self.complete = complete
+        self.found = found or {}
+
+    def __contains__(self, needle) -> bool:
+        if needle in self.found:
+            return self.found[needle]
+        return needle in self.text
+
+
+def _field(res, name):
+    if isinstance(res, ParsedPage):
+        return res.field(name)
+    if type(res) != str:
+        res = res.text
+    return EXTRACTORS[name].extract(res)
+
+
+# the rally point and its confirmation screen post the same form
+COMMAND_FORM_ID = "command-data-form"
+
+# hidden inputs written the way the game writes most of its form fields are read in the same match,
+# every other input tag yields its attributes
+INPUT_TAG_PATTERN = re.compile(r'<input\b(?: type="hidden" name="([^"&]+)" value="([^"&]*)">|([^>]*)>)')
+# used when an attribute is not written as name="value"
+ATTRIBUTE_PATTERNS = {
+    name: re.compile(r'''\s%s\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))''' % name, re.I)
+    for name in ("name", "value", "type")
+}
+ATTRIBUTE_KEYS = {name: f' {name}="' for name in ATTRIBUTE_PATTERNS}
+FLAG_ATTRIBUTE_PATTERN = re.compile(r'''\s(checked|disabled)(?=[\s/=]|$)''', re.I)
+# inputs a browser never submits
+UNSUBMITTED_TYPES = ("button", "reset", "image", "file")
+
+
+def _attribute(attributes, name):
+    """
+    Reads a single attribute of a tag, str.find covers the way the game writes its markup
+    """
+    key = ATTRIBUTE_KEYS[name]
+    position = attributes.find(key)
+    if position != -1:
+        position += len(key)
+        return attributes[position:attributes.find('"', position)]
+    if name not in attributes and name not in attributes.lower():
+        return None
+    match = ATTRIBUTE_PATTERNS[name].search(attributes)
+    if not match:
+        return None
+    double, single, bare = match.groups()
+    return double if double is not None else single if single is not None else bare
+
+
+def form_fields(text: str, form_id: Optional[str] = None) -> Dict[str, str]:
+    """
+    Tokenizes the <input> tags of a form in a single pass, returns the fields a browser would submit in order
+    Unchecked checkboxes and radios are left out, every submit button is kept (the caller picks one).
+    Without form_id, or when the form is not on the page, every input on the page is used
+    """
+    start = 0
+    end = len(text)
+    if form_id:
+        # the command form sits at the end of the game content, searching backwards skips the menus
+        marker = text.rfind(f'id="{form_id}"')
+        if marker != -1:
+            start = max(text.rfind("<form", 0, marker), 0)
+            end = text.find("</form>", marker)
+            if end == -1:
+                end = len(text)
+    fields = {}
+    # the attribute reads are inlined, this loop runs for every input of every attack
+    for name, value, attributes in INPUT_TAG_PATTERN.findall(text, start, end):
+        if name:
+            fields[name] = value
+            continue
+        position = attributes.find(' name="')
+        if position != -1:
+            position += 7
+            name = attributes[position:attributes.find('"', position)]
+        else:
+            name = _attribute(attributes, "name")
+        if not name:
+            continue
+        position = attributes.find(' type="')
+        if position != -1:
+            position += 7
+            input_type = attributes[position:attributes.find('"', position)].lower()
+        else:
+            input_type = (_attribute(attributes, "type") or "text").lower()
+        if input_type in UNSUBMITTED_TYPES:
+            continue
+        flags = ()
+        if "checked" in attributes or "disabled" in attributes:
+            flags = {flag.lower() for flag in FLAG_ATTRIBUTE_PATTERN.findall(attributes)}
+            if "disabled" in flags:
+                continue
+        position = attributes.find(' value="')
+        if position != -1:
+            position += 8
+            value = attributes[position:attributes.find('"', position)]
+        else:
+            value = _attribute(attributes, "value")
+        if input_type == "checkbox" or input_type == "radio":
+            if "checked" not in flags:
+                continue
+            if value is None:
+                value = "on"
+        elif value is None:
+            value = ""
+        fields[html.unescape(name) if "&" in name else name] = html.unescape(value) if "&" in value else value
+    return fields
+
+
+UNIT_CELL_MARKER = "unit-item unit-item-"
+# the rest of a row that starts with a village anchor lists units of another village
+VILLAGE_ANCHOR_MARKER = '<span class="village_anchor'
+UNIT_NAME_PATTERN = re.compile(r'[a-z]+')
+TAG_PATTERN = re.compile(r'<[^>]*>')
+
+
+def unit_counts(text: str, start: int = 0, end: Optional[int] = None) -> Dict[str, int]:
+    """
+    Sums the unit-item cells between start and end per unit, reading the cells in place
+    Cells in rows of other villages (after a village anchor) are skipped
+    """
+    if end is None:
+        end = len(text)
+    counts = {}
+    position = start
+    anchor = text.find(VILLAGE_ANCHOR_MARKER, position, end)
+    while True:
+        cell = text.find(UNIT_CELL_MARKER, position, end)
+        if cell == -1:
+            break
+        if anchor != -1 and anchor < cell:
+            position = text.find("</tr>", anchor, end)
+            if position == -1:
+                break
+            anchor = text.find(VILLAGE_ANCHOR_MARKER, position, end)
+            continue
+        cell += len(UNIT_CELL_MARKER)
+        unit = UNIT_NAME_PATTERN.match(text, cell)
+        content = text.find(">", cell, end) + 1
+        position = text.find("</td>", content, end)
+        if not unit or not content or position == -1:
+            break
+        amount = text[content:position]
+        if not amount.isdigit():
+            # thousands separators and wrapping tags
+            amount = "".join(c for c in TAG_PATTERN.sub("", amount) if c.isdigit())
+            if not amount:
+                continue
+        unit = unit.group()
+        counts[unit] = counts.get(unit, 0) + int(amount)
+    return counts
 
 
 class Extractor:
     """
-    Defines various non-compiled regexes for data retrieval
-    TODO: use compiled various for CPU efficiency
+    Defines various compiled regexes for data retrieval
     """
     @staticmethod
-    def village_data(res):
+    def scan(res, *fields) -> PageData:
         """
-        Detects village data on a page
+        Extracts multiple fields from a page in a single pass
         """
+        if isinstance(res, ParsedPage):
+            return res.scan(*fields)
         if type(res) != str:
             res = res.text
-        grabber = re.search(r'var village = (.+);', res)
-        if grabber:
-            data = grabber.group(1)
-            return json.loads(data, strict=False)
+        return PageScanner.get(fields).scan(res)
+
+    @staticmethod
+    def village_data(res):
+        """
+        Detects village data on a page
+        """
+        return _field(res, "village_data")
 
     @staticmethod
     def game_state(res):
         """
         Detects the game state that is available on most pages
         """
-        if type(res) != str:
-            res = res.text
-        grabber = re.search(r'TribalWars\.updateGameData\((.+?)\);', res)
-        if grabber:
-            data = grabber.group(1)
-            return json.loads(data, strict=False)
+        return _field(res, "game_state")
 
     @staticmethod
     def building_data(res):
         """
         Fetches building data from the main building
         """
-        if type(res) != str:
-            res = res.text
-        dre = re.search(r'(?s)BuildingMain.buildings = (\{.+?\});', res)
-        if dre:
-            return json.loads(dre.group(1), strict=False)
-
-        return None
+        return _field(res, "building_data")
 
     @staticmethod
     def get_quests(res):
         """
         Gets quest data on almost any page
         """
-        if type(res) != str:
-            res = res.text
-        get_quests = re.search(r'Quests.setQuestData\((\{.+?\})\);', res)
-        if get_quests:
-            result = json.loads(get_quests.group(1), strict=False)
+        result = _field(res, "quests")
+        if result:
             for quest in result:
                 data = result[quest]
                 if data['goals_completed'] == data['goals_total']:
@@ -69,15 +459,10 @@ class Extractor:
         """
         Detects if there are rewards available for quests
         """
-        if type(res) != str:
-            res = res.text
-        get_rewards = re.search(r'RewardSystem\.setRewards\(\s*(\[\{.+?\}\]),', res)
         rewards = []
-        if get_rewards:
-            result = json.loads(get_rewards.group(1), strict=False)
-            for reward in result:
-                if reward['status'] == "unlocked":
-                    rewards.append(reward)
+        for reward in _field(res, "quest_rewards"):
+            if reward['status'] == "unlocked":
+                rewards.append(reward)
         # Return all off them
         return rewards
 
@@ -86,151 +471,104 @@ class Extractor:
         """
         Detects other villages on the map page
         """
-        if type(res) != str:
-            res = res.text
-        data = re.search(r'(?s)TWMap.sectorPrefech = (\[(.+?)\]);', res)
-        if data:
-            result = json.loads(data.group(1), strict=False)
-            return result
+        return _field(res, "map_data")
 
     @staticmethod
     def smith_data(res):
         """
         Gets smith data
         """
-        if type(res) != str:
-            res = res.text
-        data = re.search(r'(?s)BuildingSmith.techs = (\{.+?\});', res)
-        if data:
-            result = json.loads(data.group(1), strict=False)
-            return result
-        return None
+        return _field(res, "smith_data")
 
     @staticmethod
     def premium_data(res):
         """
         Detects data on the premium exchange page
         """
-        if type(res) != str:
-            res = res.text
-        data = re.search(r'(?s)PremiumExchange.receiveData\((.+?)\);', res)
-        if data:
-            result = json.loads(data.group(1), strict=False)
-            return result
-        return None
+        return _field(res, "premium_data")
 
     @staticmethod
     def recruit_data(res):
         """
         Fetches recruit data for the current building
         """
-        if type(res) != str:
-            res = res.text
-        data = re.search(r'(?s)unit_managers.units = (\{.+?\});', res)
-        if data:
-            raw = data.group(1)
-            quote_keys_regex = r'([\{\s,])(\w+)(:)'
-            processed = re.sub(quote_keys_regex, r'\1"\2"\3', raw)
-            result = json.loads(processed, strict=False)
-            return result
+        return _field(res, "recruit_data")
+
+    @staticmethod
+    def storage_item(res):
+        """
+        Gets the resources needed for the next snob storage item or coin
+        """
+        return _field(res, "storage_item")
+
+    @staticmethod
+    def flag_counts(res):
+        """
+        Gets the amount of flags per type and level
+        """
+        return _field(res, "flag_counts")
 
     @staticmethod
     def units_in_village(res):
         """
         Detects all units in the village
         """
-        if type(res) != str:
-            res = res.text
-        matches = re.search(r'<table id="units_home".*?</tr>(.*?)</tr>', res, re.DOTALL)
         # We get the start of the table and grab the 2nd row (Where "From this village" troops are located)
-        if matches:
-            table_content = matches.group(1)
-            unit_matches = re.findall(r'class=\'unit-item unit-item-(.*?)\'[^>]*>(\d+)</td>', table_content)
-            # Find all the tuples (name, quantity) under the class "unit-item unit-item-*troop_name*"
-            units = [(re.sub(r'\s*tooltip\s*', '', unit_name), unit_quantity) for unit_name, unit_quantity in
-                     unit_matches if int(unit_quantity) > 0]
-            # Filter units with quantity = 0, also for the Paladin,
-            # the name would be "knight tooltip", so we had to remove that.
-            return units
-        return []
+        return _field(res, "units_in_village")
 
     @staticmethod
     def active_building_queue(res):
         """
         Detects queued building entries
         """
-        if type(res) != str:
-            res = res.text
-        builder = re.search('(?s)<table id="build_queue"(.+?)</table>', res)
-        if not builder:
-            return 0
-
-        return builder.group(1).count('<a class="btn btn-cancel"')
+        return _field(res, "active_building_queue")
 
     @staticmethod
     def active_recruit_queue(res):
         """
         Detects active recruitment entries
         """
-        if type(res) != str:
-            res = res.text
-        builder = re.findall(r'(?s)TrainOverview\.cancelOrder\((\d+)\)', res)
-        return builder
+        return _field(res, "active_recruit_queue")
 
     @staticmethod
     def village_ids_from_overview(res):
         """
         Fetches villages from the overview page
         """
-        if type(res) != str:
-            res = res.text
-        villages = re.findall(r'<span class="quickedit-vn" data-id="(\w+)"', res)
-        return list(set(villages))
+        return _field(res, "village_ids")
 
     @staticmethod
     def units_in_total(res):
         """
-        Gets total amount of units in a village
+        Gets total amount of units in a village (unit -> int)
         """
         if type(res) != str:
             res = res.text
-        # hide units from other villages
-        res = re.sub(r'(?s)<span class="village_anchor.+?</tr>', '', res)
-        data = re.findall(r'(?s)class=\Wunit-item unit-item-([a-z]+)\W.+?(\d+)</td>', res)
-        return data
+        return unit_counts(res)
 
     @staticmethod
-    def attack_form(res):
+    def attack_form(res, form_id=COMMAND_FORM_ID):
         """
         Detects input fiels in the attack form
         ... because there are many :)
         """
         if type(res) != str:
             res = res.text
-        data = re.findall(r'(?s)<input.+?name="(.+?)".+?value="(.*?)"', res)
-        return data
+        return form_fields(res, form_id)
 
     @staticmethod
     def attack_duration(res):
         """
         Detects the duration of an attack
         """
-        if type(res) != str:
-            res = res.text
-        data = re.search(r'<span class="relative_time" data-duration="(\d+)"', res)
-        if data:
-            return int(data.group(1))
-        return 0
+        return _field(res, "attack_duration")
 
     @staticmethod
     def report_table(res):
         """
         Fetches information from a report
         """
-        if type(res) != str:
-            res = res.text
-        data = re.findall(r'(?s)class="report-link" data-id="(\d+)"', res)
-        return data
+        return _field(res, "report_ids")
 
     @staticmethod
     def get_daily_reward(res):
@@ -239,9 +577,12 @@ class Extractor:
         """
         if type(res) != str:
             res = res.text
-        get_daily = re.search(r'DailyBonus.init\((\s+\{.*\}),', res)
-        res = json.loads(get_daily.group(1))
+        get_daily = DAILY_BONUS_PATTERN.search(res)
+        res = jsoncodec.loads(get_daily.group(1))
         reward_count_unlocked = str(res["reward_count_unlocked"])
         if reward_count_unlocked and res["chests"][reward_count_unlocked]["is_collected"]:
             return reward_count_unlocked
         return None
+
+
+DAILY_BONUS_PATTERN = re.compile(r'DailyBonus.init\((\s+\{.*\}),')
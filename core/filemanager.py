@@ -1,11 +1,31 @@
-import json
+import atexit
+import logging
 import os
+import tempfile
+import threading
 
+from core import jsoncodec
 from core.exceptions import InvalidJSONException, FileNotFoundException
+from core.lru import LRUCache
 
 
 class FileManager:
     """Provides methods for file and directory management."""
+    logger = logging.getLogger("FileManager")
+
+    # Write-behind buffer: full path -> encoded json of the latest queued write
+    pending = {}
+    pending_lock = threading.Lock()
+    # Seconds a queued write waits before the timer flushes it
+    flush_interval = 5.0
+    flush_timer = None
+    # Other buffers (the cache store) that are flushed together with the files
+    flush_callbacks = []
+    # Contents of recently read json files: full path -> [content, mtime_ns, size, cycle of the last check]
+    read_cache = LRUCache(max_bytes=32 * 1024 * 1024, name="File cache")
+    # Set by the bot for every cycle, files that were checked during the current cycle are not checked again
+    # None (scripts, the web manager) checks the modification time and size on every read
+    cycle = None
 
     @staticmethod
     def get_root():
@@ -82,30 +102,150 @@ class FileManager:
         """Removes a file if it exists."""
         full_path = os.path.join(FileManager.get_root(), path)
 
+        with FileManager.pending_lock:
+            FileManager.pending.pop(full_path, None)
+        FileManager.read_cache.pop(full_path)
         if FileManager.path_exists(full_path):
             os.remove(full_path)
 
     @staticmethod
     def load_json_file(path, **kwargs):
-        """Loads a JSON file and returns the data. Returns None if the file does not exist."""
+        """Loads a JSON file and returns the data. Returns None if the file does not exist.
+        A write that is still queued is returned instead of the file on disk, unchanged files
+        (same modification time and size) are decoded from the read cache."""
         full_path = os.path.join(FileManager.get_root(), path)
 
-        if not FileManager.path_exists(full_path):
-            return None
+        queued = FileManager.pending.get(full_path)
+        if queued is not None:
+            return jsoncodec.loads(queued, **kwargs)
 
-        with FileManager.__open_file(full_path) as file:
+        def unchanged(entry):
+            if FileManager.cycle is not None and entry[3] == FileManager.cycle:
+                return True
             try:
-                return json.load(file, **kwargs)
-            except json.decoder.JSONDecodeError:
+                stat = os.stat(full_path)
+            except OSError:
+                return False
+            if (entry[1], entry[2]) != (stat.st_mtime_ns, stat.st_size):
+                return False
+            entry[3] = FileManager.cycle
+            return True
+
+        cached = FileManager.read_cache.get(full_path, validate=unchanged)
+        if cached is not None:
+            content = cached[0]
+        else:
+            if not FileManager.path_exists(full_path):
+                return None
+            with FileManager.__open_file(full_path, mode="rb") as file:
+                content = file.read()
+                stat = os.fstat(file.fileno())
+            try:
+                data = jsoncodec.loads(content, **kwargs)
+            except ValueError:
                 raise InvalidJSONException
+            FileManager.read_cache.put(
+                full_path, [content, stat.st_mtime_ns, stat.st_size, FileManager.cycle], size=len(content)
+            )
+            return data
+        try:
+            return jsoncodec.loads(content, **kwargs)
+        except ValueError:
+            raise InvalidJSONException
+
+    @staticmethod
+    def remember(full_path, content):
+        """Stores the content of a file that was just written in the read cache."""
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            FileManager.read_cache.pop(full_path)
+            return
+        FileManager.read_cache.put(
+            full_path, [content, stat.st_mtime_ns, stat.st_size, FileManager.cycle], size=len(content)
+        )
+
+    @staticmethod
+    def new_cycle():
+        """Starts a new bot cycle, cached files are checked for changes again."""
+        FileManager.cycle = (FileManager.cycle or 0) + 1
+
+    @staticmethod
+    def save_json_file(data, path, pretty=False):
+        """Saves data to a JSON file. If the file does not exist, it will be created.
+        Files are written compact (machine caches), pretty is used for files people edit."""
+        full_path = os.path.join(FileManager.get_root(), path)
+        content = jsoncodec.dumpb(data, pretty=pretty)
+
+        with FileManager.pending_lock:
+            # the queued write is older than this one
+            FileManager.pending.pop(full_path, None)
+            FileManager.write_atomic(full_path, content)
+            FileManager.remember(full_path, content)
+
+    @staticmethod
+    def write_atomic(full_path, content):
+        """Writes a file through a temporary file in the same directory that replaces the target,
+        readers never see a half-written file."""
+        directory, name = os.path.split(full_path)
+        try:
+            handle, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+        except OSError:
+            raise FileNotFoundException
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(content)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
     @staticmethod
-    def save_json_file(data, path, **kwargs):
-        """Saves data to a JSON file. If the file does not exist, it will be created."""
+    def queue_json_file(data, path, pretty=False):
+        """Queues a JSON file write, writes to the same file are coalesced until the next flush.
+        The data is encoded right away, later changes to the object are not written."""
         full_path = os.path.join(FileManager.get_root(), path)
+        content = jsoncodec.dumpb(data, pretty=pretty)
+        with FileManager.pending_lock:
+            FileManager.pending[full_path] = content
+        FileManager.schedule_flush()
 
-        with FileManager.__open_file(full_path, mode="w") as file:
-            json.dump(data, file, indent=2, sort_keys=False, **kwargs)
+    @staticmethod
+    def schedule_flush():
+        """Starts the flush timer if it is not running."""
+        with FileManager.pending_lock:
+            if FileManager.flush_timer is not None:
+                return
+            FileManager.flush_timer = threading.Timer(FileManager.flush_interval, FileManager.flush)
+            FileManager.flush_timer.daemon = True
+            FileManager.flush_timer.start()
+
+    @staticmethod
+    def register_flush(callback):
+        """Registers a buffer flush that runs with every flush (timer, end of cycle and exit)."""
+        if callback not in FileManager.flush_callbacks:
+            FileManager.flush_callbacks.append(callback)
+
+    @staticmethod
+    def flush():
+        """Writes all queued files and flushes the registered buffers."""
+        with FileManager.pending_lock:
+            timer, FileManager.flush_timer = FileManager.flush_timer, None
+            if timer is not None and timer is not threading.current_thread():
+                timer.cancel()
+            # written while holding the lock, so a direct write to the same file cannot be overwritten
+            # by an older queued version
+            while FileManager.pending:
+                full_path, content = next(iter(FileManager.pending.items()))
+                del FileManager.pending[full_path]
+                try:
+                    FileManager.write_atomic(full_path, content)
+                    FileManager.remember(full_path, content)
+                except (OSError, FileNotFoundException) as e:
+                    FileManager.logger.error("Unable to write queued file %s: %s", full_path, e)
+        for callback in list(FileManager.flush_callbacks):
+            callback()
 
     @staticmethod
     def copy_file(src_path, dest_path):
@@ -119,3 +259,6 @@ class FileManager:
         with FileManager.__open_file(full_src_path) as src_file:
             with FileManager.__open_file(full_dest_path, mode="w") as dest_file:
                 dest_file.write(src_file.read())
+
+
+atexit.register(FileManager.flush)
@@ -0,0 +1,139 @@
+"""
+Parser for object literals embedded in the game scripts
+Accepts JavaScript syntax JSON does not: unquoted keys, single quoted strings, trailing commas, comments
+and undefined. The literal is tokenized once, only the code between strings is rewritten to JSON, so string
+values are never touched, and the result is decoded by the (C) JSON decoder
+"""
+
+import json
+import re
+
+SKIP_PATTERN = re.compile(r'(?:\s+|//[^\n]*|/\*.*?\*/)*', re.S)
+# strings and comments, everything in between is code
+TOKEN_PATTERN = re.compile(r'''"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|//[^\n]*|/\*.*?\*/''', re.S)
+BRACKET_PATTERN = re.compile(r'[{}\[\]]')
+# split() on the key group returns [code, key, code, key, ...], joining that with quotes quotes every key
+KEY_PATTERN = re.compile(r'(?<=[{,])\s*([A-Za-z_$][\w$]*|\d+)\s*(?=:)')
+TRAILING_COMMA_PATTERN = re.compile(r',(?=\s*[}\]])')
+UNDEFINED_PATTERN = re.compile(r'\bundefined\b')
+JS_ESCAPE_PATTERN = re.compile(r'\\[^"\\/bfnrtu]')
+ESCAPE_PATTERN = re.compile(r'\\(u[0-9a-fA-F]{4}|x[0-9a-fA-F]{2}|\r\n|.)', re.S)
+
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "v": "\v", "0": "\0", "\n": "", "\r\n": ""}
+
+# strings are swapped out while the code is rewritten, the game never sends NUL characters in a script
+SENTINEL = "\x00"
+
+_decoder = json.JSONDecoder(strict=False)
+
+
+def _unescape(match):
+    escape = match.group(1)
+    if len(escape) > 1 and escape[0] in "ux":
+        return chr(int(escape[1:], 16))
+    return ESCAPES.get(escape, escape)
+
+
+def _string(token):
+    """
+    Converts a JavaScript string token into a JSON string token
+    """
+    if token[0] == '"' and not JS_ESCAPE_PATTERN.search(token):
+        return token
+    value = ESCAPE_PATTERN.sub(_unescape, token[1:-1])
+    if any("\ud800" <= c <= "\udfff" for c in value):
+        # surrogate pairs written as two \u escapes
+        value = value.encode("utf-16", "surrogatepass").decode("utf-16")
+    return json.dumps(value)
+
+
+def _close(code, depth):
+    """
+    Tracks the bracket depth over a piece of code, returns (depth, end) where end is the position
+    after the bracket that closes the literal or -1
+    """
+    closing = code.count("}") + code.count("]")
+    if depth > closing:
+        return depth + code.count("{") + code.count("[") - closing, -1
+    for match in BRACKET_PATTERN.finditer(code):
+        depth += 1 if match.group() in "{[" else -1
+        if depth == 0:
+            return 0, match.end()
+    return depth, -1
+
+
+def parse(text, position=0):
+    """
+    Parses the literal that starts at position, returns (value, end position)
+    The text after the literal is ignored, so the literal can be read straight from the page
+    """
+    start = SKIP_PATTERN.match(text, position).end()
+    first = text[start:start + 1]
+    if first == "'":
+        match = TOKEN_PATTERN.match(text, start)
+        if not match:
+            raise ValueError(f"Unterminated JavaScript string at position {start}")
+        return _decoder.decode(_string(match.group())), match.end()
+    if first not in ("{", "["):
+        return _decoder.raw_decode(text, start)
+    codes = []
+    strings = []
+    buffer = []
+    depth = 0
+    position = start
+    for match in TOKEN_PATTERN.finditer(text, start):
+        code = text[position:match.start()]
+        depth, end = _close(code, depth)
+        if end != -1:
+            buffer.append(code[:end])
+            position += end
+            break
+        buffer.append(code)
+        position = match.end()
+        token = match.group()
+        if token[0] == "/":
+            buffer.append(" ")
+            continue
+        codes.append("".join(buffer))
+        buffer = []
+        strings.append(_string(token))
+    else:
+        code = text[position:]
+        depth, end = _close(code, depth)
+        if end == -1:
+            raise ValueError(f"Unterminated JavaScript literal at position {start}")
+        buffer.append(code[:end])
+        position += end
+    codes.append("".join(buffer))
+
+    code = SENTINEL.join(codes)
+    code = '"'.join(KEY_PATTERN.split(code))
+    code = TRAILING_COMMA_PATTERN.sub("", code)
+    code = UNDEFINED_PATTERN.sub("null", code)
+    parts = code.split(SENTINEL)
+    if len(parts) != len(strings) + 1:
+        raise ValueError(f"Unexpected NUL character in the JavaScript literal at position {start}")
+    joined = [None] * (len(parts) + len(strings))
+    joined[0::2] = parts
+    joined[1::2] = strings
+    return _decoder.decode("".join(joined)), position
+
+
+def loads(text):
+    """
+    Parses a string that holds a single literal
+    """
+    value, end = parse(text)
+    if text[end:].strip(" \t\r\n;"):
+        raise ValueError(f"Extra data after the literal at position {end}")
+    return value
+
+
+def find(text, marker):
+    """
+    Parses the literal right after marker, None if the marker is not on the page
+    """
+    position = text.find(marker)
+    if position == -1:
+        return None
+    return parse(text, position + len(marker))[0]
@@ -0,0 +1,51 @@
+"""
+JSON codec used for game data and cache files
+Uses orjson when it is installed (pip install orjson) and the standard library otherwise,
+input orjson does not accept (control characters, huge integers, hooks) always goes through the standard library
+"""
+
+import json
+
+try:
+    import orjson
+
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+def loads(data, strict=True, **kwargs):
+    """
+    Decodes a JSON str or bytes object
+    strict=False allows control characters inside strings, only for the script blobs of game pages
+    """
+    if HAS_ORJSON and not kwargs:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data, strict=strict, **kwargs)
+
+
+def dumpb(data, pretty=False):
+    """
+    Encodes data as UTF-8 JSON bytes, compact unless pretty (2 space indent) is requested
+    """
+    if HAS_ORJSON:
+        option = orjson.OPT_NON_STR_KEYS
+        if pretty:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(data, option=option)
+        except TypeError:
+            pass
+    if pretty:
+        return json.dumps(data, indent=2, sort_keys=False).encode("utf-8")
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(data, pretty=False):
+    """
+    Encodes data as a JSON string
+    """
+    return dumpb(data, pretty=pretty).decode("utf-8")
@@ -0,0 +1,118 @@
+"""
+Bounded least recently used cache
+Used for the json files read by FileManager and the entries of the cache store,
+the size of every entry is given by the caller so the cache can be limited by memory
+"""
+
+import logging
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Key -> value cache limited by the amount of entries and / or the total size of the entries
+    The least recently used entries are evicted first, a limit of 0 disables that limit
+    """
+    logger = logging.getLogger("LRUCache")
+
+    def __init__(self, max_entries=0, max_bytes=0, name="LRUCache"):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.name = name
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None, validate=None):
+        """
+        Gets an entry and marks it as recently used
+        validate is called with the value of a found entry, an entry it rejects is dropped and counts as a miss
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and validate is not None and not validate(entry[0]):
+                del self.entries[key]
+                self.size -= entry[1]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key, default=None):
+        """
+        Gets an entry without counting it or changing the order
+        """
+        entry = self.entries.get(key)
+        return default if entry is None else entry[0]
+
+    def put(self, key, value, size=1):
+        """
+        Adds or replaces an entry, entries larger than the memory limit are not stored
+        """
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            if self.max_bytes and size > self.max_bytes:
+                return
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.entries and (
+                    (self.max_entries and len(self.entries) > self.max_entries)
+                    or (self.max_bytes and self.size > self.max_bytes)
+            ):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+                self.evictions += 1
+
+    def pop(self, key):
+        """
+        Removes an entry if it exists
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def stats(self):
+        """
+        Cache statistics
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+    def log_stats(self):
+        """
+        Writes the cache statistics to the log
+        """
+        stats = self.stats()
+        self.logger.info(
+            "%s: %d entries (%.1f KB), %d hits, %d misses (%.0f%% hit rate), %d evicted",
+            self.name, stats["entries"], stats["bytes"] / 1024, stats["hits"], stats["misses"],
+            stats["hit_rate"] * 100, stats["evictions"]
+        )
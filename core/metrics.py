@@ -0,0 +1,206 @@
+"""
+In-process request metrics
+Latency, size, pacer wait and error counts per screen / ajax action, dumped to cache/metrics.json
+and rendered as Prometheus text by the web manager
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import urlparse, parse_qsl
+
+from core.filemanager import FileManager
+
+# Query parameters that name the action of a request on a screen
+ACTION_PARAMETERS = ["ajaxaction", "ajax", "action", "mode"]
+
+# Latency samples kept per endpoint to calculate percentiles
+RESERVOIR_SIZE = 512
+
+PERCENTILES = [0.5, 0.9, 0.99]
+
+
+def endpoint_name(url):
+    """
+    Creates the metrics label of a game url: screen or screen:action
+    """
+    params = dict(parse_qsl(urlparse(url).query, keep_blank_values=True))
+    name = params.get("screen", "game")
+    for parameter in ACTION_PARAMETERS:
+        if params.get(parameter):
+            return f"{name}:{params[parameter]}"
+    return name
+
+
+def percentile(values, q):
+    """
+    Nearest rank percentile of a sorted list
+    """
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q * (len(values) - 1))))
+    return values[index]
+
+
+class EndpointMetrics:
+    """
+    Counters of a single endpoint, updated while holding the registry lock
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.cached = 0
+        self.latency_total = 0.0
+        self.latencies = deque(maxlen=RESERVOIR_SIZE)
+        self.wire_bytes = 0
+        self.body_bytes = 0
+        self.waited = 0.0
+
+    def as_dict(self):
+        latencies = sorted(self.latencies)
+        output = {
+            "requests": self.requests,
+            "errors": self.errors,
+            "cached": self.cached,
+            "latency_total": round(self.latency_total, 4),
+            "wire_bytes": self.wire_bytes,
+            "body_bytes": self.body_bytes,
+            "waited": round(self.waited, 3),
+        }
+        for q in PERCENTILES:
+            output[f"latency_p{round(q * 100)}"] = round(percentile(latencies, q), 4)
+        return output
+
+
+class RequestMetrics:
+    """
+    Registry of request metrics shared by all pipelines of an account
+    """
+    logger = logging.getLogger("Metrics")
+
+    def __init__(self, path="cache/metrics.json", dump_interval=60):
+        self.path = path
+        self.dump_interval = dump_interval
+        self.endpoints = {}
+        self.started = time.time()
+        self.last_dump = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _get(self, name):
+        entry = self.endpoints.get(name)
+        if not entry:
+            entry = self.endpoints[name] = EndpointMetrics()
+        return entry
+
+    def observe(self, url, latency, response=None, waited=0.0, body=None):
+        """
+        Registers a request that was sent
+        body is the amount of bytes read when the body is streamed (and might not be read completely)
+        """
+        name = endpoint_name(url)
+        if body is None:
+            body = len(response.content) if response is not None else 0
+        wire = body
+        if response is not None and response.headers.get("content-length", "").isdigit():
+            # the (compressed) size on the wire
+            wire = int(response.headers["content-length"])
+        with self.lock:
+            entry = self._get(name)
+            entry.requests += 1
+            entry.latency_total += latency
+            entry.latencies.append(latency)
+            entry.wire_bytes += wire
+            entry.body_bytes += body
+            entry.waited += waited
+            if response is None or response.status_code >= 400:
+                entry.errors += 1
+        self.maybe_dump()
+
+    def observe_body(self, url, body):
+        """
+        Registers the bytes read from a streamed body
+        """
+        with self.lock:
+            self._get(endpoint_name(url)).body_bytes += body
+
+    def observe_cached(self, url):
+        """
+        Registers a request that was answered by the page cache
+        """
+        with self.lock:
+            self._get(endpoint_name(url)).cached += 1
+
+    def snapshot(self):
+        """
+        All metrics as a (json serializable) dict
+        """
+        with self.lock:
+            endpoints = {name: entry.as_dict() for name, entry in self.endpoints.items()}
+        return {
+            "started": int(self.started),
+            "updated": int(time.time()),
+            "endpoints": endpoints,
+        }
+
+    def dump(self):
+        """
+        Writes the metrics to the cache directory
+        """
+        self.last_dump = time.monotonic()
+        try:
+            FileManager.save_json_file(self.snapshot(), self.path)
+        except Exception as e:
+            self.logger.warning("Unable to write metrics: %s", str(e))
+
+    def maybe_dump(self):
+        """
+        Writes the metrics once every dump_interval seconds
+        """
+        if self.dump_interval and self.last_dump + self.dump_interval < time.monotonic():
+            self.dump()
+
+    def log_stats(self, top=5):
+        """
+        Writes the endpoints that took the most time to the log
+        """
+        endpoints = self.snapshot()["endpoints"]
+        ranked = sorted(endpoints.items(), key=lambda item: item[1]["latency_total"], reverse=True)
+        for name, entry in ranked[:top]:
+            self.logger.info(
+                "%s: %d requests, %.1fs total, p50 %.3fs, p99 %.3fs, %d KB",
+                name, entry["requests"], entry["latency_total"], entry["latency_p50"],
+                entry["latency_p99"], entry["body_bytes"] // 1024
+            )
+
+    @staticmethod
+    def to_prometheus(snapshot):
+        """
+        Renders a metrics snapshot in the Prometheus text exposition format
+        """
+        counters = [
+            ("twb_requests_total", "requests", "Requests sent"),
+            ("twb_request_errors_total", "errors", "Failed requests"),
+            ("twb_request_cached_total", "cached", "Requests answered by the page cache"),
+            ("twb_response_wire_bytes_total", "wire_bytes", "Response bytes on the wire"),
+            ("twb_response_body_bytes_total", "body_bytes", "Decompressed response bytes"),
+            ("twb_pacer_wait_seconds_total", "waited", "Time waited for the pacer"),
+        ]
+        endpoints = snapshot.get("endpoints", {})
+        lines = []
+        for metric, key, description in counters:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} counter")
+            for name, entry in sorted(endpoints.items()):
+                lines.append(f'{metric}{{endpoint="{name}"}} {entry.get(key, 0)}')
+        # the percentiles of the latency reservoir, the sum and count cover every request
+        lines.append("# HELP twb_request_latency_seconds Request latency")
+        lines.append("# TYPE twb_request_latency_seconds summary")
+        for name, entry in sorted(endpoints.items()):
+            for q in PERCENTILES:
+                value = entry.get(f"latency_p{round(q * 100)}", 0)
+                lines.append(f'twb_request_latency_seconds{{endpoint="{name}",quantile="{q}"}} {value}')
+            lines.append(f'twb_request_latency_seconds_sum{{endpoint="{name}"}} {entry.get("latency_total", 0)}')
+            lines.append(f'twb_request_latency_seconds_count{{endpoint="{name}"}} {entry.get("requests", 0)}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,221 @@
+"""
+Request pacing, decides how long the bot waits before a request is sent
+All pacers are shared by every pipeline of an account and are thread safe
+"""
+
+import logging
+import random
+import threading
+import time
+
+
+# Relative cost of a request per request class
+DEFAULT_COSTS = {
+    "page": 1.0,
+    "ajax": 0.5,
+    "confirm": 1.0,
+    "command": 1.5,
+}
+
+# Average time between two page requests with a delay factor of 1.0
+BASE_INTERVAL = 5.0
+
+
+class RateHistogram:
+    """
+    Histogram of the realized time between two requests
+    """
+    bounds = [1, 2, 4, 8, 16, 32]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.first = None
+        self.last = None
+
+    def add(self, timestamp):
+        """
+        Registers a request that was sent at timestamp
+        """
+        if self.last is not None:
+            interval = timestamp - self.last
+            index = 0
+            while index < len(self.bounds) and interval >= self.bounds[index]:
+                index += 1
+            self.counts[index] += 1
+        else:
+            self.first = timestamp
+        self.last = timestamp
+        self.total += 1
+
+    def realized_per_minute(self):
+        """
+        Average amount of requests per minute since the first request
+        """
+        if self.total < 2 or self.last == self.first:
+            return 0.0
+        return (self.total - 1) * 60.0 / (self.last - self.first)
+
+    def as_dict(self):
+        """
+        Histogram buckets keyed by their interval range in seconds
+        """
+        output = {}
+        lower = 0
+        for index, upper in enumerate(self.bounds):
+            output[f"{lower}-{upper}s"] = self.counts[index]
+            lower = upper
+        output[f"{lower}s+"] = self.counts[-1]
+        return output
+
+
+class Pacer:
+    """
+    Base pacer, sends requests without waiting
+    """
+    name = "none"
+    logger = logging.getLogger("Pacer")
+
+    def __init__(self, delay=1.0, max_per_minute=0, costs=None):
+        self.delay = delay
+        self.max_per_minute = max_per_minute
+        self.costs = dict(DEFAULT_COSTS)
+        if costs:
+            self.costs.update(costs)
+        # Can be replaced by a virtual clock (benchmarks / replays)
+        self.clock = time.monotonic
+        self.sleep = time.sleep
+        self.histogram = RateHistogram()
+        self.waited = 0.0
+        self.lock = threading.Lock()
+
+    def cost(self, request_class):
+        """
+        Cost of a request class, unknown classes cost as much as a page
+        """
+        return self.costs.get(request_class, self.costs["page"])
+
+    def reserve(self, request_class):
+        """
+        Reserves a send slot and returns the time to wait, the caller holds the lock
+        """
+        return 0.0
+
+    def acquire(self, request_class="page"):
+        """
+        Waits until a request of request_class is allowed to be sent
+        Returns the time that was waited
+        """
+        with self.lock:
+            wait = self.reserve(request_class)
+            self.waited += wait
+            self.histogram.add(self.clock() + wait)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def stats(self):
+        """
+        Pacer statistics
+        """
+        return {
+            "pacer": self.name,
+            "requests": self.histogram.total,
+            "waited": round(self.waited, 2),
+            "realized_per_minute": round(self.histogram.realized_per_minute(), 2),
+            "histogram": self.histogram.as_dict(),
+        }
+
+    def log_stats(self):
+        """
+        Writes the pacer statistics to the log
+        """
+        stats = self.stats()
+        self.logger.info(
+            "%d requests, %.1f requests/minute, %.0f seconds waiting, intervals: %s",
+            stats["requests"], stats["realized_per_minute"], stats["waited"], stats["histogram"]
+        )
+
+
+class FixedDelayPacer(Pacer):
+    """
+    The classic pacer, spaces all requests 3-7 seconds * delay factor apart
+    """
+    name = "fixed"
+
+    def __init__(self, delay=1.0, max_per_minute=0, costs=None):
+        super().__init__(delay=delay, max_per_minute=max_per_minute, costs=costs)
+        self.next_slot = 0.0
+
+    def interval(self):
+        """
+        Time between two requests
+        """
+        if self.max_per_minute:
+            return 60.0 / self.max_per_minute
+        return random.uniform(3 * self.delay, 7 * self.delay)
+
+    def reserve(self, request_class):
+        now = self.clock()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval()
+        return slot - now
+
+
+class TokenBucketPacer(Pacer):
+    """
+    Jittered token bucket
+    Tokens refill at the target rate, short bursts (like ajax calls right after a page load) are
+    sent without the full delay while the average rate never exceeds the target
+    """
+    name = "token_bucket"
+
+    def __init__(self, delay=1.0, max_per_minute=0, costs=None, burst=3.0, jitter=0.25):
+        super().__init__(delay=delay, max_per_minute=max_per_minute, costs=costs)
+        self.burst = burst
+        self.jitter = jitter
+        self.tokens = burst
+        self.updated = None
+
+    def rate(self):
+        """
+        Target rate in tokens per second
+        """
+        if self.max_per_minute:
+            return self.max_per_minute / 60.0
+        return 1.0 / (BASE_INTERVAL * max(self.delay, 0.01))
+
+    def reserve(self, request_class):
+        now = self.clock()
+        rate = self.rate()
+        if self.updated is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        cost = self.cost(request_class)
+        self.tokens -= cost
+        if self.tokens >= 0:
+            # a small human-like gap even when tokens are available
+            return random.uniform(0, self.jitter) * cost
+        wait = -self.tokens / rate
+        return wait * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+
+PACERS = {
+    "none": Pacer,
+    "fixed": FixedDelayPacer,
+    "token_bucket": TokenBucketPacer,
+}
+
+
+def create_pacer(name="token_bucket", **kwargs):
+    """
+    Creates a pacer by its config name
+    """
+    if name not in PACERS:
+        logging.getLogger("Pacer").warning("Unknown pacer %s, using token_bucket", name)
+        name = "token_bucket"
+    pacer = PACERS[name]
+    if pacer is not TokenBucketPacer:
+        kwargs.pop("burst", None)
+        kwargs.pop("jitter", None)
+    return pacer(**kwargs)
@@ -0,0 +1,170 @@
+"""
+Cycle scoped cache for game pages
+Used by the WebWrapper to avoid fetching the same screen multiple times within one village cycle
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlparse, parse_qsl
+
+# Query parameters that make a request change the game state
+STATE_PARAMETERS = ["action", "ajaxaction", "h"]
+
+# Query parameters of requests that are never cached but do not change the game state either
+UNCACHED_PARAMETERS = ["ajax", "intro"]
+
+# Screens that show the same content no matter which village requests them
+GLOBAL_SCREENS = ["report", "overview_villages"]
+
+
+class PageCache:
+    """
+    Response cache keyed by (village, screen)
+    Entries are dropped when a request changes the state of their village
+    """
+    logger = logging.getLogger("PageCache")
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse(url):
+        """
+        Returns the query parameters of a game url
+        """
+        return dict(parse_qsl(urlparse(url).query, keep_blank_values=True))
+
+    @staticmethod
+    def changes_state(url):
+        """
+        Checks if a GET request changes the game state (building, recruiting, quick build etc..)
+        """
+        params = PageCache.parse(url)
+        return any(p in params for p in STATE_PARAMETERS)
+
+    @staticmethod
+    def key(url):
+        """
+        Creates the cache key of a page, None if the page should not be cached
+        """
+        params = PageCache.parse(url)
+        if "screen" not in params or params["screen"] == "api":
+            return None
+        if any(p in params for p in STATE_PARAMETERS + UNCACHED_PARAMETERS):
+            return None
+        village = params.pop("village", None)
+        if params["screen"] in GLOBAL_SCREENS:
+            village = None
+        return village, tuple(sorted(params.items()))
+
+    def get(self, url):
+        """
+        Gets a cached response, None if there is no (fresh) entry
+        """
+        if not self.max_age:
+            return None
+        key = self.key(url)
+        if not key:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] + self.max_age > time.monotonic():
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, url, response):
+        """
+        Stores a response
+        """
+        if not self.max_age:
+            return
+        key = self.key(url)
+        if not key:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic(), response)
+
+    def invalidate(self, url):
+        """
+        Drops every entry of the village the url belongs to and every global entry
+        """
+        village = self.parse(url).get("village", None)
+        with self.lock:
+            for key in list(self.entries):
+                if key[0] == village or key[0] is None or village is None:
+                    self.entries.pop(key, None)
+                    self.invalidations += 1
+
+    def clear(self):
+        """
+        Ends the current cycle
+        """
+        with self.lock:
+            self.entries = {}
+
+    def stats(self):
+        """
+        Cache statistics
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    def log_stats(self):
+        """
+        Writes the cache statistics to the log
+        """
+        self.logger.info(
+            "%d hits, %d misses, %d invalidated entries (%d round-trips avoided)",
+            self.hits, self.misses, self.invalidations, self.hits
+        )
+
+
+class SingleFlight:
+    """
+    Coalesces identical requests that are in flight at the same time
+    The first caller sends the request, everyone else waits for (and shares) its result
+    """
+    logger = logging.getLogger("SingleFlight")
+
+    def __init__(self):
+        self.calls = {}
+        self.shared = 0
+        self.lock = threading.Lock()
+
+    def do(self, key, func):
+        """
+        Runs func once for all concurrent callers with the same key
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+            else:
+                self.shared += 1
+        if not leader:
+            self.logger.debug("Waiting for in-flight request %s", str(key))
+            return future.result()
+        try:
+            result = func()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.calls.pop(key, None)
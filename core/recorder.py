@@ -0,0 +1,167 @@
+"""
+Record and replay of HTTP traffic
+The recorder captures request/response pairs of the WebWrapper session to a compressed archive,
+the replay adapter serves them again so a bot cycle can run offline (benchmarks, debugging)
+"""
+
+import base64
+import gzip
+import json
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+from requests import Response
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Query parameters that change between sessions and are ignored when matching requests
+VOLATILE_PARAMETERS = ["h", "_", "client_time"]
+
+
+def request_key(method, url):
+    """
+    Creates the (method, path + sorted query) key used to match a request with a recording
+    """
+    parsed = urlparse(url)
+    params = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if k not in VOLATILE_PARAMETERS]
+    query = urlencode(sorted(params))
+    return method.upper(), f"{parsed.path}?{query}" if query else parsed.path
+
+
+class Recorder:
+    """
+    Captures every response of a requests session
+    """
+    logger = logging.getLogger("Recorder")
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def attach(self, session):
+        """
+        Starts recording the traffic of a session
+        """
+        session.hooks["response"].append(self.record)
+
+    def detach(self, session):
+        """
+        Stops recording the traffic of a session
+        """
+        if self.record in session.hooks["response"]:
+            session.hooks["response"].remove(self.record)
+
+    def record(self, response, *args, **kwargs):
+        """
+        Response hook, stores the request and the response
+        """
+        request = response.request
+        body = request.body
+        if isinstance(body, bytes):
+            body = body.decode("utf-8", errors="replace")
+        entry = {
+            "ts": time.time(),
+            "method": request.method,
+            "url": request.url,
+            "body": body,
+            "status": response.status_code,
+            "response_url": response.url,
+            "headers": {k: v for k, v in response.headers.items() if k.lower() != "set-cookie"},
+            "content": base64.b64encode(response.content).decode("ascii"),
+            "elapsed": response.elapsed.total_seconds(),
+        }
+        with self.lock:
+            self.entries.append(entry)
+        return response
+
+    def save(self):
+        """
+        Writes the recording to a gzip compressed json-lines archive
+        """
+        with self.lock:
+            entries = list(self.entries)
+        with gzip.open(self.path, "wt", encoding="utf-8") as archive:
+            for entry in entries:
+                archive.write(json.dumps(entry) + "\n")
+        self.logger.info("Recorded %d requests to %s", len(entries), self.path)
+        return len(entries)
+
+
+class ReplayAdapter(BaseAdapter):
+    """
+    Transport adapter that answers requests from a recorded archive
+    Requests with the same key are answered in recorded order, the last answer is repeated when the
+    recording runs out. Requests that were never recorded go to the fallback adapter (or get a 404)
+    """
+    logger = logging.getLogger("Replay")
+
+    def __init__(self, entries=None, fallback=None):
+        super().__init__()
+        self.responses = defaultdict(deque)
+        self.last = {}
+        self.fallback = fallback
+        self.misses = 0
+        self.lock = threading.Lock()
+        for entry in entries or []:
+            self.add(entry)
+
+    @staticmethod
+    def load(path, fallback=None):
+        """
+        Creates a replay adapter from an archive written by the Recorder
+        """
+        with gzip.open(path, "rt", encoding="utf-8") as archive:
+            entries = [json.loads(line) for line in archive if line.strip()]
+        return ReplayAdapter(entries, fallback=fallback)
+
+    def add(self, entry):
+        """
+        Adds a recorded request/response pair
+        """
+        self.responses[request_key(entry["method"], entry["url"])].append(entry)
+
+    def send(self, request, **kwargs):
+        key = request_key(request.method, request.url)
+        with self.lock:
+            queue = self.responses.get(key)
+            if queue:
+                entry = queue.popleft()
+                self.last[key] = entry
+            else:
+                entry = self.last.get(key)
+        if not entry:
+            self.misses += 1
+            self.logger.debug("No recording for %s %s", request.method, request.url)
+            if self.fallback:
+                return self.fallback.send(request, **kwargs)
+            return build_response(request, 404, b"", {})
+        response = build_response(
+            request, entry["status"], base64.b64decode(entry["content"]), entry["headers"]
+        )
+        response.url = entry.get("response_url", request.url)
+        return response
+
+    def close(self):
+        if self.fallback:
+            self.fallback.close()
+
+
+def build_response(request, status, content, headers, url=None):
+    """
+    Builds a requests Response object without a connection
+    """
+    response = Response()
+    response.status_code = status
+    response._content = content
+    response.headers = CaseInsensitiveDict(headers)
+    # content is stored decoded, transport encodings no longer apply
+    response.headers.pop("content-encoding", None)
+    response.encoding = "utf-8"
+    response.url = url or request.url
+    response.request = request
+    response.reason = "OK" if status == 200 else "Replay"
+    return response
@@ -0,0 +1,434 @@
+"""
+Append-only archive for the local reports
+Reports are written once and read in bulk (the report manager loads all of them on start, the farm manager
+every cycle), a log of segment files fits that better than a file or a row per report:
+- records are appended to the active segment, a full segment is sealed and gets an index file
+  (key, sequence, time, offset) so opening the archive does not read the records
+- the entry is stored as compact json, zlib compressed when that makes it smaller
+- retention (report age) and trim (keep the newest n) are applied when reading, the space is
+  reclaimed by a background compaction that rewrites sealed segments with little live data left
+"""
+
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+from core import jsoncodec
+from core.cachestore import CacheStore
+from core.filemanager import FileManager
+
+# crc32 of the rest of the record, sequence, report time, flags, key length, type length, payload length
+RECORD = struct.Struct("<IQqBHHI")
+# sequence, report time, offset, record length, key length, type length
+INDEX = struct.Struct("<QqIIHH")
+COMPRESSED = 1
+# payloads smaller than this are not worth compressing
+COMPRESS_MIN = 128
+META_FILE = "archive.json"
+
+
+class ReportArchive:
+    """
+    Key -> report archive in append-only segment files
+    The index (key -> sequence, time, segment, offset, length, type) is kept in memory
+    """
+    logger = logging.getLogger("ReportArchive")
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, path="cache/report_archive", segment_bytes=4 * 1024 * 1024, compress=True,
+                 readonly=False, migrate=True, compact_ratio=0.5):
+        self.path = FileManager.get_path(path)
+        self.segment_bytes = segment_bytes
+        self.compress = compress
+        self.readonly = readonly
+        # sealed segments with less live data than this part of their size are compacted
+        self.compact_ratio = compact_ratio
+        self.lock = threading.RLock()
+        self.index = {}
+        self.segments = []
+        self.sequence = 0
+        self.active = None
+        self.compaction = None
+        if not readonly:
+            FileManager.create_directory(self.path)
+        self.meta = {"floor": 0, "retention": 0, "migrated": False}
+        if os.path.exists(self.meta_path()):
+            self.meta.update(FileManager.load_json_file(self.meta_path()))
+        self.load()
+        if migrate and not readonly and not self.meta["migrated"]:
+            self.import_legacy()
+
+    @classmethod
+    def shared(cls):
+        """
+        The archive used by the report cache, opened on first use
+        """
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    @classmethod
+    def use(cls, archive):
+        """
+        Replaces the shared archive (benchmarks use a temporary one), returns the previous one
+        """
+        with cls._shared_lock:
+            previous, cls._shared = cls._shared, archive
+            return previous
+
+    def meta_path(self):
+        return os.path.join(self.path, META_FILE)
+
+    def segment_path(self, number, extension="seg"):
+        return os.path.join(self.path, f"{number:08d}.{extension}")
+
+    def save_meta(self):
+        FileManager.save_json_file(self.meta, self.meta_path())
+
+    def load(self):
+        """
+        Builds the in-memory index from the index files of the sealed segments and a scan of the active one
+        """
+        self.index = {}
+        self.sequence = 0
+        names = os.listdir(self.path) if os.path.isdir(self.path) else []
+        self.segments = sorted(int(name[:-4]) for name in names if name.endswith(".seg") and name[:-4].isdigit())
+        for number in self.segments:
+            last = number == self.segments[-1]
+            records = None if last else self.read_index(number)
+            if records is None:
+                records = self.scan(number, repair=last and not self.readonly)
+                if not last and not self.readonly:
+                    self.write_index(number, records)
+            for key, sequence, when, offset, length, report_type in records:
+                self.add(key, (sequence, when, number, offset, length, report_type))
+        if not self.readonly:
+            if not self.segments:
+                self.segments.append(1)
+            self.active = open(self.segment_path(self.segments[-1]), "ab")
+
+    def add(self, key, item):
+        current = self.index.get(key)
+        # copies made by a compaction have the same sequence as the original
+        if current is None or item[0] >= current[0]:
+            self.index[key] = item
+        self.sequence = max(self.sequence, item[0])
+
+    def scan(self, number, repair=False):
+        """
+        Reads the record headers of a segment, a broken record (interrupted write) ends the segment
+        """
+        with open(self.segment_path(number), "rb") as f:
+            data = f.read()
+        view = memoryview(data)
+        records = []
+        position = 0
+        while position + RECORD.size <= len(data):
+            crc, sequence, when, _, key_length, type_length, payload_length = RECORD.unpack_from(data, position)
+            start = position + RECORD.size
+            end = start + key_length + type_length + payload_length
+            if end > len(data) or zlib.crc32(view[position + 4:end]) != crc:
+                break
+            key = data[start:start + key_length].decode("utf-8")
+            report_type = data[start + key_length:start + key_length + type_length].decode("utf-8")
+            records.append((key, sequence, when, position, end - position, report_type))
+            position = end
+        if position < len(data):
+            # readers see the record the bot is writing as incomplete
+            log = self.logger.warning if repair else self.logger.debug
+            log("Segment %d has %d unreadable bytes at the end", number, len(data) - position)
+            if repair:
+                with open(self.segment_path(number), "r+b") as f:
+                    f.truncate(position)
+        return records
+
+    def read_index(self, number):
+        path = self.segment_path(number, "idx")
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        records = []
+        position = 0
+        while position < len(data):
+            sequence, when, offset, length, key_length, type_length = INDEX.unpack_from(data, position)
+            start = position + INDEX.size
+            key = data[start:start + key_length].decode("utf-8")
+            report_type = data[start + key_length:start + key_length + type_length].decode("utf-8")
+            records.append((key, sequence, when, offset, length, report_type))
+            position = start + key_length + type_length
+        return records
+
+    def write_index(self, number, records):
+        parts = []
+        for key, sequence, when, offset, length, report_type in records:
+            key, report_type = key.encode("utf-8"), report_type.encode("utf-8")
+            parts.append(INDEX.pack(sequence, when, offset, length, len(key), len(report_type)) + key + report_type)
+        FileManager.write_atomic(self.segment_path(number, "idx"), b"".join(parts))
+
+    @staticmethod
+    def pack(key, entry, sequence, when, compress):
+        """
+        Encodes a report record
+        """
+        payload = jsoncodec.dumpb(entry)
+        flags = 0
+        if compress and len(payload) >= COMPRESS_MIN:
+            packed = zlib.compress(payload, 6)
+            if len(packed) < len(payload):
+                payload, flags = packed, COMPRESSED
+        key = key.encode("utf-8")
+        report_type = str(entry.get("type") or "").encode("utf-8")
+        body = RECORD.pack(0, sequence, when, flags, len(key), len(report_type), len(payload))[4:]
+        body += key + report_type + payload
+        return struct.pack("<I", zlib.crc32(body)) + body
+
+    @staticmethod
+    def unpack(data, offset=0):
+        """
+        Decodes the entry of a record
+        """
+        _, _, _, flags, key_length, type_length, payload_length = RECORD.unpack_from(data, offset)
+        start = offset + RECORD.size + key_length + type_length
+        payload = data[start:start + payload_length]
+        if flags & COMPRESSED:
+            payload = zlib.decompress(payload)
+        return jsoncodec.loads(payload)
+
+    def append(self, records):
+        """
+        Writes (key, sequence, when, type, record bytes) to the active segment
+        """
+        for key, sequence, when, report_type, record in records:
+            position = self.active.tell()
+            if position and position + len(record) > self.segment_bytes:
+                self.seal()
+                position = 0
+            self.active.write(record)
+            self.add(key, (sequence, when, self.segments[-1], position, len(record), report_type))
+        self.active.flush()
+
+    def seal(self):
+        """
+        Closes the active segment, writes its index and starts a new segment
+        """
+        self.active.close()
+        number = self.segments[-1]
+        self.write_index(number, self.scan(number))
+        self.segments.append(number + 1)
+        self.active = open(self.segment_path(number + 1), "ab")
+
+    def put(self, key, entry, when=None):
+        """
+        Adds or replaces a report
+        """
+        self.put_many([(key, entry, when)])
+
+    def put_many(self, entries):
+        """
+        Adds or replaces (key, entry, report time) reports with a single write
+        """
+        with self.lock:
+            records = []
+            for key, entry, when in entries:
+                self.sequence += 1
+                when = int(when or time.time())
+                record = self.pack(str(key), entry, self.sequence, when, self.compress)
+                records.append((str(key), self.sequence, when, str(entry.get("type") or ""), record))
+            self.append(records)
+
+    def live(self, item, now):
+        if item[0] < self.meta["floor"]:
+            return False
+        return not self.meta["retention"] or item[1] >= now - self.meta["retention"]
+
+    def get(self, key):
+        """
+        Reads a single report, None if it does not exist or expired
+        """
+        with self.lock:
+            item = self.index.get(str(key))
+            if not item or not self.live(item, time.time()):
+                return None
+            with open(self.segment_path(item[2]), "rb") as f:
+                f.seek(item[3])
+                return self.unpack(f.read(item[4]))
+
+    def grab(self, **where):
+        """
+        Reads all live reports (key -> entry, oldest first), every segment is read once
+        Keyword arguments filter on entry fields, type is answered from the index: grab(type="attack")
+        """
+        try:
+            return self._grab(where)
+        except FileNotFoundError:
+            if not self.readonly:
+                raise
+            # a compaction of the bot removed a segment while this (web manager) reader was using it
+            self.load()
+            return self._grab(where)
+
+    def _grab(self, where):
+        now = time.time()
+        where = dict(where)
+        report_type = where.pop("type", None)
+        with self.lock:
+            selected = sorted(
+                (item[2], item[3], item[4], item[0], key) for key, item in self.index.items()
+                if self.live(item, now) and (report_type is None or item[5] == report_type)
+            )
+            entries = []
+            segment, data = None, None
+            for number, offset, length, sequence, key in selected:
+                if number != segment:
+                    with open(self.segment_path(number), "rb") as f:
+                        segment, data = number, f.read()
+                entry = self.unpack(data, offset)
+                if all(entry.get(field) == value for field, value in where.items()):
+                    entries.append((sequence, key, entry))
+        entries.sort(key=lambda item: item[0])
+        return {key: entry for _, key, entry in entries}
+
+    def count(self):
+        now = time.time()
+        with self.lock:
+            return sum(1 for item in self.index.values() if self.live(item, now))
+
+    def drop_expired(self):
+        """
+        Removes the records that are no longer live from the index, returns the amount
+        """
+        now = time.time()
+        expired = [key for key, item in self.index.items() if not self.live(item, now)]
+        for key in expired:
+            del self.index[key]
+        return len(expired)
+
+    def expire(self, max_age):
+        """
+        Sets the retention (seconds, by report time, 0 keeps everything) and drops the older reports
+        Returns the amount of dropped reports
+        """
+        with self.lock:
+            if self.meta["retention"] != int(max_age):
+                self.meta["retention"] = int(max_age)
+                self.save_meta()
+            removed = self.drop_expired()
+        if removed:
+            self.start_compaction()
+        return removed
+
+    def trim(self, keep):
+        """
+        Keeps the newest (by write order) keep reports, returns the amount of dropped reports
+        """
+        with self.lock:
+            self.drop_expired()
+            if len(self.index) <= keep:
+                return 0
+            sequences = sorted((item[0] for item in self.index.values()), reverse=True)
+            self.meta["floor"] = sequences[keep - 1] if keep > 0 else self.sequence + 1
+            self.save_meta()
+            removed = self.drop_expired()
+        self.start_compaction()
+        return removed
+
+    def start_compaction(self):
+        """
+        Compacts the sealed segments in a background thread
+        """
+        if self.readonly:
+            return
+        with self.lock:
+            if self.compaction and self.compaction.is_alive():
+                return
+            self.compaction = threading.Thread(target=self.compact, name="report-compaction", daemon=True)
+            self.compaction.start()
+
+    def compact(self):
+        """
+        Rewrites the live records of sealed segments with little live data to the active segment
+        and removes those segments, the lock is released between segments
+        """
+        with self.lock:
+            now = time.time()
+            live_bytes = {}
+            for item in self.index.values():
+                if self.live(item, now):
+                    live_bytes[item[2]] = live_bytes.get(item[2], 0) + item[4]
+            candidates = [
+                number for number in self.segments[:-1]
+                if live_bytes.get(number, 0) < os.path.getsize(self.segment_path(number)) * self.compact_ratio
+            ]
+        reclaimed = 0
+        for number in candidates:
+            with self.lock:
+                reclaimed += self.rewrite(number, now)
+        if candidates:
+            self.logger.info("Compacted %d segments, reclaimed %.1f KB", len(candidates), reclaimed / 1024)
+
+    def rewrite(self, number, now):
+        """
+        Copies the live records of a sealed segment and removes it, returns the amount of reclaimed bytes
+        """
+        path = self.segment_path(number)
+        with open(path, "rb") as f:
+            data = f.read()
+        records = []
+        for key, item in list(self.index.items()):
+            if item[2] != number:
+                continue
+            if self.live(item, now):
+                records.append((key, item[0], item[1], item[5], data[item[3]:item[3] + item[4]]))
+            else:
+                del self.index[key]
+        records.sort(key=lambda record: record[1])
+        if records:
+            self.append(records)
+        # the index goes first, a segment without one is scanned on the next start
+        FileManager.remove_file(self.segment_path(number, "idx"))
+        FileManager.remove_file(path)
+        self.segments.remove(number)
+        return len(data) - sum(len(record[4]) for record in records)
+
+    def import_legacy(self):
+        """
+        Imports the reports of the previous caches once, the reports table of the cache store
+        or the cache/reports directory (a json file per report)
+        """
+        entries = []
+        for key, data, updated in CacheStore.shared().legacy_rows("reports"):
+            entries.append((key, jsoncodec.loads(data), updated))
+        directory = FileManager.get_path("cache/reports")
+        if not entries and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if not name.endswith(".json"):
+                    continue
+                file_path = os.path.join(directory, name)
+                try:
+                    with open(file_path, "rb") as f:
+                        entries.append((name[:-5], jsoncodec.loads(f.read()), os.path.getctime(file_path)))
+                except (OSError, ValueError) as e:
+                    self.logger.warning("Skipping broken report file %s: %s", file_path, e)
+            entries.sort(key=lambda entry: entry[2])
+        self.put_many([
+            (key, entry, (entry.get("extra") or {}).get("when") or updated)
+            for key, entry, updated in entries if isinstance(entry, dict)
+        ])
+        self.meta["migrated"] = True
+        self.save_meta()
+        if entries:
+            self.logger.info("Imported %d reports into the report archive", len(entries))
+
+    def close(self):
+        if self.compaction:
+            self.compaction.join()
+        with self.lock:
+            if self.active:
+                self.active.close()
+                self.active = None
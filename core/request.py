@@ -4,14 +4,27 @@ Class for using one generic cookie jar, emulating a single tab
 
 import requests
 
+from core import tokens
+from core.botprotection import PROTECTION_MARKER, BotProtection
+from core.exceptions import RequestFailedException
+from core.extractors import ParsedPage, PartialPage
 from core.filemanager import FileManager
-from core.notification import Notification
+from core.metrics import RequestMetrics, endpoint_name
+from core.pacer import create_pacer
+from core.pagecache import PageCache, SingleFlight
+from core.recorder import Recorder, ReplayAdapter
+from core.resilience import RetryPolicy
+from core.transport import create_session
 
+import asyncio
+import codecs
+import functools
 import logging
-import re
+import math
+import threading
 import time
-import random
-from urllib.parse import urljoin, urlencode
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlencode, urlparse
 
 from core.reporter import ReporterObject
 
@@ -28,12 +41,18 @@ class WebWrapper:
     endpoint = None
     logger = logging.getLogger("Requests")
     server = None
-    last_response = None
-    last_h = None
     priority_mode = False
     auth_endpoint = None
     reporter = None
-    delay = 1.0
+
+    # Amount of village pipelines that are allowed to run at the same time
+    concurrency = 1
+
+    # (connect, read) timeout of every request in seconds, without one a stalled connection blocks its pipeline
+    timeout = (10.0, 30.0)
+
+    # peek_url reads the body in chunks of this size
+    peek_chunk_size = 8192
 
     def __init__(self, url, server=None, endpoint=None, reporter_enabled=False, reporter_constr=None):
         """
@@ -44,69 +63,426 @@ class WebWrapper:
         self.server = server
         self.endpoint = endpoint
         self.reporter = ReporterObject(enabled=reporter_enabled, connection_string=reporter_constr)
+        self.executor = None
+        # state of a village pipeline (last response, referer, error) is kept per thread
+        self._local = threading.local()
+        # the session tokens are shared by all pipelines
+        self._token_lock = threading.Lock()
+        self._csrf = None
+        self._h = None
+        self.pacer = create_pacer("token_bucket")
+        self.page_cache = PageCache()
+        self.in_flight = SingleFlight()
+        self.recorder = None
+        self.metrics = RequestMetrics()
+        self.retry = RetryPolicy()
+        self.protection = BotProtection(reporter=self.reporter)
+
+    def __deepcopy__(self, memo):
+        """
+        The wrapper represents the account session, copies of villages keep sharing it
+        """
+        return self
+
+    @property
+    def last_response(self):
+        """
+        The last response seen by the current pipeline (thread)
+        """
+        return getattr(self._local, "response", None)
+
+    @last_response.setter
+    def last_response(self, response):
+        self._local.response = response
+
+    @property
+    def referer(self):
+        """
+        The url of the last page of the current pipeline (thread), sent as Referer
+        """
+        return getattr(self._local, "referer", None)
+
+    @referer.setter
+    def referer(self, url):
+        self._local.referer = url
+
+    @property
+    def csrf_token(self):
+        """
+        The session csrf token, sent with every request once it is known
+        """
+        with self._token_lock:
+            return self._csrf
 
-    def post_process(self, response):
+    @csrf_token.setter
+    def csrf_token(self, token):
+        with self._token_lock:
+            self._csrf = token
+
+    @property
+    def last_h(self):
+        """
+        The session &h= link token
+        """
+        with self._token_lock:
+            return self._h
+
+    @last_h.setter
+    def last_h(self, token):
+        with self._token_lock:
+            self._h = token
+
+    def reset_pipeline(self):
+        """
+        Clears the pipeline state of the current thread, a village never sees the pages of the village
+        that ran on the same executor thread before it
+        """
+        self._local.__dict__.clear()
+
+    def request_headers(self, headers=None):
+        """
+        Creates the headers of a single request: a copy of the session headers with the origin,
+        the referer of the current pipeline and the csrf token, headers passed by the caller take precedence
+        """
+        request_headers = dict(self.headers)
+        request_headers['Origin'] = (self.endpoint if self.endpoint else self.auth_endpoint).rstrip('/')
+        referer = self.referer
+        if referer:
+            request_headers['Referer'] = referer
+        token = self.csrf_token
+        if token:
+            request_headers['x-csrf-token'] = token
+        if headers:
+            request_headers.update(headers)
+        return request_headers
+
+    @property
+    def last_error(self):
+        """
+        The last request failure of the current pipeline (thread)
+        """
+        return getattr(self._local, "error", None)
+
+    @last_error.setter
+    def last_error(self, error):
+        self._local.error = error
+
+    @property
+    def delay(self):
+        """
+        Delay factor, sets the target request rate of the pacer
+        """
+        return self.pacer.delay
+
+    @delay.setter
+    def delay(self, delay):
+        self.pacer.delay = delay
+
+    @property
+    def max_requests_per_minute(self):
+        """
+        Account wide request budget, 0 means the delay factor sets the rate
+        """
+        return self.pacer.max_per_minute
+
+    @max_requests_per_minute.setter
+    def max_requests_per_minute(self, max_per_minute):
+        # the value comes straight from the config file, "30" or null must not reach the pacer math
+        try:
+            budget = float(max_per_minute or 0)
+            if not math.isfinite(budget) or budget < 0:
+                raise ValueError("has to be a positive number or 0")
+        except (TypeError, ValueError) as e:
+            self.logger.warning(
+                "Invalid max_requests_per_minute %r (%s), the delay factor sets the rate", max_per_minute, e
+            )
+            budget = 0.0
+        self.pacer.max_per_minute = int(budget) if budget.is_integer() else budget
+
+    def set_pacer(self, name="token_bucket", burst=3.0):
+        """
+        Replaces the request pacer while keeping the current rate settings
+        """
+        self.pacer = create_pacer(
+            name,
+            delay=self.pacer.delay,
+            max_per_minute=self.pacer.max_per_minute,
+            burst=burst,
+        )
+
+    def set_timeout(self, timeout):
+        """
+        Sets the request timeout from a number (connect and read) or a [connect, read] pair,
+        invalid values keep the current timeout
+        """
+        try:
+            if isinstance(timeout, (list, tuple)):
+                connect, read = (float(value) for value in timeout)
+            else:
+                connect = read = float(timeout)
+            if connect <= 0 or read <= 0:
+                raise ValueError("timeouts have to be positive")
+        except (TypeError, ValueError) as e:
+            self.logger.warning("Invalid request timeout %r (%s), using %s", timeout, e, self.timeout)
+            return
+        self.timeout = (connect, read)
+
+    def set_concurrency(self, concurrency):
+        """
+        Sets the amount of village pipelines that run at the same time, invalid values run them one by one
+        """
+        try:
+            value = float(concurrency)
+            if not value.is_integer() or value < 1:
+                raise ValueError("has to be a whole number of at least 1")
+        except (TypeError, ValueError, OverflowError) as e:
+            self.logger.warning("Invalid concurrent_villages %r (%s), running villages one by one", concurrency, e)
+            value = 1
+        self.concurrency = int(value)
+
+    def set_transport(self, name="requests"):
+        """
+        Switches the HTTP transport (requests or http2) while keeping the session cookies
+        """
+        self.web = create_session(name, session=self.web)
+        self.logger.info("Using %s transport", type(self.web).__name__)
+
+    @staticmethod
+    def request_class(url, headers=None):
+        """
+        Detects the pacer request class (page, ajax, confirm or command)
+        """
+        if "popup_command" in url or "action=command" in url:
+            return "command"
+        if "try=confirm" in url:
+            return "confirm"
+        if headers and any(k.lower() == "tribalwars-ajax" for k in headers):
+            return "ajax"
+        return "page"
+
+    def pace(self, request_class="page"):
+        """
+        Waits for the account wide pacer before a request is sent
+        Every pipeline shares the same pacer so running villages concurrently never raises the request rate
+        """
+        if self.priority_mode:
+            return 0
+        return self.pacer.acquire(request_class)
+
+    def post_process(self, response, remember=True):
         """
         Post-processes all requests and stores data used for the next request
+        remember=False keeps the last response (pages that were only read partially)
         """
-        xsrf = re.search('<meta content="(.+?)" name="csrf-token"', response.text)
+        text = response.text
+        # json responses and pages without the meta tag keep the session token
+        xsrf = tokens.csrf_token(text) if tokens.is_html(response) else None
         if xsrf:
-            self.headers['x-csrf-token'] = xsrf.group(1)
+            self.csrf_token = xsrf
             self.logger.debug("Set CSRF token")
-        elif 'x-csrf-token' in self.headers:
-            del self.headers['x-csrf-token']
-        self.headers['Referer'] = response.url
-        self.last_response = response
-        get_h = re.search(r'&h=(\w+)', response.text)
+        self.referer = response.url
+        if remember:
+            self.last_response = response
+        get_h = tokens.h_token(text)
         if get_h:
-            self.last_h = get_h.group(1)
+            self.last_h = get_h
 
     def get_url(self, url, headers=None):
         """
         Fetches a URL using a basic GET request
         """
-        self.headers['Origin'] = (self.endpoint if self.endpoint else self.auth_endpoint).rstrip('/')
-        if not self.priority_mode:
-            time.sleep(random.randint(int(3 * self.delay), int(7 * self.delay)))
         url = urljoin(self.endpoint if self.endpoint else self.auth_endpoint, url)
-        if not headers:
-            headers = self.headers
+        headers = self.request_headers(headers)
+        cached = self.page_cache.get(url)
+        if cached is not None:
+            self.logger.debug("GET %s [cached]", url)
+            self.metrics.observe_cached(url)
+            self.referer = cached.url
+            self.last_response = cached
+            return cached
+        if self.page_cache.changes_state(url):
+            self.page_cache.invalidate(url)
+        key = self.page_cache.key(url)
+        if key is not None:
+            # identical page requests of concurrent pipelines share a single request
+            res = self.in_flight.do(key, functools.partial(self.fetch_url, url, headers))
+            if res is not None:
+                self.referer = res.url
+                self.last_response = res
+            return res
+        return self.fetch_url(url, headers)
+
+    def send(self, method, url, idempotent=True, **kwargs):
+        """
+        Sends a request through the pacer, the retry policy and the metrics registry
+        Raises RequestFailedException when the request failed for good
+        """
+        request_class = self.request_class(url, kwargs.get("headers"))
+        kwargs.setdefault("timeout", self.timeout)
+        # park while the captcha is not solved, the request is sent once the bot resumes
+        self.protection.wait()
+
+        def attempt():
+            waited = self.pace(request_class)
+            start = time.perf_counter()
+            try:
+                res = self.web.request(method, url, **kwargs)
+            except Exception:
+                self.metrics.observe(url, time.perf_counter() - start, None, waited=waited)
+                raise
+            # a streamed body is counted by whoever reads it
+            self.metrics.observe(
+                url, time.perf_counter() - start, res, waited=waited, body=0 if kwargs.get("stream") else None
+            )
+            return res
+
+        return self.retry.call(endpoint_name(url), attempt, idempotent=idempotent)
+
+    def fetch_url(self, url, headers):
+        """
+        Sends the actual GET request of get_url
+        """
         try:
-            res = self.web.get(url=url, headers=headers)
+            res = ParsedPage(self.send(
+                "GET", url, idempotent=not self.page_cache.changes_state(url), headers=headers
+            ))
             self.logger.debug("GET %s [%d]", url, res.status_code)
             self.post_process(res)
-            if 'data-bot-protect="forced"' in res.text:
-                self.logger.warning("Bot protection hit! cannot continue")
-                self.reporter.report(
-                    0, "TWB_RECAPTCHA", "Stopping bot, press any key once captcha has been solved")
-                Notification.send("Bot protection hit! cannot continue")
-                input("Press any key...")
-                return self.get_url(url, headers)
+            while self.protection.detect(res.text):
+                # every pipeline parks at its next request, this one retries its page after the resume
+                self.protection.pause(url)
+                res = ParsedPage(self.send(
+                    "GET", url, idempotent=not self.page_cache.changes_state(url), headers=headers
+                ))
+                self.post_process(res)
+            if res.status_code == 200:
+                self.page_cache.put(url, res)
             return res
+        except RequestFailedException as e:
+            self.logger.warning("GET %s failed: %s", url, str(e))
+            self.last_error = e
+            return None
         except Exception as e:
             self.logger.warning("GET %s: %s", url, str(e))
+            self.last_error = e
             return None
 
+    def peek_url(self, url, markers=(), until=None, headers=None):
+        """
+        Fetches a page that is only checked for markers, the body is read until every marker has been found
+        or until enough text after the until marker has been read. The session tokens are still updated.
+        The page is not cached and does not replace the last response, `marker in page` answers for the
+        requested markers, everything else only sees the part that was read
+        """
+        url = urljoin(self.endpoint if self.endpoint else self.auth_endpoint, url)
+        headers = self.request_headers(headers)
+        cached = self.page_cache.get(url)
+        if cached is not None:
+            self.logger.debug("GET %s [cached]", url)
+            self.metrics.observe_cached(url)
+            self.referer = cached.url
+            return cached
+        if self.page_cache.changes_state(url):
+            self.page_cache.invalidate(url)
+        try:
+            res = self.fetch_partial(url, headers, markers, until)
+            while PROTECTION_MARKER in res:
+                self.protection.pause(url)
+                res = self.fetch_partial(url, headers, markers, until)
+            return res
+        except RequestFailedException as e:
+            self.logger.warning("GET %s failed: %s", url, str(e))
+            self.last_error = e
+            return None
+        except Exception as e:
+            self.logger.warning("GET %s: %s", url, str(e))
+            self.last_error = e
+            return None
+
+    def fetch_partial(self, url, headers, markers, until=None):
+        """
+        Sends the streamed GET request of peek_url and reads the start of the body
+        """
+        res = self.send("GET", url, idempotent=not self.page_cache.changes_state(url), headers=headers, stream=True)
+        page = self.read_partial(url, res, markers, until)
+        self.logger.debug(
+            "GET %s [%d] %d characters read%s", url, res.status_code, len(page.text),
+            "" if page.complete else " (partial)"
+        )
+        self.post_process(page, remember=False)
+        return page
+
+    def read_partial(self, url, response, markers, until=None):
+        """
+        Reads a streamed response until the markers are decided, the rest of the body is never read.
+        The bot protection check only sees the part that was read: the game puts its marker early in <body>,
+        which is always read before the session tokens, the next full page request checks the whole page
+        """
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        if response.raw is None:
+            # transports that read the body themselves (http2, replays)
+            body = response.content
+            chunks = (body[i:i + self.peek_chunk_size] for i in range(0, len(body), self.peek_chunk_size))
+        else:
+            chunks = response.iter_content(self.peek_chunk_size)
+        html = tokens.is_html(response)
+        # a marker can start right before the until marker
+        window = len(until) + max([len(marker) for marker in markers] or [0]) if until else 0
+        pending = list(markers)
+        found = {}
+        text = ""
+        read = 0
+        complete = True
+        for chunk in chunks:
+            read += len(chunk)
+            start = len(text)
+            text += decoder.decode(chunk)
+            for marker in list(pending):
+                if text.find(marker, max(0, start - len(marker) + 1)) != -1:
+                    found[marker] = True
+                    pending.remove(marker)
+            if html and not tokens.tokens_read(text):
+                continue
+            if not pending:
+                complete = False
+                break
+            if until:
+                position = text.find(until)
+                if position != -1 and len(text) >= position + window:
+                    complete = False
+                    break
+        else:
+            text += decoder.decode(b"", final=True)
+        for marker in pending:
+            found[marker] = False
+        found[PROTECTION_MARKER] = PROTECTION_MARKER in text
+        # closing an unread body drops the connection instead of reading the rest of the page
+        response.close()
+        self.metrics.observe_body(url, read)
+        return PartialPage(response, text, complete=complete, found=found)
+
     def post_url(self, url, data, headers=None):
         """
         Sends a basic POST request with urlencoded postdata
         """
-        if not self.priority_mode:
-            time.sleep(
-                random.randint(int(3 * self.delay), int(7 * self.delay))
-            )
-        self.headers['Origin'] = (self.endpoint if self.endpoint else self.auth_endpoint).rstrip('/')
         url = urljoin(self.endpoint if self.endpoint else self.auth_endpoint, url)
         enc = urlencode(data)
-        if not headers:
-            headers = self.headers
+        headers = self.request_headers(headers)
+        # Anything that is posted changes the state of the village
+        self.page_cache.invalidate(url)
         try:
-            res = self.web.post(url=url, data=data, headers=headers)
+            # a POST is only retried when it never reached the server
+            res = ParsedPage(self.send("POST", url, idempotent=False, data=data, headers=headers))
             self.logger.debug("POST %s %s [%d]", url, enc, res.status_code)
             self.post_process(res)
             return res
+        except RequestFailedException as e:
+            self.logger.warning("POST %s %s failed: %s", url, enc, str(e))
+            self.last_error = e
+            return None
         except Exception as e:
             self.logger.warning("POST %s %s: %s", url, enc, str(e))
+            self.last_error = e
             return None
 
     def start(self, ):
@@ -153,10 +529,11 @@ class WebWrapper:
 
     def get_api_data(self, village_id, action, params={}):
 
-        custom = dict(self.headers)
-        custom['accept'] = "application/json, text/javascript, */*; q=0.01"
-        custom['x-requested-with'] = "XMLHttpRequest"
-        custom['tribalwars-ajax'] = "1"
+        custom = {
+            'accept': "application/json, text/javascript, */*; q=0.01",
+            'x-requested-with': "XMLHttpRequest",
+            'tribalwars-ajax': "1",
+        }
         req = {
             'ajax': action,
             'village': village_id,
@@ -166,7 +543,7 @@ class WebWrapper:
         payload = f"game.php?{urlencode(req)}"
         url = urljoin(self.endpoint, payload)
         res = self.get_url(url, headers=custom)
-        if res.status_code == 200:
+        if res is not None and res.status_code == 200:
             try:
                 return res.json()
             except:
@@ -176,10 +553,11 @@ class WebWrapper:
         """
         Simulates an API request
         """
-        custom = dict(self.headers)
-        custom['accept'] = "application/json, text/javascript, */*; q=0.01"
-        custom['x-requested-with'] = "XMLHttpRequest"
-        custom['tribalwars-ajax'] = "1"
+        custom = {
+            'accept': "application/json, text/javascript, */*; q=0.01",
+            'x-requested-with': "XMLHttpRequest",
+            'tribalwars-ajax': "1",
+        }
         req = {
             'ajax': action,
             'village': village_id,
@@ -191,7 +569,7 @@ class WebWrapper:
         if 'h' not in data:
             data['h'] = self.last_h
         res = self.post_url(url, data=data, headers=custom)
-        if res.status_code == 200:
+        if res is not None and res.status_code == 200:
             try:
                 return res.json()
             except:
@@ -201,10 +579,11 @@ class WebWrapper:
         """
         Simulates an API action being triggered
         """
-        custom = dict(self.headers)
-        custom['Accept'] = "application/json, text/javascript, */*; q=0.01"
-        custom['X-Requested-With'] = "XMLHttpRequest"
-        custom['TribalWars-Ajax'] = "1"
+        custom = {
+            'Accept': "application/json, text/javascript, */*; q=0.01",
+            'X-Requested-With': "XMLHttpRequest",
+            'TribalWars-Ajax': "1",
+        }
         req = {
             'ajaxaction': action,
             'village': village_id,
@@ -216,9 +595,95 @@ class WebWrapper:
         if 'h' not in data:
             data['h'] = self.last_h
         res = self.post_url(url, data=data, headers=custom)
-        if res.status_code == 200:
+        if res is not None and res.status_code == 200:
             try:
                 return res.json()
             except:
                 return res
         return None
+
+    def start_recording(self, path):
+        """
+        Records all traffic of the session to a compressed archive
+        """
+        self.recorder = Recorder(path)
+        self.recorder.attach(self.web)
+        return self.recorder
+
+    def stop_recording(self):
+        """
+        Stops recording and writes the archive
+        """
+        if not self.recorder:
+            return 0
+        self.recorder.detach(self.web)
+        amount = self.recorder.save()
+        self.recorder = None
+        return amount
+
+    def replay(self, path=None, adapter=None, fallback=None):
+        """
+        Answers all requests from a recorded archive (or a custom transport adapter) instead of the game server
+        """
+        if not adapter:
+            adapter = ReplayAdapter.load(path, fallback=fallback)
+        base = self.endpoint if self.endpoint else self.auth_endpoint
+        parsed = urlparse(base)
+        self.web.mount(f"{parsed.scheme}://{parsed.netloc}/", adapter)
+        return adapter
+
+    def run_async(self, func, *args, **kwargs):
+        """
+        Runs a blocking wrapper (or pipeline) function on the request executor
+        Returns an awaitable so multiple village pipelines can run concurrently
+        """
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(
+                max_workers=max(1, self.concurrency), thread_name_prefix="twb-pipeline"
+            )
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def aget_url(self, url, headers=None):
+        """
+        Awaitable variant of get_url
+        """
+        return await self.run_async(self.get_url, url, headers=headers)
+
+    async def apost_url(self, url, data, headers=None):
+        """
+        Awaitable variant of post_url
+        """
+        return await self.run_async(self.post_url, url, data, headers=headers)
+
+    async def aget_action(self, village_id, action):
+        """
+        Awaitable variant of get_action
+        """
+        return await self.run_async(self.get_action, village_id, action)
+
+    async def aget_api_data(self, village_id, action, params={}):
+        """
+        Awaitable variant of get_api_data
+        """
+        return await self.run_async(self.get_api_data, village_id, action, params=params)
+
+    async def apost_api_data(self, village_id, action, params={}, data={}):
+        """
+        Awaitable variant of post_api_data
+        """
+        return await self.run_async(self.post_api_data, village_id, action, params=params, data=data)
+
+    async def aget_api_action(self, village_id, action, params={}, data={}):
+        """
+        Awaitable variant of get_api_action
+        """
+        return await self.run_async(self.get_api_action, village_id, action, params=params, data=data)
+
+    def shutdown(self):
+        """
+        Stops the pipeline executor (if it was started)
+        """
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
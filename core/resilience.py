@@ -0,0 +1,167 @@
+"""
+Retries and circuit breaking for game requests
+Transient failures (timeouts, dropped connections, 5xx) are retried with a jittered exponential
+backoff, endpoints that keep failing are short-circuited for a while instead of being hammered
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from core.exceptions import CircuitOpenException, RequestFailedException
+
+# Response codes worth retrying
+TRANSIENT_STATUS = [429, 500, 502, 503, 504]
+
+
+def classify(exception=None, response=None):
+    """
+    Classifies a failed request: "transient", "transient_unsent" (the request never reached the server),
+    "permanent" or None if the request did not fail
+    """
+    if exception is not None:
+        if isinstance(exception, requests.exceptions.ConnectTimeout):
+            return "transient_unsent"
+        if isinstance(exception, (
+                requests.exceptions.Timeout,
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+        )):
+            return "transient"
+        return "permanent"
+    if response is not None and response.status_code in TRANSIENT_STATUS:
+        return "transient"
+    return None
+
+
+class Backoff:
+    """
+    Bounded exponential backoff with full jitter
+    """
+
+    def __init__(self, base=2.0, factor=2.0, max_delay=60.0):
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        """
+        Time to wait before retry number attempt (starting at 1)
+        """
+        return random.uniform(0, min(self.max_delay, self.base * self.factor ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Per endpoint circuit breaker
+    After threshold consecutive failures the endpoint is closed for reset_timeout seconds,
+    afterwards a single trial request decides whether it opens again
+    """
+    logger = logging.getLogger("CircuitBreaker")
+
+    def __init__(self, threshold=5, reset_timeout=120):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = {}
+        self.opened = {}
+        self.clock = time.monotonic
+        self.lock = threading.Lock()
+
+    def check(self, endpoint):
+        """
+        Raises CircuitOpenException if requests to the endpoint are not allowed
+        """
+        if not self.threshold:
+            return
+        with self.lock:
+            opened = self.opened.get(endpoint)
+            if opened is None:
+                return
+            remaining = opened + self.reset_timeout - self.clock()
+            if remaining > 0:
+                raise CircuitOpenException(endpoint, remaining)
+            # half open, let this request through as the trial
+            self.opened[endpoint] = self.clock()
+
+    def success(self, endpoint):
+        with self.lock:
+            self.failures.pop(endpoint, None)
+            if self.opened.pop(endpoint, None) is not None:
+                self.logger.info("Endpoint %s recovered", endpoint)
+
+    def failure(self, endpoint):
+        with self.lock:
+            self.failures[endpoint] = self.failures.get(endpoint, 0) + 1
+            if self.threshold and self.failures[endpoint] >= self.threshold:
+                if endpoint not in self.opened:
+                    self.logger.warning(
+                        "Endpoint %s failed %d times, pausing it for %d seconds",
+                        endpoint, self.failures[endpoint], self.reset_timeout
+                    )
+                self.opened[endpoint] = self.clock()
+
+    def state(self):
+        """
+        Endpoints that are currently open (or half open)
+        """
+        with self.lock:
+            return dict(self.opened)
+
+
+class RetryPolicy:
+    """
+    Sends a request with retries and circuit breaking
+    """
+    logger = logging.getLogger("Retry")
+
+    def __init__(self, retries=3, backoff=None, breaker=None):
+        self.retries = retries
+        self.backoff = backoff or Backoff()
+        self.breaker = breaker or CircuitBreaker()
+        # Can be replaced by a virtual sleep (benchmarks / replays)
+        self.sleep = time.sleep
+        self.retried = 0
+
+    def call(self, endpoint, func, idempotent=True, before_attempt=None):
+        """
+        Runs func (which sends a request and returns the response) until it succeeds
+        Requests that change the game state are only retried when they never reached the server
+        """
+        attempt = 0
+        while True:
+            self.breaker.check(endpoint)
+            if before_attempt:
+                before_attempt()
+            response = None
+            try:
+                response = func()
+                kind = classify(response=response)
+                reason = f"HTTP {response.status_code}" if kind else None
+            except Exception as e:
+                kind = classify(exception=e)
+                reason = f"{type(e).__name__}: {e}"
+            if not kind:
+                self.breaker.success(endpoint)
+                return response
+            if kind == "permanent":
+                raise RequestFailedException(endpoint, reason, transient=False)
+            self.breaker.failure(endpoint)
+            retryable = idempotent or kind == "transient_unsent"
+            attempt += 1
+            if not retryable or attempt > self.retries:
+                if response is not None:
+                    # the server answered, the caller decides what to do with the error page
+                    return response
+                raise RequestFailedException(endpoint, reason, transient=True)
+            if response is not None:
+                # a streamed error page still holds its connection
+                response.close()
+            wait = self.backoff.delay(attempt)
+            self.retried += 1
+            self.logger.info(
+                "%s failed (%s), retry %d/%d in %.1f seconds", endpoint, reason, attempt, self.retries, wait
+            )
+            self.sleep(wait)
@@ -0,0 +1,52 @@
+"""
+Session token extraction
+Runs on every response, so the patterns are precompiled and only search where the tokens live
+"""
+
+import re
+
+CSRF_PATTERN = re.compile(r'<meta content="(.+?)" name="csrf-token"')
+H_PATTERN = re.compile(r'&h=(\w+)')
+
+# The csrf meta tag is in the <head>, which is expected within the first part of a page
+HEAD_WINDOW = 65536
+
+
+def csrf_token(text):
+    """
+    Finds the csrf token, searches the <head> first and the full page as a fallback
+    """
+    end = text.find("</head>", 0, HEAD_WINDOW)
+    if end != -1:
+        match = CSRF_PATTERN.search(text, 0, end)
+        if match:
+            return match.group(1)
+    match = CSRF_PATTERN.search(text)
+    return match.group(1) if match else None
+
+
+def h_token(text):
+    """
+    Finds the first &h= link token
+    """
+    match = H_PATTERN.search(text)
+    return match.group(1) if match else None
+
+
+def tokens_read(text):
+    """
+    Checks if the start of a page that is still being read holds both tokens (or the csrf token is not on it)
+    A token at the very end of the text might continue in the next chunk
+    """
+    head = text.find("</head>", 0, HEAD_WINDOW)
+    if head == -1 and len(text) < HEAD_WINDOW:
+        return False
+    match = H_PATTERN.search(text)
+    return match is not None and match.end() < len(text)
+
+
+def is_html(response):
+    """
+    Json (ajax) responses never contain the csrf meta tag
+    """
+    return "json" not in response.headers.get("content-type", "")
@@ -0,0 +1,139 @@
+"""
+HTTP transports of the WebWrapper
+The default transport is a requests session, the http2 transport multiplexes all pipelines over a single
+HTTP/2 connection (requires httpx with the http2 extra: pip install httpx[http2])
+"""
+
+import logging
+
+import requests
+from requests import PreparedRequest, Response
+from requests.structures import CaseInsensitiveDict
+
+try:
+    import httpx
+
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import h2  # noqa: F401 (required by httpx for http2)
+
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+TRANSPORTS = ["requests", "http2"]
+
+
+class Http2Session:
+    """
+    Drop-in replacement for the parts of requests.Session the bot uses
+    Responses are converted to requests responses and the cookie jar is shared with the session it replaces,
+    so everything downstream (page cache, extractors, recorder) works unchanged
+    """
+    logger = logging.getLogger("Http2Session")
+
+    def __init__(self, cookies=None, timeout=30.0):
+        self.cookies = cookies if cookies is not None else requests.cookies.RequestsCookieJar()
+        self.hooks = {"response": []}
+        self.client = httpx.Client(
+            http2=True, cookies=self.cookies, follow_redirects=True, timeout=timeout
+        )
+        # adapters mounted for replays are served by a plain requests session with the same cookies
+        self.mounted = requests.Session()
+        self.mounted.cookies = self.cookies
+        self.prefixes = []
+
+    def mount(self, prefix, adapter):
+        self.mounted.mount(prefix, adapter)
+        self.prefixes.append(prefix)
+
+    def request(self, method, url, headers=None, data=None, timeout=None, **kwargs):
+        if any(url.startswith(prefix) for prefix in self.prefixes):
+            response = self.mounted.request(method, url, headers=headers, data=data, timeout=timeout, **kwargs)
+        else:
+            try:
+                raw = self.client.request(
+                    method, url, headers=headers, data=data, timeout=self.client_timeout(timeout)
+                )
+            except httpx.ConnectTimeout as e:
+                raise requests.exceptions.ConnectTimeout(str(e))
+            except httpx.TimeoutException as e:
+                raise requests.exceptions.Timeout(str(e))
+            except httpx.TransportError as e:
+                raise requests.exceptions.ConnectionError(str(e))
+            response = self.convert(raw)
+        for hook in self.hooks["response"]:
+            response = hook(response) or response
+        return response
+
+    @staticmethod
+    def client_timeout(timeout):
+        """
+        Converts a requests timeout (seconds or a (connect, read) pair) into a httpx timeout
+        """
+        if timeout is None:
+            return httpx.USE_CLIENT_DEFAULT
+        if isinstance(timeout, (list, tuple)):
+            connect, read = timeout
+            return httpx.Timeout(read, connect=connect)
+        return httpx.Timeout(timeout)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request("POST", url, data=data, **kwargs)
+
+    @staticmethod
+    def convert(raw):
+        """
+        Converts a httpx response into a requests response
+        """
+        request = PreparedRequest()
+        request.method = raw.request.method
+        request.url = str(raw.request.url)
+        request.headers = CaseInsensitiveDict(raw.request.headers.items())
+        request.body = raw.request.content or None
+        response = Response()
+        response.status_code = raw.status_code
+        response._content = raw.content
+        response.headers = CaseInsensitiveDict(raw.headers.items())
+        response.encoding = raw.encoding
+        response.url = str(raw.url)
+        response.reason = raw.reason_phrase
+        try:
+            response.elapsed = raw.elapsed
+        except RuntimeError:
+            # only known once the stream has been closed
+            pass
+        response.request = request
+        return response
+
+    def close(self):
+        self.client.close()
+        self.mounted.close()
+
+
+def create_session(name="requests", session=None):
+    """
+    Creates the session of a transport, the cookies of the current session are kept
+    Falls back to requests when the http2 dependencies are missing
+    """
+    cookies = session.cookies if session is not None else None
+    if name == "http2":
+        if HAS_HTTPX and HAS_H2:
+            return Http2Session(cookies=cookies)
+        logging.getLogger("Transport").warning(
+            "The http2 transport requires httpx[http2] (pip install httpx[http2]), using requests"
+        )
+    elif name not in TRANSPORTS:
+        logging.getLogger("Transport").warning("Unknown transport %s, using requests", name)
+    if session is not None and isinstance(session, requests.Session):
+        return session
+    new = requests.session()
+    if cookies is not None:
+        new.cookies = cookies
+    return new
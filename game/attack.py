@@ -9,7 +9,7 @@ import time
 from datetime import datetime
 from datetime import timedelta
 
-from core.filemanager import FileManager
+from core.cachestore import CacheStore
 
 
 class AttackManager:
@@ -61,7 +61,7 @@ class AttackManager:
         for unit in units:
             if unit not in self.troopmanager.troops:
                 return f"{unit} (0/{units[unit]})"
-            if units[unit] > int(self.troopmanager.troops[unit]):
+            if units[unit] > self.troopmanager.troops[unit]:
                 return f"{unit} ({self.troopmanager.troops[unit]}/{units[unit]})"
         return False
 
@@ -117,9 +117,7 @@ class AttackManager:
                 )
                 if attack_result:
                     for u in template:
-                        self.troopmanager.troops[u] = str(
-                            int(self.troopmanager.troops[u]) - template[u]
-                        )
+                        self.troopmanager.troops[u] -= template[u]
                     self.attacked(
                         target["id"],
                         scout=True,
@@ -236,7 +234,7 @@ class AttackManager:
         """
         Attempt to send scouts to a farm
         """
-        if "spy" not in self.troopmanager.troops or int(self.troopmanager.troops["spy"]) < self.scout_farm_amount:
+        if "spy" not in self.troopmanager.troops or self.troopmanager.troops["spy"] < self.scout_farm_amount:
             self.logger.debug(
                 "Cannot scout %s at the moment because insufficient unit: spy", vid
             )
@@ -332,7 +330,7 @@ class AttackManager:
         for t in troops:
             if (
                     t not in self.troopmanager.troops
-                    or int(self.troopmanager.troops[t]) < troops[t]
+                    or self.troopmanager.troops[t] < troops[t]
             ):
                 return False
         return True
@@ -343,10 +341,9 @@ class AttackManager:
         """
         url = f"game.php?village={self.village_id}&screen=place&target={vid}"
         pre_attack = self.wrapper.get_url(url)
-        pre_data = {}
-        for u in Extractor.attack_form(pre_attack):
-            k, v = u
-            pre_data[k] = v
+        if not pre_attack:
+            return False
+        pre_data = Extractor.attack_form(pre_attack)
         if troops:
             pre_data.update(troops)
         else:
@@ -361,7 +358,7 @@ class AttackManager:
 
         confirm_url = f"game.php?village={self.village_id}&screen=place&try=confirm"
         conf = self.wrapper.post_url(url=confirm_url, data=pre_data)
-        if '<div class="error_box">' in conf.text:
+        if not conf or '<div class="error_box">' in conf.text:
             return False
         duration = Extractor.attack_duration(conf)
         if self.forced_peace_time:
@@ -374,15 +371,11 @@ class AttackManager:
             "[Attack] %s -> %s duration %f.1 h", self.village_id, vid, duration / 3600
         )
 
-        confirm_data = {}
-        for u in Extractor.attack_form(conf):
-            k, v = u
-            if k == "support":
-                continue
-            confirm_data[k] = v
+        confirm_data = Extractor.attack_form(conf)
+        confirm_data.pop("support", None)
         new_data = {"building": "main", "h": self.wrapper.last_h}
         confirm_data.update(new_data)
-        # The extractor doesn't like the empty cb value, and mistakes its value for x. So I add it here.
+        # The confirm form should hold the target coordinates, add them in case the game leaves them out
         if "x" not in confirm_data:
             confirm_data["x"] = x
 
@@ -399,16 +392,12 @@ class AttackManager:
 class AttackCache:
     @staticmethod
     def get_cache(village_id):
-        return FileManager.load_json_file(f"cache/attacks/{village_id}.json")
+        return CacheStore.shared().get("attacks", village_id)
 
     @staticmethod
     def set_cache(village_id, entry):
-        return FileManager.save_json_file(entry, f"cache/attacks/{village_id}.json")
+        return CacheStore.shared().set("attacks", village_id, entry)
 
     @staticmethod
-    def cache_grab():
-        output = {}
-
-        for existing in FileManager.list_directory("cache/attacks", ends_with=".json"):
-            output[existing.replace(".json", "")] = FileManager.load_json_file(f"cache/attacks/{existing}")
-        return output
+    def cache_grab(**where):
+        return CacheStore.shared().grab("attacks", **where)
@@ -43,6 +43,9 @@ class BuildingManager:
         """
         self.wrapper = wrapper
         self.village_id = village_id
+        # per village state, villages can run concurrently
+        self.waits = []
+        self.waits_building = []
 
     def create_update_links(self, extracted_buildings):
         """
@@ -63,7 +66,8 @@ class BuildingManager:
         Start a building manager run
         """
         main_data = self.wrapper.get_action(village_id=self.village_id, action="main")
-        self.game_state = Extractor.game_state(main_data)
+        page = Extractor.scan(main_data, "game_state", "building_data", "active_building_queue")
+        self.game_state = page.game_state
         vname = self.game_state["village"]["name"]
 
         if not self.logger:
@@ -71,8 +75,7 @@ class BuildingManager:
 
         if self.complete_actions(main_data.text):
             return self.start_update(build=build, set_village_name=set_village_name)
-        self.costs = Extractor.building_data(main_data)
-        self.costs = self.create_update_links(self.costs)
+        self.costs = self.create_update_links(page.building_data)
 
         if self.resman:
             self.resman.update(self.game_state)
@@ -90,7 +93,7 @@ class BuildingManager:
         for e in tmp:
             tmp[e] = int(tmp[e])
         self.levels = tmp
-        existing_queue = Extractor.active_building_queue(main_data)
+        existing_queue = page.active_building_queue
         if existing_queue == 0:
             self.waits = []
             self.waits_building = []
@@ -320,10 +323,10 @@ class BuildingManager:
                         self.queue.pop(0)
                         index -= 1
                     # Building was completed, queueing another
-                self.game_state = Extractor.game_state(response)
-                self.costs = Extractor.building_data(response)
+                page = Extractor.scan(response, "game_state", "building_data")
+                self.game_state = page.game_state
                 # Trigger function again because game state is changed
-                self.costs = self.create_update_links(self.costs)
+                self.costs = self.create_update_links(page.building_data)
                 if self.resman and "building" in self.resman.requested:
                     # Build something, remove request
                     self.resman.requested["building"] = {}
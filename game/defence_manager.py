@@ -1,4 +1,3 @@
-import json
 import logging
 import random
 import re
@@ -60,19 +59,24 @@ class DefenceManager:
             return False
         send_support = {}
         for u in self.defensive_units:
-            if u in self.units.troops and int(self.units.troops[u]) > 0:
-                send_support[u] = int(int(self.units.troops[u]) * self.support_factor)
+            if u in self.units.troops and self.units.troops[u] > 0:
+                send_support[u] = int(self.units.troops[u] * self.support_factor)
 
         self.logger.info(
             "Sending requested support to village %s: %s", requesting_village, str(send_support)
         )
         return self.support(requesting_village, troops=send_support)
 
-    def update(self, main, with_defence=False):
+    def update(self, main, with_defence=False, under_attack=None):
+        """
+        Checks for incoming attacks, under_attack is used when it is already known (overview)
+        """
         ok = True
         self.manage_flags()
         self.runs += 1
-        if "command/attack.png" in main:
+        if under_attack is None:
+            under_attack = "command/attack.png" in main
+        if under_attack:
             self.under_attack = True
             ok = False
             self.flag_logic(self.set_flag_under_attack)
@@ -114,8 +118,8 @@ class DefenceManager:
             return False
         to_hide = {}
         for u in self.hide_units:
-            if u in self.units.troops and int(self.units.troops[u]) > 0:
-                to_hide[u] = int(self.units.troops[u])
+            if u in self.units.troops and self.units.troops[u] > 0:
+                to_hide[u] = self.units.troops[u]
         if to_hide and len(self.my_other_villages) == 1:
             # good luck ;)
             return False
@@ -197,8 +201,8 @@ class DefenceManager:
 
         self._can_change_flag = '<span class="timer cooldown">' not in result.text
 
-        get_flag_data = re.search(r"FlagsScreen\.setFlagCounts\((.+?)\);", result.text)
-        if not get_flag_data:
+        raw_flags = Extractor.flag_counts(result)
+        if raw_flags is None:
             self.logger.warning("Error reading flag data")
             return
         get_current_flag = re.search(
@@ -219,7 +223,6 @@ class DefenceManager:
                         "Current village flag: %s", get_current_flag.group(3).strip()
                     )
         upgraded = 0
-        raw_flags = json.loads(get_flag_data.group(1))
         self.flags = {}
         for flag_type in raw_flags:
             for level in raw_flags[flag_type]:
@@ -239,10 +242,7 @@ class DefenceManager:
     def support(self, vid, troops=None):
         url = f"game.php?village={self.village_id}&screen=place&target={vid}"
         pre_support = self.wrapper.get_url(url)
-        pre_data = {}
-        for u in Extractor.attack_form(pre_support):
-            k, v = u
-            pre_data[k] = v
+        pre_data = Extractor.attack_form(pre_support)
         if troops:
             pre_data.update(troops)
         else:
@@ -265,16 +265,12 @@ class DefenceManager:
             self.village_id, vid, duration / 3600
         )
 
-        confirm_data = {}
-        for u in Extractor.attack_form(conf):
-            k, v = u
-            if k == "attack":
-                continue
-            confirm_data[k] = v
+        confirm_data = Extractor.attack_form(conf)
+        confirm_data.pop("attack", None)
         new_data = {"h": self.wrapper.last_h}
         confirm_data.update(new_data)
-        if x not in confirm_data:
-            confirm_data[x] = x
+        if "x" not in confirm_data:
+            confirm_data["x"] = x
         result = self.wrapper.get_api_action(
             village_id=self.village_id,
             action="popup_command",
@@ -75,10 +75,7 @@ class Hunter:
     def attack(self, source, vid, troops=None):
         url = "game.php?village=%s&screen=place&target=%s" % (source, vid)
         pre_attack = self.wrapper.get_url(url)
-        pre_data = {}
-        for u in Extractor.attack_form(pre_attack):
-            k, v = u
-            pre_data[k] = v
+        pre_data = Extractor.attack_form(pre_attack)
         if troops:
             pre_data.update(troops)
 
@@ -94,12 +91,8 @@ class Hunter:
         if '<div class="error_box">' in conf.text:
             return False
         duration = Extractor.attack_duration(conf)
-        confirm_data = {}
-        for u in Extractor.attack_form(conf):
-            k, v = u
-            if k == "support":
-                continue
-            confirm_data[k] = v
+        confirm_data = Extractor.attack_form(conf)
+        confirm_data.pop("support", None)
         new_data = {
             "building": "main",
             "h": self.wrapper.last_h,
@@ -121,10 +114,7 @@ class Hunter:
     def prepare(self, vid, troops=None):
         url = "game.php?village=%s&screen=place&target=%s" % (self.village_id, vid)
         pre_attack = self.wrapper.get_url(url)
-        pre_data = {}
-        for u in Extractor.attack_form(pre_attack):
-            k, v = u
-            pre_data[k] = v
+        pre_data = Extractor.attack_form(pre_attack)
         if troops:
             pre_data.update(troops)
 
@@ -138,12 +128,8 @@ class Hunter:
             return False
         duration = Extractor.attack_duration(conf)
 
-        confirm_data = {}
-        for u in Extractor.attack_form(conf):
-            k, v = u
-            if k == "support":
-                continue
-            confirm_data[k] = v
+        confirm_data = Extractor.attack_form(conf)
+        confirm_data.pop("support", None)
         new_data = {
             "building": "main",
             "h": self.wrapper.last_h,
@@ -6,7 +6,7 @@ import math
 import time
 
 from core.extractors import Extractor
-from core.filemanager import FileManager
+from core.cachestore import CacheStore
 
 
 class Map:
@@ -173,11 +173,11 @@ class MapCache:
         """
         Get data from the cache
         """
-        return FileManager.load_json_file(f"cache/villages/{village_id}.json")
+        return CacheStore.shared().get("villages", village_id)
 
     @staticmethod
     def set_cache(village_id, entry):
         """
         Creates or updates a cache entry
         """
-        FileManager.save_json_file(entry, f"cache/villages/{village_id}.json")
+        CacheStore.shared().set("villages", village_id, entry)
@@ -1,13 +1,17 @@
 """
 Report management
 """
+import bisect
 import json
 import logging
 import re
+import threading
 from datetime import datetime
 
-from core.extractors import Extractor
-from core.filemanager import FileManager
+from core.extractors import Extractor, unit_counts
+from core.reportarchive import ReportArchive
+
+UNIT_ROW_PATTERN = re.compile(r'(?s)<tr>(.+?)</tr>')
 
 
 class ReportManager:
@@ -19,6 +23,14 @@ class ReportManager:
     game_state = None
     logger = None
     last_reports = {}
+    # destination village -> [(report order, report id)] sorted oldest first
+    by_destination = None
+    # destination village -> report with the highest "when" (has_resources_left)
+    latest_when = None
+    # destination village -> safe_to_engage result, dropped when a report for the village is added
+    engage_status = None
+    # Report reading is shared between villages that can run concurrently
+    _read_lock = threading.RLock()
 
     def __init__(self, wrapper=None, village_id=None):
         """
@@ -26,28 +38,105 @@ class ReportManager:
         """
         self.wrapper = wrapper
         self.village_id = village_id
+        self.by_destination = {}
+        self.latest_when = {}
+        self.engage_status = {}
+
+    @staticmethod
+    def report_order(report_id):
+        """
+        Report ids increase over time, unknown ids sort as the oldest
+        """
+        report_id = str(report_id)
+        return int(report_id) if report_id.isdigit() else -1
+
+    def remember(self, report_id, entry):
+        """
+        Adds a report to the known reports and the destination index
+        """
+        previous = self.last_reports.get(report_id)
+        self.last_reports[report_id] = entry
+        if previous is not None and previous.get("dest") != entry.get("dest"):
+            self.unindex_report(report_id, previous.get("dest"))
+        self.index_report(report_id, entry)
+
+    def index_report(self, report_id, entry):
+        """
+        Adds a report to the destination index
+        The report list of a village is replaced instead of changed, concurrent readers keep a consistent list
+        """
+        dest = entry.get("dest")
+        if dest is None:
+            return
+        order = (self.report_order(report_id), str(report_id))
+        reports = self.by_destination.get(dest, [])
+        position = bisect.bisect_left(reports, order)
+        if position == len(reports) or reports[position] != order:
+            self.by_destination[dest] = reports[:position] + [order] + reports[position:]
+            self.track_when(dest, entry)
+        else:
+            # stored again, the entry it replaces might have been the newest one
+            self.find_latest_when(dest)
+        self.engage_status.pop(dest, None)
+
+    def unindex_report(self, report_id, dest):
+        """
+        Removes a report from the destination index of a village
+        """
+        reports = self.by_destination.get(dest)
+        if not reports:
+            return
+        order = (self.report_order(report_id), str(report_id))
+        position = bisect.bisect_left(reports, order)
+        if position != len(reports) and reports[position] == order:
+            self.by_destination[dest] = reports[:position] + reports[position + 1:]
+        self.find_latest_when(dest)
+        self.engage_status.pop(dest, None)
+
+    def find_latest_when(self, dest):
+        """
+        Looks up the report with the highest "when" of a village over its indexed reports
+        """
+        self.latest_when.pop(dest, None)
+        for _, report_id in self.by_destination.get(dest, []):
+            entry = self.last_reports.get(report_id)
+            if entry is not None:
+                self.track_when(dest, entry)
+
+    def track_when(self, dest, entry):
+        """
+        Keeps the report with the highest "when" of a village
+        """
+        when = (entry.get("extra") or {}).get("when")
+        if when:
+            best = self.latest_when.get(dest)
+            if best is None or int(when) > int(best["extra"]["when"]):
+                self.latest_when[dest] = entry
+
+    def index_reports(self):
+        """
+        Rebuilds the destination index from all known reports
+        """
+        self.by_destination = {}
+        self.latest_when = {}
+        self.engage_status = {}
+        for report_id, entry in self.last_reports.items():
+            dest = entry.get("dest")
+            if dest is None:
+                continue
+            self.by_destination.setdefault(dest, []).append((self.report_order(report_id), str(report_id)))
+            self.track_when(dest, entry)
+        for reports in self.by_destination.values():
+            reports.sort()
 
     def has_resources_left(self, vid):
         """
         Checks if there are any resources left after farm
         Used by the farm manager script
         """
-        possible_reports = []
-        for repid in self.last_reports:
-            entry = self.last_reports[repid]
-            if vid == entry["dest"] and entry["extra"].get("when", None):
-                possible_reports.append(entry)
-        # self.logger.debug(f"Considered {len(possible_reports)} reports")
-        if len(possible_reports) == 0:
+        entry = self.latest_when.get(vid)
+        if not entry:
             return False, {}
-
-        def highest_when(attack):
-            """
-            Converts the date of an attack when resource gains were high
-            """
-            return datetime.fromtimestamp(int(attack["extra"]["when"]))
-
-        entry = max(possible_reports, key=highest_when)
         self.logger.debug("This is the newest? %s", datetime.fromtimestamp(int(entry["extra"]["when"])))
         if entry["extra"].get("resources", None):
             return True, entry["extra"]["resources"]
@@ -56,52 +145,74 @@ class ReportManager:
     def safe_to_engage(self, vid):
         """
         Calculates if a village is safe to engage without custom interaction
-        Just sending a 0 losses attack overrides this behaviour
-        """
-        for repid in self.last_reports:
-            entry = self.last_reports[repid]
-            if vid == entry["dest"]:
-                if entry["type"] == "attack" and entry["losses"] == {}:
-                    return 1
-                if (
-                        entry["type"] == "scout"
-                        and entry["losses"] == {}
-                        and (
-                        entry["extra"]["defence_units"] == {}
-                        or entry["extra"]["defence_units"]
-                        == entry["extra"]["defence_losses"]
-                )
-                ):
-                    return 1
-
-                if entry["losses"] != {}:
-                    # Acceptable losses for attacks
-                    print(f'Units sent: {entry["extra"]["units_sent"]}')
-                    print(f'Units lost: {entry["losses"]}')
-
-                for sent_type in entry["extra"]["units_sent"]:
-                    amount = entry["extra"]["units_sent"][sent_type]
-                    if sent_type in entry["losses"]:
-                        if amount == entry["losses"][sent_type]:
-                            return 0  # Lost all units!
-                        elif entry["losses"][sent_type] <= 1:
-                            # Allow to lose 1 unit (luck depended)
-                            return 1  # Lost 'just' one unit
-
-                if entry["losses"] != {}:
-                    return 0  # Disengage if anything was lost!
-        return -1
+        The newest report that decides it is used, just sending a 0 losses attack overrides this behaviour
+        """
+        status = self.engage_status.get(vid)
+        if status is not None:
+            return status
+        status = -1
+        for _, report_id in reversed(self.by_destination.get(vid, [])):
+            verdict = self.engage_verdict(self.last_reports[report_id])
+            if verdict is not None:
+                status = verdict
+                break
+        self.engage_status[vid] = status
+        return status
+
+    @staticmethod
+    def engage_verdict(entry):
+        """
+        1 if a report says the village is safe to engage, 0 if it is not, None if the report does not tell
+        """
+        if entry["type"] == "attack" and entry["losses"] == {}:
+            return 1
+        if (
+                entry["type"] == "scout"
+                and entry["losses"] == {}
+                and (
+                entry["extra"]["defence_units"] == {}
+                or entry["extra"]["defence_units"]
+                == entry["extra"]["defence_losses"]
+        )
+        ):
+            return 1
+
+        if entry["losses"] != {}:
+            # Acceptable losses for attacks
+            print(f'Units sent: {entry["extra"]["units_sent"]}')
+            print(f'Units lost: {entry["losses"]}')
+
+        for sent_type in entry["extra"]["units_sent"]:
+            amount = entry["extra"]["units_sent"][sent_type]
+            if sent_type in entry["losses"]:
+                if amount == entry["losses"][sent_type]:
+                    return 0  # Lost all units!
+                elif entry["losses"][sent_type] <= 1:
+                    # Allow to lose 1 unit (luck depended)
+                    return 1  # Lost 'just' one unit
+
+        if entry["losses"] != {}:
+            return 0  # Disengage if anything was lost!
+        return None
 
     def read(self, page=0, full_run=False):
         """
         Read some (or all if you like) reports
         """
+        with self._read_lock:
+            return self._read(page=page, full_run=full_run)
+
+    def _read(self, page=0, full_run=False):
+        """
+        Reads a single page of reports, the caller holds the read lock
+        """
         if not self.logger:
             self.logger = logging.getLogger("Reports")
 
         if len(self.last_reports) == 0:
             self.logger.info("First run, re-reading cache entries")
             self.last_reports = ReportCache.cache_grab()
+            self.index_reports()
             self.logger.info("Got %d reports from cache", len(self.last_reports))
         offset = page * 12
         url = f"game.php?village={self.village_id}&screen=report&mode=all"
@@ -128,25 +239,28 @@ class ReportManager:
 
                 else:
                     res = self.put(report_id, report_type=report_type)
-                    self.last_reports[report_id] = res
+                    self.remember(report_id, res)
         if new == 12 or full_run and page < 20:
             page += 1
             self.logger.debug(
                 "%d new reports where added, also checking page %d", new, page
             )
-            return self.read(page, full_run=full_run)
+            return self._read(page, full_run=full_run)
 
     def re_unit(self, inp):
         """
-        No idea why I made this and what it does
-        Guessing reading a line of units?
+        Keeps the units of a report row that are present
         """
-        output = {}
-        for row in inp:
-            k, v = row
-            if int(v) > 0:
-                output[k] = int(v)
-        return output
+        return {k: v for k, v in inp.items() if v > 0}
+
+    def unit_rows(self, text, table):
+        """
+        Reads the unit rows (sent / losses) of a report unit table match in place
+        """
+        return [
+            self.re_unit(unit_counts(text, row.start(1), row.end(1)))
+            for row in UNIT_ROW_PATTERN.finditer(text, table.start(1), table.end(1))
+        ]
 
     def re_building(self, inp):
         """
@@ -164,6 +278,18 @@ class ReportManager:
         """
         A report where we attacked a village
         """
+        attack_type, from_village, to_village, extra, losses = self.parse_attack_report(report)
+        res = self.put(
+            report_id, attack_type, from_village, to_village, data=extra, losses=losses
+        )
+        self.remember(report_id, res)
+        return True
+
+    def parse_attack_report(self, report):
+        """
+        Reads an attack or scout report
+        Returns (attack type, origin village, destination village, extra data, own losses)
+        """
         from_village = None
         from_player = None
 
@@ -191,14 +317,10 @@ class ReportManager:
                     attacker.group(1),
                 )
                 if units:
-                    sent_units = re.findall("(?s)<tr>(.+?)</tr>", units.group(1))
-                    extra["units_sent"] = self.re_unit(
-                        Extractor.units_in_total(sent_units[0])
-                    )
+                    sent_units = self.unit_rows(attacker.group(1), units)
+                    extra["units_sent"] = sent_units[0]
                     if len(sent_units) == 2:
-                        extra["units_losses"] = self.re_unit(
-                            Extractor.units_in_total(sent_units[1])
-                        )
+                        extra["units_losses"] = sent_units[1]
                         if from_player == self.game_state["player"]["id"]:
                             losses = extra["units_losses"]
 
@@ -215,14 +337,10 @@ class ReportManager:
                     defender.group(1),
                 )
                 if units:
-                    def_units = re.findall("(?s)<tr>(.+?)</tr>", units.group(1))
-                    extra["defence_units"] = self.re_unit(
-                        Extractor.units_in_total(def_units[0])
-                    )
+                    def_units = self.unit_rows(defender.group(1), units)
+                    extra["defence_units"] = def_units[0]
                     if len(def_units) == 2:
-                        extra["defence_losses"] = self.re_unit(
-                            Extractor.units_in_total(def_units[1])
-                        )
+                        extra["defence_losses"] = def_units[1]
                         if to_player == self.game_state["player"]["id"]:
                             losses = extra["defence_losses"]
         results = re.search(r'(?s)(<table id="attack_results".+?</table>)', report)
@@ -258,15 +376,11 @@ class ReportManager:
                 r'(?s)(<table id="attack_spy_away".+?</table>)', report
             )
             if units_away:
-                data_away = self.re_unit(Extractor.units_in_total(units_away.group(1)))
+                data_away = self.re_unit(unit_counts(report, units_away.start(1), units_away.end(1)))
                 extra["units_away"] = data_away
 
         attack_type = "scout" if scout_results and not results else "attack"
-        res = self.put(
-            report_id, attack_type, from_village, to_village, data=extra, losses=losses
-        )
-        self.last_reports[report_id] = res
-        return True
+        return attack_type, from_village, to_village, extra, losses
 
     def put(
             self,
@@ -296,29 +410,39 @@ class ReportManager:
 
 class ReportCache:
     """
-    File cache for local reports
+    Archive of the local reports
     """
     @staticmethod
     def get_cache(report_id):
         """
         Reads a report entry
         """
-        return FileManager.load_json_file(f"cache/reports/{report_id}.json")
+        return ReportArchive.shared().get(report_id)
 
     @staticmethod
     def set_cache(report_id, entry):
         """
         Creates a report entry
         """
-        FileManager.save_json_file(entry, f"cache/reports/{report_id}.json")
+        ReportArchive.shared().put(report_id, entry, when=(entry.get("extra") or {}).get("when"))
 
     @staticmethod
-    def cache_grab():
+    def cache_grab(**where):
         """
-        Reads all locally stored reports
+        Reads all locally stored reports, optionally filtered on report fields (type, origin, dest)
         """
-        output = {}
+        return ReportArchive.shared().grab(**where)
 
-        for existing in FileManager.list_directory("cache/reports", ends_with=".json"):
-            output[existing.replace(".json", "")] = FileManager.load_json_file(f"cache/reports/{existing}")
-        return output
+    @staticmethod
+    def trim(keep):
+        """
+        Removes the oldest reports until at most keep reports are left
+        """
+        return ReportArchive.shared().trim(keep)
+
+    @staticmethod
+    def expire(max_age):
+        """
+        Removes the reports older than max_age seconds, now and on every following read
+        """
+        return ReportArchive.shared().expire(max_age)
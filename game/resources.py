@@ -7,6 +7,12 @@ import time
 
 from core.extractors import Extractor
 
+INCOMING_PATTERN = re.compile(r"Aankomend:\s.+\"icon header (.+?)\".+?<\/span>(.+) ", re.M)
+OFFER_ROW_PATTERN = re.compile(r"(?:<!-- insert the offer -->\n+)\s+<tr>(.*?)<\/tr>", re.S | re.M)
+OFFER_RESOURCE_PATTERN = re.compile(r"<span class=\"icon header (.+?)\".+?>(.+?)</td>")
+OFFER_ID_PATTERN = re.compile(r"<input type=\"hidden\" name=\"id\" value=\"(\d+)")
+OWN_OFFER_PATTERN = re.compile(r'data-id="(\d+)".+?data-village="(\d+)"')
+
 
 class PremiumExchange:
     """
@@ -116,6 +122,9 @@ class ResourceManager:
         """
         self.wrapper = wrapper
         self.village_id = village_id
+        # per village state, villages can run concurrently
+        self.actual = {}
+        self.requested = {}
 
     def update(self, game_state):
         """
@@ -338,8 +347,11 @@ class ResourceManager:
         Creates a new trading offer
         """
         url = f"game.php?village={self.village_id}&screen=market&mode=own_offer"
-        res = self.wrapper.get_url(url=url)
-        if 'market_merchant_available_count">0' in res.text:
+        # only the merchant counter is needed, the rest of the page is not read
+        res = self.wrapper.peek_url(
+            url, markers=['market_merchant_available_count">0'], until='market_merchant_available_count">'
+        )
+        if not res or 'market_merchant_available_count">0' in res:
             self.logger.debug("Not trading because not enough merchants available")
             return False
         payload = {
@@ -362,8 +374,7 @@ class ResourceManager:
         """
         url = f"game.php?village={self.village_id}&screen=market&mode=all_own_offer"
         data = self.wrapper.get_url(url)
-        existing = re.findall(r'data-id="(\d+)".+?data-village="(\d+)"', data.text)
-        for entry in existing:
+        for entry in self.own_offers(data.text):
             offer, village = entry
             if village == str(self.village_id):
                 post_url = f"game.php?village={self.village_id}&screen=market&mode=all_own_offer&action=delete_offers"
@@ -414,15 +425,8 @@ class ResourceManager:
                 # check incoming resources
                 url = f"game.php?village={self.village_id}&screen=market&mode=other_offer"
                 res = self.wrapper.get_url(url=url)
-                p = re.compile(
-                    r"Aankomend:\s.+\"icon header (.+?)\".+?<\/span>(.+) ", re.M
-                )
-                incoming = p.findall(res.text)
-                resource_incoming = {}
-                if incoming:
-                    resource_incoming[incoming[0][0].strip()] = int(
-                        "".join([s for s in incoming[0][1] if s.isdigit()])
-                    )
+                resource_incoming = self.incoming_resources(res.text)
+                if resource_incoming:
                     self.logger.info(
                         f"There are resources incoming! %s", resource_incoming
                     )
@@ -469,17 +473,8 @@ class ResourceManager:
         """
         url = f"game.php?village={self.village_id}&screen=market&mode=other_offer"
         res = self.wrapper.get_url(url=url)
-        p = re.compile(
-            r"(?:<!-- insert the offer -->\n+)\s+<tr>(.*?)<\/tr>", re.S | re.M
-        )
-        cur_off_tds = p.findall(res.text)
-        p = re.compile(r"Aankomend:\s.+\"icon header (.+?)\".+?<\/span>(.+) ", re.M)
-        incoming = p.findall(res.text)
-        resource_incoming = {}
-        if incoming:
-            resource_incoming[incoming[0][0].strip()] = int(
-                "".join([s for s in incoming[0][1] if s.isdigit()])
-            )
+        offers = self.market_offers(res.text)
+        resource_incoming = self.incoming_resources(res.text)
 
         if item in resource_incoming:
             how_many = how_many - resource_incoming[item]
@@ -489,22 +484,10 @@ class ResourceManager:
 
         willing_to_sell = self.actual[sell] - self.in_need_amount(sell)
         self.logger.debug(
-            f"Found {len(cur_off_tds)} offers on market, willing to sell {willing_to_sell} {sell}"
+            f"Found {len(offers)} offers on market, willing to sell {willing_to_sell} {sell}"
         )
 
-        for tds in cur_off_tds:
-            res_offer = re.findall(
-                r"<span class=\"icon header (.+?)\".+?>(.+?)</td>", tds
-            )
-            off_id = re.findall(
-                r"<input type=\"hidden\" name=\"id\" value=\"(\d+)", tds
-            )
-
-            if len(off_id) < 1:
-                # Not enough resources to trade
-                continue
-
-            offer = self.parse_res_offer(res_offer, off_id[0])
+        for offer in offers:
             if (
                     offer["offered"] == item
                     and offer["offer_amount"] >= how_many
@@ -532,7 +515,42 @@ class ResourceManager:
         # No useful offers found
         return False
 
-    def parse_res_offer(self, res_offer, id):
+    @staticmethod
+    def incoming_resources(text):
+        """
+        Reads the resources that are on their way to the village from a market page
+        """
+        incoming = INCOMING_PATTERN.findall(text)
+        resource_incoming = {}
+        if incoming:
+            resource_incoming[incoming[0][0].strip()] = int(
+                "".join([s for s in incoming[0][1] if s.isdigit()])
+            )
+        return resource_incoming
+
+    @staticmethod
+    def market_offers(text):
+        """
+        Reads the offers of other players that can be accepted
+        """
+        offers = []
+        for tds in OFFER_ROW_PATTERN.findall(text):
+            off_id = OFFER_ID_PATTERN.findall(tds)
+            if len(off_id) < 1:
+                # Not enough resources to trade
+                continue
+            offers.append(ResourceManager.parse_res_offer(OFFER_RESOURCE_PATTERN.findall(tds), off_id[0]))
+        return offers
+
+    @staticmethod
+    def own_offers(text):
+        """
+        Reads the (offer id, village id) pairs of the own market offers
+        """
+        return OWN_OFFER_PATTERN.findall(text)
+
+    @staticmethod
+    def parse_res_offer(res_offer, id):
         """
         Parse an offer
         """
@@ -1,12 +1,15 @@
 """
 Used to create snobs
 """
-import json
 import logging
 import re
 
 from core.extractors import Extractor
 
+NEED_AMOUNT_PATTERN = re.compile(r'(?s)<th colspan="3">[\w\s]+</th>.+?data-unit="snob">.+?<td.+?>\s*(\d+)\sx')
+COIN_ROW_PATTERN = re.compile(r'<td class="nowrap">(\d+)')
+CAN_RECRUIT_PATTERN = re.compile(r"(?s)</th><th>(\d+)</th></tr>\s*</table><br />")
+
 
 class SnobManager:
     """
@@ -42,10 +45,7 @@ class SnobManager:
         Checks in a weird way if there is enough gold coins or stored resources
         """
         if not self.using_coin_system:
-            need_amount = re.search(
-                r'(?s)<th colspan="3">[\w\s]+</th>.+?data-unit="snob">.+?<td.+?>\s*(\d+)\sx',
-                text,
-            )
+            need_amount = NEED_AMOUNT_PATTERN.search(text)
             if need_amount:
                 return int(need_amount.group(1))
             return 0
@@ -54,11 +54,21 @@ class SnobManager:
             self.logger.warning("Error parsing snob content")
             return 0
         splits = text.split("gold_big.png")[1].split("<table")[1].split("</table")[0]
-        rows = re.search(r'<td class="nowrap">(\d+)', splits)
+        rows = COIN_ROW_PATTERN.search(splits)
         if rows:
             return int(rows.group(1))
         return 0
 
+    @staticmethod
+    def recruitable(text):
+        """
+        Reads the amount of snobs that can still be recruited, None if the page does not list it
+        """
+        can_recruit = CAN_RECRUIT_PATTERN.search(text)
+        if not can_recruit:
+            return None
+        return int(can_recruit.group(1))
+
     def attempt_recruit(self, amount):
         """
         Tries to recruit a new snob
@@ -69,19 +79,17 @@ class SnobManager:
         game_data = Extractor.game_state(result)
         self.resman.update(game_data)
 
-        can_recruit = re.search(
-            r"(?s)</th><th>(\d+)</th></tr>\s*</table><br />", result.text
-        )
-        if not can_recruit or int(can_recruit.group(1)) == 0:
+        can_recruit = self.recruitable(result.text)
+        if not can_recruit:
             nres = self.need_reserve(result.text)
             if nres > 0:
                 self.logger.debug(
                     "Not enough resources available, still %d needed, attempting storage", nres
                 )
                 cres = (
-                    self.storage_item(result.text)
+                    self.storage_item(result)
                     if not self.using_coin_system
-                    else self.coin_item(result.text)
+                    else self.coin_item(result)
                 )
                 if cres:
                     return self.attempt_recruit(amount)
@@ -89,28 +97,26 @@ class SnobManager:
                 self.logger.debug("Not enough resources available")
                 return False
         self.is_incomplete = False
-        r_num = int(can_recruit.group(1))
-        if r_num == 0:
+        if not can_recruit:
             self.logger.debug(
                 "No more snobs available, awaiting snob creating, snob death or village loss"
             )
             return False
         train_snob_url = f"game.php?village={self.village_id}&screen=snob&action=train&h={self.wrapper.last_h}"
-        self.wrapper.get_url(train_snob_url)
+        # nothing is read from the answer, only the session tokens
+        self.wrapper.peek_url(train_snob_url)
         return True
 
     def storage_item(self, result):
         """
         Tries to store resources for future snob creation
         """
-        storage_re = re.search(r"train\.storage_item = (\{.+?})", result)
-        if not storage_re:
+        data = Extractor.storage_item(result)
+        if not data:
             self.logger.warning(
                 "Snob recruit is called but storage data not on page, error?"
             )
             return False
-        raw_coin = storage_re.group(1)
-        data = json.loads(raw_coin)
 
         if self.has_enough(data):
             get_post = f"game.php?village={self.village_id}&screen=snob&action=reserve"
@@ -125,14 +131,12 @@ class SnobManager:
         """
         Tries to create a new gold coin
         """
-        storage_re = re.search(r"train\.storage_item = (\{.+?})", result)
-        if not storage_re:
+        data = Extractor.storage_item(result)
+        if not data:
             self.logger.warning(
                 "Snob recruit is called but storage data not on page, error?"
             )
             return False
-        raw_coin = storage_re.group(1)
-        data = json.loads(raw_coin)
 
         if self.has_enough(data):
             get_post = f"game.php?village={self.village_id}&screen=snob&action=coin"
@@ -75,14 +75,25 @@ class TroopManager:
                 wrapper=self.wrapper, village_id=self.village_id
             )
 
-    def update_totals(self):
+    def update_totals(self, overview=None, game_state=None):
         """
         Updates the total amount of recruited units
+        The units overview (if available) replaces the rally point request,
+        the game state read earlier in the run replaces the village overview request
         """
-        main_data = self.wrapper.get_action(
-            action="overview", village_id=self.village_id
-        )
-        self.game_data = Extractor.game_state(main_data)
+        result_all = None
+        if not overview or overview.units_home is None or overview.units_total is None:
+            overview = None
+            get_all = (
+                f"game.php?village={self.village_id}&screen=place&mode=units&display=units"
+            )
+            result_all = self.wrapper.get_url(get_all)
+        if game_state:
+            self.game_data = game_state
+        elif result_all is not None:
+            self.game_data = Extractor.game_state(result_all)
+        else:
+            self.game_data = overview.game_state()
 
         if self.resman:
             if "research" in self.resman.requested:
@@ -94,10 +105,15 @@ class TroopManager:
             self.logger = logging.getLogger(f"Recruitment: {village_name}")
         self.troops = {}
 
-        get_all = (
-                f"game.php?village={self.village_id}&screen=place&mode=units&display=units"
-        )
-        result_all = self.wrapper.get_url(get_all)
+        if overview:
+            for k, v in overview.units_home.items():
+                if v > 0:
+                    self.troops[k] = v
+            self.logger.debug("Units in village (overview): %s", str(self.troops))
+            if self.can_recruit:
+                self.total_troops = dict(overview.units_total)
+                self.logger.debug("Village units total (overview): %s", str(self.total_troops))
+            return
 
         for u in Extractor.units_in_village(result_all):
             k, v = u
@@ -108,13 +124,7 @@ class TroopManager:
         if not self.can_recruit:
             return
 
-        self.total_troops = {}
-        for u in Extractor.units_in_total(result_all):
-            k, v = u
-            if k in self.total_troops:
-                self.total_troops[k] = self.total_troops[k] + int(v)
-            else:
-                self.total_troops[k] = int(v)
+        self.total_troops = Extractor.units_in_total(result_all)
         self.logger.debug("Village units total: %s", str(self.total_troops))
 
     def start_update(self, building="barracks", disabled_units=[]):
@@ -224,6 +234,10 @@ class TroopManager:
             return
         result = self.wrapper.get_action(village_id=self.village_id, action="smith")
         smith_data = Extractor.smith_data(result)
+        game_state = Extractor.game_state(result)
+        if game_state:
+            # the research costs are compared with the resources on this page
+            self.game_data = game_state
         if not smith_data:
             self.logger.debug("Error reading smith data")
             return False
@@ -393,7 +407,6 @@ class TroopManager:
             batch_multiplier = [15, 6, 3,
                                 2]  # Multiplier for equal distribution of troops. Time(gather1) = Time(gather2) if gather2 = 2.5 * gather1
 
-            troops = {key: int(value) for key, value in troops.items()}
             total_carry = 0
             for item in haul_dict:
                 item, carry = item.split(":")
@@ -401,8 +414,8 @@ class TroopManager:
                     continue
                 if item in disabled_units:
                     continue
-                if item in troops and int(troops[item]) > 0:
-                    total_carry += int(carry) * int(troops[item])
+                if item in troops and troops[item] > 0:
+                    total_carry += int(carry) * troops[item]
                 else:
                     pass
             gather_batch = math.floor(total_carry / selection_map[selection - 1])
@@ -434,8 +447,8 @@ class TroopManager:
                         if item in disabled_units:
                             continue
 
-                        if item in troops and int(troops[item]) > 0:
-                            troops_int = int(troops[item])
+                        if item in troops and troops[item] > 0:
+                            troops_int = troops[item]
                             troops_selected = 0
                             for troop in range(troops_int):
                                 if (temp_haul - int(carry) < 0):
@@ -444,7 +457,7 @@ class TroopManager:
                                     troops_selected += 1
                                     temp_haul -= int(carry)
                             troops_int -= troops_selected
-                            troops[item] = str(troops_int)
+                            troops[item] = troops_int
                             payload["squad_requests[0][candidate_squad][unit_counts][%s]" % item] = str(troops_selected)
                         else:
                             payload["squad_requests[0][candidate_squad][unit_counts][%s]" % item] = "0"
@@ -486,11 +499,11 @@ class TroopManager:
                             continue
                         if item in disabled_units:
                             continue
-                        if item in troops and int(troops[item]) > 0:
+                        if item in troops and troops[item] > 0:
                             payload[
                                 "squad_requests[0][candidate_squad][unit_counts][%s]" % item
-                                ] = troops[item]
-                            total_carry += int(carry) * int(troops[item])
+                                ] = str(troops[item])
+                            total_carry += int(carry) * troops[item]
                         else:
                             payload[
                                 "squad_requests[0][candidate_squad][unit_counts][%s]" % item
@@ -43,6 +43,9 @@ class Village:
     forced_peace = False
     forced_peace_today_start = None
     disabled_units = []
+    # VillageOverview of the current cycle (multi-village accounts)
+    overview = None
+    overview_max_age = 900
 
     twp = TwStats()
 
@@ -87,6 +90,25 @@ class Village:
                     "Village %s" % self.game_data["village"]["name"]
                 )
                 self.logger.info("Read game state for village")
+        elif (
+                self.overview
+                and not self.overview.state_used
+                and self.overview.is_complete()
+                and self.overview.is_fresh(self.overview_max_age)
+        ):
+            # the combined overview screens already hold everything the village screen would show
+            data = None
+            self.game_data = self.overview.game_state()
+            self.overview.state_used = True
+            self.logger = logging.getLogger(
+                "Village %s" % self.game_data["village"]["name"]
+            )
+            self.logger.info("Read game state for village from the overview")
+            self.wrapper.reporter.report(
+                self.village_id,
+                "TWB_START",
+                "Starting run for village: %s" % self.game_data["village"]["name"],
+            )
         else:
             data = self.wrapper.get_url(
                 f"game.php?village={self.village_id}&screen=overview"
@@ -179,7 +201,8 @@ class Village:
             self.village_id, parameter="evacuate_fragile_units_on_attack", default=False
         )
         self.def_man.update(
-            data.text,
+            data if data else "",
+            under_attack=self.overview.incomings > 0 if data is None else None,
             with_defence=self.get_config(
                 section="units", parameter="manage_defence", default=False
             ),
@@ -193,9 +216,9 @@ class Village:
             )
         self.last_attack = self.def_man.under_attack
 
-    def run_quest_actions(self, config):
+    def run_quest_actions(self, config, data=None):
         if self.get_config(section="world", parameter="quests_enabled", default=False):
-            if self.get_quests():
+            if self.get_quests(data):
                 self.logger.info("There where completed quests, re-running function")
                 self.wrapper.reporter.report(
                     self.village_id, "TWB_QUEST", "Completed quest"
@@ -249,11 +272,16 @@ class Village:
             )
             self.builder.resman = self.resman
             # manage buildings (has to always run because recruit check depends on building levels)
+        # the state of an earlier run is stale, only a builder that runs this cycle reads it again
+        self.builder.game_state = {}
         self.build_config = self.get_village_config(
             self.village_id, parameter="building", default=None
         )
         if self.build_config is False:
             self.logger.debug("Builder is disabled for village %s", self.village_id)
+            if self.overview and self.overview.buildings:
+                # building levels are still required by the recruiter and the snob manager
+                self.builder.levels = dict(self.overview.buildings)
             return
         if not self.build_config:
             self.logger.warning(
@@ -534,14 +562,15 @@ class Village:
                 )
             )
 
-        res = self.wrapper.get_action(village_id=self.village_id, action="overview")
-        self.game_data = Extractor.game_state(res)
-        self.resman.update(self.game_data)
         if self.get_config(
                 section="world", parameter="trade_for_premium", default=False
         ) and self.get_village_config(
             self.village_id, parameter="trade_for_premium", default=False
         ):
+            # the premium exchange needs the resources after recruiting and trading
+            res = self.wrapper.get_action(village_id=self.village_id, action="overview")
+            self.game_data = Extractor.game_state(res)
+            self.resman.update(self.game_data)
             # Set the parameter correctly when the config says so.
             self.resman.do_premium_trade = True
             self.resman.do_premium_stuff()
@@ -549,6 +578,8 @@ class Village:
     def run(self, config=None, first_run=False):
         # setup and check if village still exists / is accessible
         self.config = config
+        # the executor thread might have run another village before
+        self.wrapper.reset_pipeline()
         self.wrapper.delay = self.get_config(
             section="bot", parameter="delay_factor", default=1.0
         )
@@ -577,13 +608,17 @@ class Village:
         self.update_pre_run()
 
         self.setup_defence_manager(data=data)
-        self.run_quest_actions(config=config)
+        self.run_quest_actions(config=config, data=data)
 
         self.run_builder()
         self.units_get_template()
         self.set_unit_wanted_levels()
 
-        self.units.update_totals()
+        # the building manager read the resources after its changes this cycle,
+        # when it did not run (disabled builder) the state from the start of the run is used
+        self.units.update_totals(
+            overview=self.overview, game_state=self.builder.game_state or self.game_data
+        )
         self.run_unit_upgrades()
         self.run_snob_recruit()
         self.do_recruit()
@@ -618,8 +653,14 @@ class Village:
             self.village_id, data_type="village.config", data=json.dumps(vdata)
         )
 
-    def get_quests(self):
-        result = Extractor.get_quests(self.wrapper.last_response)
+    def get_quests(self, data=None):
+        """
+        Completes a finished quest, the quests are read from the village screen of this run
+        """
+        if data is None:
+            # the run started from the overview ingestion, which does not request the village screen
+            data = self.wrapper.get_action(village_id=self.village_id, action="overview")
+        result = Extractor.get_quests(data) if data else None
         if result:
             qres = self.wrapper.get_api_action(
                 action="quest_complete",
@@ -678,4 +719,4 @@ class Village:
             "under_attack": self.def_man.under_attack,
             "last_run": int(time.time()),
         }
-        FileManager.save_json_file(village_entry, f"cache/managed/{self.village_id}.json")
+        FileManager.queue_json_file(village_entry, f"cache/managed/{self.village_id}.json")
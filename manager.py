@@ -1,6 +1,5 @@
 import json
 import logging
-import os
 import sys
 
 from game.attack import AttackCache
@@ -11,16 +10,22 @@ class VillageManager:
     @staticmethod
     def farm_manager(verbose=False, clean_reports=False):
         logger = logging.getLogger("FarmManager")
-        with open("config.json", "r") as f:
+        with open("config.json", "r", encoding="utf-8") as f:
             config = json.load(f)
 
         if verbose:
             logger.info("Villages: %d", len(config["villages"]))
+        retention_days = config["farms"].get("report_retention_days", 0)
+        if retention_days:
+            expired = ReportCache.expire(retention_days * 86400)
+            if expired:
+                logger.info("Removed %d reports older than %d days", expired, retention_days)
         attacks = AttackCache.cache_grab()
-        reports = ReportCache.cache_grab()
+        # only attack reports are used, the type in the archive index avoids decoding the others
+        reports = ReportCache.cache_grab(type="attack")
 
         if verbose:
-            logger.info("Reports: %d", len(reports))
+            logger.info("Attack reports: %d", len(reports))
             logger.info("Farms: %d", len(attacks))
         t = {"wood": 0, "iron": 0, "stone": 0}
         for farm in attacks:
@@ -99,16 +104,8 @@ class VillageManager:
             logger.info("Total loot: %s" % t)
 
         if clean_reports:
-            list_of_files = sorted(["./cache/reports/" + f for f in os.listdir("./cache/reports/")],
-                                   key=os.path.getctime)
-
-            logger.info(f"Found {len(list_of_files)} files")
-
-            while len(list_of_files) > clean_reports:
-                oldest_file = list_of_files.pop(0)
-                logger.info(f"Delete old report ({oldest_file})")
-                os.remove(os.path.abspath(oldest_file))
-
+            removed = ReportCache.trim(clean_reports)
+            logger.info(f"Deleted {removed} old reports")
 
 if __name__ == "__main__":
     logging.basicConfig(stream=sys.stdout)
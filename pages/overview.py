@@ -1,10 +1,12 @@
 import dataclasses
 import re
-from typing import Dict, Optional, Tuple
+import time
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple
 
-from bs4 import BeautifulSoup
 from requests import Response
 
+from core.extractors import Extractor
 from core.request import WebWrapper
 
 
@@ -203,6 +205,98 @@ class WorldSettings:
     quests: bool = Optional[bool]
 
 
+class ProductionTableParser(HTMLParser):
+    """
+    Event based parser of the production table, completed rows are collected as lists of cells
+    Every cell is a (has_content, text, data_id) tuple, no document tree is built
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows: List[List[Tuple[bool, str, Optional[str]]]] = []
+        self.done = False
+        self._depth = 0
+        self._row = None
+        self._cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "table":
+            if self._depth or dict(attrs).get("id") == "production_table":
+                self._depth += 1
+            return
+        if self._depth != 1:
+            if self._cell is not None:
+                self._cell[0] = True
+            return
+        if tag == "tr":
+            # closing tags of rows and cells are optional in html
+            self._end_row()
+            self._row = []
+        elif tag == "td" and self._row is not None:
+            self._end_cell()
+            self._cell = [False, [], None]
+        elif self._cell is not None:
+            self._cell[0] = True
+            if self._cell[2] is None:
+                for name, value in attrs:
+                    if name == "data-id":
+                        self._cell[2] = value
+                        break
+
+    def handle_endtag(self, tag):
+        if self.done or not self._depth:
+            return
+        if tag == "table":
+            if self._depth == 1:
+                self._end_row()
+            self._depth -= 1
+            self.done = self._depth == 0
+        elif self._depth != 1:
+            return
+        elif tag == "td":
+            self._end_cell()
+        elif tag == "tr":
+            self._end_row()
+
+    def _end_cell(self):
+        if self._cell is not None:
+            self._row.append((self._cell[0], "".join(self._cell[1]), self._cell[2]))
+            self._cell = None
+
+    def _end_row(self):
+        self._end_cell()
+        if self._row:
+            self.rows.append(self._row)
+        self._row = None
+
+    def handle_data(self, data):
+        if self._cell is not None:
+            self._cell[0] = True
+            self._cell[1].append(data)
+
+
+def iter_production_table(text: str, chunk_size: int = 16384) -> Iterator[List[Tuple[bool, str, Optional[str]]]]:
+    """
+    Streams the rows of the production table
+    Parsing starts at the table and stops at its end, the rest of the page is never tokenized
+    """
+    marker = text.find('id="production_table"')
+    if marker == -1:
+        return
+    start = text.rfind("<table", 0, marker)
+    parser = ProductionTableParser()
+    position = start
+    while position < len(text) and not parser.done:
+        parser.feed(text[position:position + chunk_size])
+        position += chunk_size
+        yield from parser.rows
+        parser.rows = []
+    parser.close()
+    yield from parser.rows
+
+
 class OverviewPage:
     """Represents the overview page with village data and world options."""
 
@@ -216,9 +310,6 @@ class OverviewPage:
         self.wrapper: WebWrapper = wrapper
         self.world_settings: WorldSettings = WorldSettings()
         self.result_get: Response = self._get_overview_villages_data()
-        self.soup = BeautifulSoup(self.result_get.text, "html.parser")
-        self.header_info = self.soup.find("table", id="header_info")
-        self.production_table = self.soup.find("table", id="production_table")
         self.villages_data: Dict[str, Village] = {}
         self.parse_production_table()
         self.parse_header_info()
@@ -229,27 +320,28 @@ class OverviewPage:
 
     def parse_production_table(self):
         """Parse the production table to extract village data."""
-        if self.production_table:
-            rows = self.production_table.find_all("tr")
-            for row in rows:
-                if row.find_all("td"):
-                    cells = row.find_all("td")
-                    idx_offset = 1 if len(cells[0].contents) == 0 else 0  # Compatibility with premium account
-                    village_id = cells[idx_offset].contents[1].attrs["data-id"]
-
-                    name, coordinates, continent = self._extract_name_cords_continent(
-                        cells[idx_offset].text.strip()
-                    )
-                    points = cells[1 + idx_offset].text.strip()
-                    resources = cells[2 + idx_offset].text.strip()
-                    storage_capacity = cells[3 + idx_offset].text.strip()
-
-                    storage = Storage(resources, storage_capacity)
-                    farm = Farm(cells[4 + idx_offset].text.strip())
-                    village = Village(
-                        village_id, name, coordinates, continent, points, storage, farm
-                    )
-                    self.villages_data[village_id] = village
+        for village in OverviewPage.iter_villages(self.result_get.text):
+            self.villages_data[village.village_id] = village
+
+    @staticmethod
+    def iter_villages(text: str) -> Iterator[Village]:
+        """Yield the villages of the production table row by row."""
+        for cells in iter_production_table(text):
+            idx_offset = 1 if not cells[0][0] else 0  # Compatibility with premium account
+            village_id = cells[idx_offset][2]
+
+            name, coordinates, continent = OverviewPage._extract_name_cords_continent(
+                cells[idx_offset][1].strip()
+            )
+            points = cells[1 + idx_offset][1].strip()
+            resources = cells[2 + idx_offset][1].strip()
+            storage_capacity = cells[3 + idx_offset][1].strip()
+
+            storage = Storage(resources, storage_capacity)
+            farm = Farm(cells[4 + idx_offset][1].strip())
+            yield Village(
+                village_id, name, coordinates, continent, points, storage, farm
+            )
 
     def parse_header_info(self) -> None:
         """Parse header information to get world options."""
@@ -271,3 +363,223 @@ class OverviewPage:
             return name, coordinates, continent
         else:
             print("Invalid village string format. Skipping village...")
+
+
+class VillageOverview:
+    """Everything the combined overview screens know about a single village."""
+
+    def __init__(
+            self,
+            village: Village,
+            player: Optional[dict] = None,
+            fetched_at: float = 0.0,
+            session: Optional[dict] = None,
+    ):
+        """
+        Initializes a VillageOverview object.
+
+        Args:
+            village (Village): The village from the production table.
+            player (dict): The player section of the game state.
+            fetched_at (float): Timestamp of the overview request.
+            session (dict): The csrf token and link base of the overview page.
+        """
+        self.village = village
+        self.player = player
+        self.session = session or {}
+        self.fetched_at = fetched_at
+        self.units_home: Optional[Dict[str, int]] = None
+        self.units_total: Optional[Dict[str, int]] = None
+        self.buildings: Optional[Dict[str, int]] = None
+        self.incomings: Optional[int] = None
+        # the game state is only valid until the village changes something
+        self.state_used = False
+
+    def is_fresh(self, max_age: int) -> bool:
+        """Check if the overview data is recent enough to replace the village requests."""
+        return self.fetched_at + max_age > time.time()
+
+    def game_state(self) -> dict:
+        """
+        Build a (partial) game state from the overview data.
+
+        Returns:
+            dict: The village and player data in the same format as TribalWars.updateGameData.
+        """
+        village = self.village
+        state = {
+            "player": self.player or {},
+            "village": {
+                "id": int(village.village_id),
+                "name": village.village_name,
+                "x": village.coordinates.x,
+                "y": village.coordinates.y,
+                "points": village.points,
+                "wood": village.storage.wood,
+                "stone": village.storage.stone,
+                "iron": village.storage.iron,
+                "storage_max": village.storage.capacity,
+                "pop": village.farm.current,
+                "pop_max": village.farm.maximum,
+            },
+        }
+        if self.buildings:
+            state["village"]["buildings"] = dict(self.buildings)
+        if self.session.get("csrf"):
+            state["csrf"] = self.session["csrf"]
+        if self.session.get("link_base_pure"):
+            # the link base of the overview page points to the village that was active there
+            state["link_base_pure"] = re.sub(
+                r"village=\d+", f"village={village.village_id}", self.session["link_base_pure"]
+            )
+        return state
+
+    def is_complete(self) -> bool:
+        """Check if the overview holds everything a village needs at the start of its run."""
+        return self.player is not None and self.incomings is not None
+
+
+class OverviewIngestion:
+    """
+    Parses the combined overview screens once per cycle for all villages.
+
+    Most of these screens require a premium account, modes that are not available are remembered
+    and the villages fall back to their own requests.
+    """
+
+    modes = {
+        "units": "game.php?screen=overview_villages&mode=units&type=complete",
+        "buildings": "game.php?screen=overview_villages&mode=buildings",
+        "incomings": "game.php?screen=overview_villages&mode=incomings&subtype=attacks",
+    }
+
+    def __init__(self, wrapper, overview_page: OverviewPage, unavailable: Optional[set] = None):
+        """
+        Initializes an OverviewIngestion object.
+
+        Args:
+            wrapper: The wrapper object for making HTTP requests.
+            overview_page (OverviewPage): The production overview of this cycle.
+            unavailable (set): Modes that did not return their table in an earlier cycle,
+                new failures are added to it.
+        """
+        self.wrapper: WebWrapper = wrapper
+        self.overview_page = overview_page
+        self.unavailable = unavailable if unavailable is not None else set()
+        self.fetched_at = time.time()
+        game_state = Extractor.game_state(overview_page.result_get) if overview_page.result_get else None
+        self.player = game_state.get("player") if game_state else None
+        session = {
+            key: game_state[key] for key in ("csrf", "link_base_pure") if game_state and game_state.get(key)
+        }
+        self.villages: Dict[str, VillageOverview] = {
+            village_id: VillageOverview(village, player=self.player, fetched_at=self.fetched_at, session=session)
+            for village_id, village in overview_page.villages_data.items()
+        }
+
+    def ingest(self, modes=("units", "buildings", "incomings")) -> None:
+        """
+        Fetch and parse the requested overview modes.
+
+        Args:
+            modes: The overview modes to ingest.
+        """
+        for mode in modes:
+            if mode not in self.modes or mode in self.unavailable:
+                continue
+            if mode == "incomings" and self.player and str(self.player.get("incomings", "")) == "0":
+                # Nothing incoming on the whole account, no need to look
+                for entry in self.villages.values():
+                    entry.incomings = 0
+                continue
+            result = self.wrapper.get_url(self.modes[mode])
+            if not result:
+                continue
+            if not getattr(self, f"parse_{mode}")(result.text):
+                self.unavailable.add(mode)
+
+    def get(self, village_id: str) -> Optional[VillageOverview]:
+        """Get the overview data of a single village."""
+        return self.villages.get(str(village_id))
+
+    @staticmethod
+    def _table(text: str, table_id: str) -> Optional[str]:
+        """Get the contents of a table by its id."""
+        start = text.find(f'id="{table_id}"')
+        if start == -1:
+            return None
+        end = text.find("</table>", start)
+        return text[start:end if end != -1 else len(text)]
+
+    @staticmethod
+    def _cell_number(cell: str) -> int:
+        """Read the number from a table cell (ignoring markup and thousand separators)."""
+        digits = "".join(c for c in re.sub(r"<[^>]+>", "", cell) if c.isdigit())
+        return int(digits) if digits else 0
+
+    def parse_units(self, text: str) -> bool:
+        """Parse the units overview (own units at home and total units per village)."""
+        table = self._table(text, "units_table")
+        if not table:
+            return False
+        header_end = table.find("</thead>")
+        header = table[:header_end] if header_end != -1 else table[:table.find("</tr>")]
+        units = []
+        for unit in re.findall(r'unit_(\w+?)(?:@2x)?\.(?:png|webp)', header):
+            if unit not in units:
+                units.append(unit)
+        for body in re.findall(r'(?s)<tbody[^>]*>(.+?)</tbody>', table):
+            village_id = re.search(r'data-id="(\d+)"', body)
+            if not village_id or village_id.group(1) not in self.villages:
+                continue
+            rows = []
+            for row in re.findall(r'(?s)<tr[^>]*>(.+?)</tr>', body):
+                cells = re.findall(r'(?s)<td class="unit-item[^"]*"[^>]*>(.*?)</td>', row)
+                if len(cells) == len(units):
+                    rows.append([self._cell_number(cell) for cell in cells])
+            # own units, in village, outwards, in transit, total
+            if len(rows) != 5:
+                continue
+            entry = self.villages[village_id.group(1)]
+            entry.units_home = dict(zip(units, rows[0]))
+            entry.units_total = dict(zip(units, rows[4]))
+        return True
+
+    def parse_buildings(self, text: str) -> bool:
+        """Parse the buildings overview (building levels per village)."""
+        table = self._table(text, "buildings_table")
+        if not table:
+            return False
+        for row in re.findall(r'(?s)<tr[^>]*>(.+?)</tr>', table):
+            village_id = re.search(r'data-id="(\d+)"', row)
+            if not village_id or village_id.group(1) not in self.villages:
+                continue
+            levels = re.findall(r'(?s)<td class="[^"]*\bb_(\w+)[^"]*"[^>]*>(.*?)</td>', row)
+            if levels:
+                self.villages[village_id.group(1)].buildings = {
+                    building: self._cell_number(cell) for building, cell in levels
+                }
+        return True
+
+    def _count_per_village(self, text: str, table_id: str, link: str) -> Optional[Dict[str, int]]:
+        """Count the table rows per village, the village is detected by a link in the row."""
+        table = self._table(text, table_id)
+        if table is None:
+            return None
+        counts = {village_id: 0 for village_id in self.villages}
+        for row in re.findall(r'(?s)<tr[^>]*>(.+?)</tr>', table):
+            village_id = re.search(link, row)
+            if village_id and village_id.group(1) in counts:
+                counts[village_id.group(1)] += 1
+        return counts
+
+    def parse_incomings(self, text: str) -> bool:
+        """Parse the incoming attacks overview (attacks per target village)."""
+        counts = self._count_per_village(
+            text, "incomings_table", r'village=(\d+)(?:&amp;|&)screen=overview"'
+        )
+        if counts is None:
+            return False
+        for village_id, amount in counts.items():
+            self.villages[village_id].incomings = amount
+        return True
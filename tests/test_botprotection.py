@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+from requests.adapters import BaseAdapter
+
+from core.botprotection import PROTECTION_MARKER, BotProtection
+from core.recorder import build_response
+from core.request import WebWrapper
+
+ENDPOINT = "https://nl01.tribalwars.nl/"
+
+
+@pytest.fixture
+def protection(tmp_path):
+    return BotProtection(
+        status_file=str(tmp_path / "bot_protection.json"), resume_flag=str(tmp_path / "resume"), poll_interval=0.01
+    )
+
+
+def status(protection):
+    with open(protection.status_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def signal_resume(protection):
+    with open(protection.resume_flag, "w", encoding="utf-8") as f:
+        f.write("")
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_detect():
+    assert BotProtection.detect(f'<div id="botprotection_quest" {PROTECTION_MARKER}></div>')
+    assert not BotProtection.detect("<html><body>Overview</body></html>")
+
+
+def test_pause_and_resume(protection):
+    assert protection.pause("game.php?screen=main")
+    assert protection.paused
+    assert status(protection)["state"] == "paused"
+    assert status(protection)["url"] == "game.php?screen=main"
+    # pipelines that hit the captcha at the same time do not pause again
+    assert not protection.pause("game.php?screen=barracks")
+    assert protection.pauses == 1
+
+    assert protection.resume()
+    assert not protection.paused
+    assert status(protection) == {"state": "running", "paused_at": None, "url": None, "pauses": 1}
+    assert not protection.resume()
+
+
+def test_resume_flag_file(protection):
+    protection.pause()
+    assert not protection.check_resume()
+    signal_resume(protection)
+    assert protection.check_resume()
+    assert not protection.paused
+    assert not os.path.exists(protection.resume_flag)
+
+
+def test_flag_of_an_earlier_pause_does_not_count(protection):
+    signal_resume(protection)
+    protection.pause()
+    assert not protection.check_resume()
+    assert protection.paused
+
+
+def test_wait_does_not_block_while_running(protection):
+    assert protection.wait() == 0.0
+
+
+def test_wait_parks_every_pipeline_until_the_flag(protection):
+    protection.pause()
+    done = []
+    pipelines = [threading.Thread(target=lambda: done.append(protection.wait())) for _ in range(3)]
+    for pipeline in pipelines:
+        pipeline.start()
+    time.sleep(0.1)
+    assert done == []
+
+    signal_resume(protection)
+    for pipeline in pipelines:
+        pipeline.join(timeout=5)
+    assert len(done) == 3
+    assert all(waited > 0 for waited in done)
+    assert status(protection)["state"] == "running"
+
+
+class CaptchaWorld(BaseAdapter):
+    """
+    Answers the first request with the captcha page, every other request with a normal page
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self.lock:
+            self.urls.append(request.url)
+            first = len(self.urls) == 1
+        body = f'<div id="botprotection_quest" {PROTECTION_MARKER}></div>' if first else "<p>village</p>"
+        content = f"<html><body>{body}</body></html>".encode("utf-8")
+        return build_response(request, 200, content, {"content-type": "text/html; charset=UTF-8"})
+
+    def close(self):
+        pass
+
+
+def test_captcha_page_parks_the_other_pipelines(protection):
+    wrapper = WebWrapper(ENDPOINT, endpoint=ENDPOINT + "game.php")
+    world = CaptchaWorld()
+    wrapper.replay(adapter=world)
+    wrapper.pacer.sleep = lambda seconds: None
+    wrapper.protection = protection
+    pages = {}
+
+    def pipeline(screen):
+        pages[screen] = wrapper.get_url(f"game.php?village=1&screen={screen}")
+
+    first = threading.Thread(target=pipeline, args=("main",))
+    first.start()
+    wait_until(lambda: protection.paused)
+    second = threading.Thread(target=pipeline, args=("barracks",))
+    second.start()
+    time.sleep(0.1)
+    # neither the pipeline that hit the captcha nor the other one sends anything while paused
+    assert len(world.urls) == 1
+    assert pages == {}
+
+    signal_resume(protection)
+    first.join(timeout=5)
+    second.join(timeout=5)
+    assert PROTECTION_MARKER not in pages["main"].text
+    assert "village" in pages["barracks"].text
+    assert sorted(url.rsplit("=", 1)[1] for url in world.urls) == ["barracks", "main", "main"]
@@ -0,0 +1,161 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+
+import pytest
+
+from core.cachestore import CacheStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache.db")
+
+
+@pytest.fixture
+def store(path):
+    store = CacheStore(path, migrate=False)
+    yield store
+    store.close()
+
+
+def stored_keys(path, table):
+    connection = sqlite3.connect(path)
+    try:
+        return {key for key, in connection.execute(f"SELECT key FROM {table}")}
+    finally:
+        connection.close()
+
+
+def village(owner, x=500, y=500):
+    return {"owner": owner, "tribe": "1", "location": [x, y], "name": f"Village {owner}"}
+
+
+def test_buffered_writes_are_read_before_the_flush(store, path):
+    store.set("villages", 1, village("10"))
+    assert store.get("villages", "1") == village("10")
+    assert stored_keys(path, "villages") == set()
+    store.flush()
+    assert stored_keys(path, "villages") == {"1"}
+    assert store.get("villages", 2) is None
+
+
+def test_full_buffer_is_committed(path):
+    store = CacheStore(path, migrate=False, batch_size=3)
+    for key in range(3):
+        store.set("attacks", key, {"safe": True, "last_attack": key})
+    assert stored_keys(path, "attacks") == {"0", "1", "2"}
+    store.close()
+
+
+def test_grab_filters_on_the_indexed_columns(store):
+    store.set_many("villages", [(1, village("10", 501)), (2, village("11", 502)), (3, village("10", 503))])
+    assert set(store.grab("villages", owner="10")) == {"1", "3"}
+    assert set(store.grab("villages", owner="10", x=503)) == {"3"}
+    assert len(store.grab("villages")) == 3
+    with pytest.raises(KeyError):
+        store.grab("villages", name="Village 10")
+
+
+def test_indexed_columns_follow_the_entry(store, path):
+    store.set("attacks", 1, {"safe": True, "high_profile": False, "last_attack": 100})
+    store.set("attacks", 1, {"safe": False, "high_profile": True, "last_attack": 200})
+    store.flush()
+    connection = sqlite3.connect(path)
+    row = connection.execute("SELECT safe, high_profile, low_profile, last_attack FROM attacks").fetchall()
+    connection.close()
+    assert row == [(0, 1, 0, 200)]
+
+
+def test_trim_keeps_the_latest_entries(store):
+    for key in range(10):
+        store.set("attacks", key, {"last_attack": key})
+    assert store.trim("attacks", 4) == 6
+    assert set(store.grab("attacks")) == {"6", "7", "8", "9"}
+    assert store.get("attacks", 0) is None
+
+
+def test_delete(store):
+    store.set_many("villages", [(1, village("10")), (2, village("11"))])
+    assert store.get("villages", 1) is not None
+    store.delete("villages", [1])
+    assert store.get("villages", 1) is None
+    assert store.count("villages") == 1
+
+
+def write_cache_files(directory, entries):
+    os.makedirs(directory, exist_ok=True)
+    for key, entry in entries.items():
+        with open(os.path.join(directory, f"{key}.json"), "w", encoding="utf-8") as f:
+            f.write(entry if isinstance(entry, str) else json.dumps(entry))
+
+
+def test_cache_directory_is_migrated_once(store, path, tmp_path):
+    directory = str(tmp_path / "villages")
+    write_cache_files(directory, {"1": village("10"), "2": village("11"), "broken": "{not json", "3": village("12")})
+    with open(os.path.join(directory, "notes.txt"), "w", encoding="utf-8") as f:
+        f.write("ignored")
+    # entries that are already in the store are newer than the files
+    store.set("villages", 3, village("99"))
+    store.flush()
+
+    assert store.migrate("villages", directory) == 3
+    assert store.get("villages", 1) == village("10")
+    assert store.get("villages", 3)["owner"] == "99"
+    assert store.count("villages") == 3
+    # the files are left as a backup
+    assert sorted(os.listdir(directory)) == ["1.json", "2.json", "3.json", "broken.json", "notes.txt"]
+
+    connection = sqlite3.connect(path)
+    markers = [key for key, in connection.execute("SELECT key FROM meta")]
+    connection.close()
+    assert markers == ["migrated:villages"]
+
+    write_cache_files(directory, {"4": village("13")})
+    assert store.migrate("villages", directory) == 0
+    # another connection (the web manager) sees the marker as well
+    other = CacheStore(path, migrate=False)
+    assert other.migrate("villages", directory) == 0
+    assert other.get("villages", 4) is None
+    other.close()
+
+
+def test_missing_directory_is_marked_as_migrated(store, tmp_path):
+    assert store.migrate("attacks", str(tmp_path / "attacks")) == 0
+    write_cache_files(str(tmp_path / "attacks"), {"1": {"safe": True}})
+    assert store.migrate("attacks", str(tmp_path / "attacks")) == 0
+
+
+def test_second_connection_reads_committed_entries(store, path):
+    reader = CacheStore(path, migrate=False)
+    store.set("villages", 1, village("10"))
+    assert reader.grab("villages") == {}
+    store.flush()
+    assert reader.grab("villages") == {"1": village("10")}
+    reader.close()
+
+
+def write_from_process(path, start, amount):
+    store = CacheStore(path, migrate=False, batch_size=50)
+    for key in range(start, start + amount):
+        store.set("attacks", key, {"safe": True, "last_attack": key})
+    store.close()
+
+
+def test_two_processes_share_the_database(store, path):
+    context = multiprocessing.get_context("spawn")
+    writer = context.Process(target=write_from_process, args=(path, 1000, 200))
+    writer.start()
+    # this process keeps writing while the other one commits its batches
+    for key in range(200):
+        store.set("attacks", key, {"safe": False, "last_attack": key})
+        if key % 50 == 0:
+            store.flush()
+    writer.join(60)
+    assert writer.exitcode == 0
+    store.flush()
+    entries = store.grab("attacks")
+    assert len(entries) == 400
+    assert entries["1000"] == {"safe": True, "last_attack": 1000}
+    assert set(store.grab("attacks", safe=0)) == {str(key) for key in range(200)}
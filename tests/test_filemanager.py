@@ -0,0 +1,229 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from core import filemanager
+from core.exceptions import InvalidJSONException
+from core.extractors import Extractor
+from core.filemanager import FileManager
+from core.lru import LRUCache
+
+
+ROOT = os.path.join(os.path.dirname(os.path.realpath(__file__)), "..")
+
+
+@pytest.fixture
+def folder(tmp_path, monkeypatch):
+    # the timer must not flush in the middle of a test
+    monkeypatch.setattr(FileManager, "flush_interval", 3600)
+    monkeypatch.setattr(FileManager, "cycle", None)
+    yield tmp_path
+    FileManager.flush()
+    FileManager.read_cache.clear()
+
+
+def test_files_are_decoded_strictly(folder):
+    path = folder / "raw.json"
+    path.write_bytes(b'{"name": "tab\there"}')
+    with pytest.raises(InvalidJSONException):
+        FileManager.load_json_file(str(path))
+    assert FileManager.load_json_file(str(path), strict=False) == {"name": "tab\there"}
+
+
+def test_game_pages_allow_control_characters():
+    page = '<script>TribalWars.updateGameData({"village": {"name": "tab\there"}});</script>'
+    assert Extractor.game_state(page)["village"]["name"] == "tab\there"
+
+
+def test_queued_write_is_read_before_the_flush(folder):
+    path = str(folder / "farm.json")
+    FileManager.queue_json_file({"safe": True}, path)
+    assert not os.path.exists(path)
+    assert FileManager.load_json_file(path) == {"safe": True}
+    FileManager.flush()
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"safe": True}
+
+
+def test_queued_writes_are_coalesced(folder, monkeypatch):
+    path = str(folder / "farm.json")
+    data = {"count": 1}
+    FileManager.queue_json_file(data, path)
+    # the data is encoded when it is queued
+    data["count"] = 2
+    FileManager.queue_json_file({"count": 3}, path)
+    writes = []
+    write_atomic = FileManager.write_atomic
+    monkeypatch.setattr(FileManager, "write_atomic", lambda *args: writes.append(args) or write_atomic(*args))
+    FileManager.flush()
+    assert len(writes) == 1
+    assert FileManager.load_json_file(path) == {"count": 3}
+
+
+def test_direct_write_replaces_an_older_queued_write(folder):
+    path = str(folder / "config.json")
+    FileManager.queue_json_file({"version": 1}, path)
+    FileManager.save_json_file({"version": 2}, path)
+    FileManager.flush()
+    assert FileManager.load_json_file(path) == {"version": 2}
+
+
+def test_flush_replaces_the_file_atomically(folder, monkeypatch):
+    path = str(folder / "farm.json")
+    FileManager.save_json_file({"version": 1}, path)
+    replaced = []
+    replace = os.replace
+
+    def record(source, target):
+        replaced.append((source, target))
+        # the complete new content is on disk before it takes the place of the old file
+        with open(source, "rb") as f:
+            assert json.loads(f.read()) == {"version": 2}
+        with open(target, "rb") as f:
+            assert json.loads(f.read()) == {"version": 1}
+        replace(source, target)
+
+    monkeypatch.setattr(filemanager.os, "replace", record)
+    FileManager.queue_json_file({"version": 2}, path)
+    FileManager.flush()
+    assert len(replaced) == 1
+    assert os.path.dirname(replaced[0][0]) == str(folder)
+    assert os.listdir(folder) == ["farm.json"]
+
+
+def test_failed_write_keeps_the_old_file(folder, monkeypatch):
+    path = str(folder / "farm.json")
+    FileManager.save_json_file({"version": 1}, path)
+
+    def fail(source, target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(filemanager.os, "replace", fail)
+    FileManager.queue_json_file({"version": 2}, path)
+    FileManager.flush()
+    monkeypatch.undo()
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"version": 1}
+    # the temporary file is removed
+    assert os.listdir(folder) == ["farm.json"]
+
+
+def test_flush_runs_the_registered_buffers(folder, monkeypatch):
+    calls = []
+    monkeypatch.setattr(FileManager, "flush_callbacks", [])
+    FileManager.register_flush(lambda: calls.append(1))
+    FileManager.flush()
+    assert calls == [1]
+
+
+def test_queued_writes_are_written_at_exit(tmp_path):
+    path = str(tmp_path / "farm.json")
+    script = (
+        "from core.filemanager import FileManager\n"
+        "FileManager.flush_interval = 3600\n"
+        f"FileManager.queue_json_file({{'safe': True}}, {path!r})\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True, timeout=60)
+    with open(path, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"safe": True}
+
+
+def write(path, data, mtime_ns=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+class StatCounter:
+    """
+    Counts the os.stat calls of the read cache validation
+    """
+
+    def __init__(self, monkeypatch):
+        self.calls = 0
+        self.stat = os.stat
+        monkeypatch.setattr(filemanager.os, "stat", self)
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        return self.stat(*args, **kwargs)
+
+
+def test_unchanged_file_is_decoded_from_the_cache(folder):
+    path = str(folder / "village.json")
+    write(path, {"level": 1})
+    assert FileManager.load_json_file(path) == {"level": 1}
+    hits = FileManager.read_cache.hits
+    assert FileManager.load_json_file(path) == {"level": 1}
+    assert FileManager.read_cache.hits == hits + 1
+
+
+def test_changed_size_is_read_again(folder):
+    path = str(folder / "village.json")
+    write(path, {"level": 1}, mtime_ns=10 ** 18)
+    FileManager.load_json_file(path)
+    write(path, {"level": 10}, mtime_ns=10 ** 18)
+    assert FileManager.load_json_file(path) == {"level": 10}
+
+
+def test_changed_modification_time_is_read_again(folder):
+    path = str(folder / "village.json")
+    write(path, {"level": 1}, mtime_ns=10 ** 18)
+    FileManager.load_json_file(path)
+    # same size, only the modification time tells them apart
+    write(path, {"level": 2}, mtime_ns=10 ** 18 + 1)
+    assert FileManager.load_json_file(path) == {"level": 2}
+
+
+def test_files_are_checked_once_per_cycle(folder, monkeypatch):
+    path = str(folder / "config.json")
+    write(path, {"delay": 1}, mtime_ns=10 ** 18)
+    FileManager.new_cycle()
+    FileManager.load_json_file(path)
+    stats = StatCounter(monkeypatch)
+    write(path, {"delay": 2}, mtime_ns=10 ** 18 + 1)
+    # the edit is picked up in the next cycle, not halfway through this one
+    assert FileManager.load_json_file(path) == {"delay": 1}
+    assert stats.calls == 0
+
+    FileManager.new_cycle()
+    assert FileManager.load_json_file(path) == {"delay": 2}
+    checked = stats.calls
+    assert checked > 0
+    assert FileManager.load_json_file(path) == {"delay": 2}
+    assert stats.calls == checked
+
+
+def test_without_a_cycle_every_read_is_checked(folder, monkeypatch):
+    path = str(folder / "config.json")
+    write(path, {"delay": 1})
+    FileManager.load_json_file(path)
+    stats = StatCounter(monkeypatch)
+    FileManager.load_json_file(path)
+    FileManager.load_json_file(path)
+    assert stats.calls == 2
+
+
+def test_read_cache_is_limited_by_bytes(folder, monkeypatch):
+    monkeypatch.setattr(FileManager, "read_cache", LRUCache(max_bytes=100))
+    paths = [str(folder / f"{name}.json") for name in "abc"]
+    for path in paths:
+        write(path, {"padding": "x" * 30})
+        FileManager.load_json_file(path)
+    assert paths[0] not in FileManager.read_cache
+    assert FileManager.read_cache.size <= 100
+    # an evicted file is read from disk again
+    assert FileManager.load_json_file(paths[0]) == {"padding": "x" * 30}
+
+
+def test_removed_file_is_dropped_from_the_cache(folder):
+    path = str(folder / "village.json")
+    write(path, {"level": 1})
+    FileManager.load_json_file(path)
+    FileManager.remove_file(path)
+    assert path not in FileManager.read_cache
+    assert FileManager.load_json_file(path) is None
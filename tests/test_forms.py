@@ -0,0 +1,93 @@
+from core.extractors import COMMAND_FORM_ID, Extractor, form_fields
+
+
+def page(form, before="", after=""):
+    return f"<html><body>{before}{form}{after}</body></html>"
+
+
+def command_form(inputs):
+    return f'<form id="{COMMAND_FORM_ID}" action="/game.php?screen=place" method="post">{inputs}</form>'
+
+
+def test_canonical_hidden_inputs():
+    text = page(command_form(
+        '<input type="hidden" name="attack" value="true">'
+        '<input type="hidden" name="ch" value="5f1e:9a7c">'
+        '<input type="hidden" name="x" value="503">'
+    ))
+    assert Extractor.attack_form(text) == {"attack": "true", "ch": "5f1e:9a7c", "x": "503"}
+
+
+def test_attribute_order_and_quoting():
+    text = page(command_form(
+        '<input id="unit_input_spear" name="spear" type="text" value="" class="unitsInput">'
+        "<input value='7' name='sword' type='text'>"
+        '<input name=axe value=12>'
+        '<input type="HIDDEN" NAME="template_id" VALUE="3">'
+    ))
+    assert Extractor.attack_form(text) == {"spear": "", "sword": "7", "axe": "12", "template_id": "3"}
+
+
+def test_checkboxes_radios_and_disabled_inputs():
+    text = page(command_form(
+        '<input type="checkbox" name="save_default" value="1">'
+        '<input type="checkbox" name="checked_box" checked>'
+        '<input type="radio" name="mode" value="a">'
+        '<input type="radio" name="mode" value="b" checked="checked">'
+        '<input type="hidden" name="skipped" value="1" disabled>'
+        '<input type="text" name="kept" value="1" data-disabled="no">'
+    ))
+    assert Extractor.attack_form(text) == {"checked_box": "on", "mode": "b", "kept": "1"}
+
+
+def test_unsubmitted_types_and_submit_buttons():
+    text = page(command_form(
+        '<input type="button" name="button" value="x">'
+        '<input type="reset" name="reset" value="x">'
+        '<input type="file" name="file">'
+        '<input id="target_attack" class="btn" name="attack" type="submit" value="Attack">'
+        '<input id="target_support" class="btn" name="support" type="submit" value="Support">'
+        '<input id="troop_confirm_submit" class="btn" type="submit" value="Send attack">'
+    ))
+    assert Extractor.attack_form(text) == {"attack": "Attack", "support": "Support"}
+
+
+def test_html_entities_are_unescaped():
+    text = page(command_form(
+        '<input type="hidden" name="ch" value="5f1e:9a7c&amp;1">'
+        '<input type="hidden" name="a&amp;b" value="&quot;x&quot;">'
+    ))
+    assert Extractor.attack_form(text) == {"ch": "5f1e:9a7c&1", "a&b": '"x"'}
+
+
+def test_only_the_form_is_read():
+    before = '<form id="other"><input type="hidden" name="outside" value="1"></form>'
+    after = '<input type="text" name="search" value="">'
+    text = page(command_form('<input type="hidden" name="inside" value="1">'), before, after)
+    assert Extractor.attack_form(text) == {"inside": "1"}
+
+
+def test_without_the_form_every_input_is_used():
+    text = page('<input type="hidden" name="a" value="1"><input name="b" value="2">')
+    assert form_fields(text) == {"a": "1", "b": "2"}
+    assert form_fields(text, "missing-form") == {"a": "1", "b": "2"}
+
+
+def test_unclosed_form_reads_to_the_end():
+    text = f'<form id="{COMMAND_FORM_ID}"><input type="hidden" name="a" value="1"><input name="b" value="2">'
+    assert Extractor.attack_form(text) == {"a": "1", "b": "2"}
+
+
+def test_fake_world_rally_point_pages():
+    from benchmarks.forms import load_attacks
+
+    place, confirm = load_attacks(villages=1)[0]
+    place_form = Extractor.attack_form(place)
+    assert place_form["attack"] == "Attack"
+    assert place_form["spear"] == ""
+    assert "benchf0a1" in place_form
+    confirm_form = Extractor.attack_form(confirm)
+    assert confirm_form["ch"] == "5f1e:9a7c&1"
+    assert confirm_form["cb"] == ""
+    assert confirm_form["x"] == "503"
+    assert "save_default_attack_building" not in confirm_form
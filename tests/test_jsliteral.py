@@ -0,0 +1,58 @@
+import pytest
+
+from core import jsliteral
+
+
+def test_plain_json():
+    assert jsliteral.loads('{"a": 1, "b": [true, null, "x"]}') == {"a": 1, "b": [True, None, "x"]}
+
+
+def test_unquoted_keys_and_single_quotes():
+    assert jsliteral.loads("{village: {id: 12, name: 'Home'}, 5: 'five'}") == {
+        "village": {"id": 12, "name": "Home"},
+        "5": "five",
+    }
+
+
+def test_trailing_commas_comments_and_undefined():
+    text = """{
+        // the game writes comments in its scripts
+        a: [1, 2, 3,],
+        /* block comment */ b: undefined,
+    }"""
+    assert jsliteral.loads(text) == {"a": [1, 2, 3], "b": None}
+
+
+def test_strings_are_not_rewritten():
+    value = jsliteral.loads("""{text: 'key: value, undefined, // not a comment', other: "}{]["}""")
+    assert value == {"text": "key: value, undefined, // not a comment", "other": "}{]["}
+
+
+def test_escapes():
+    value = jsliteral.loads(r"""{a: 'it\'s', b: "tab\there", c: 'é\x41', d: "😀"}""")
+    assert value == {"a": "it's", "b": "tab\there", "c": "éA", "d": "\U0001F600"}
+
+
+def test_parse_stops_after_the_literal():
+    text = "TribalWars.updateGameData({player: {id: 1}}); var x = {y: 2};"
+    marker = "TribalWars.updateGameData("
+    value, end = jsliteral.parse(text, text.find(marker) + len(marker))
+    assert value == {"player": {"id": 1}}
+    assert text[end:] == "); var x = {y: 2};"
+
+
+def test_find():
+    text = "<script>Quests.setQuestData({1: {goals_completed: 2, goals_total: 2}});</script>"
+    assert jsliteral.find(text, "Quests.setQuestData(") == {"1": {"goals_completed": 2, "goals_total": 2}}
+    assert jsliteral.find(text, "Missing.marker(") is None
+
+
+def test_scalars():
+    assert jsliteral.loads("'single'") == "single"
+    assert jsliteral.loads("42") == 42
+
+
+@pytest.mark.parametrize("text", ["{a: 1", "[1, 2", "'open", "{a: 1} extra"])
+def test_invalid_literals(text):
+    with pytest.raises(ValueError):
+        jsliteral.loads(text)
@@ -0,0 +1,68 @@
+import pytest
+
+from core.lru import LRUCache
+
+
+def test_eviction_by_bytes_drops_the_least_recently_used():
+    cache = LRUCache(max_bytes=100)
+    cache.put("a", "A", size=40)
+    cache.put("b", "B", size=40)
+    assert cache.get("a") == "A"
+    cache.put("c", "C", size=40)
+    assert "b" not in cache
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.size == 80
+    assert cache.evictions == 1
+
+
+def test_large_entry_evicts_several():
+    cache = LRUCache(max_bytes=100)
+    for key in "abcd":
+        cache.put(key, key, size=25)
+    cache.put("e", "e", size=70)
+    assert list(cache.entries) == ["d", "e"]
+    assert cache.size == 95
+
+
+def test_entry_larger_than_the_limit_is_not_stored():
+    cache = LRUCache(max_bytes=100)
+    cache.put("a", "old", size=10)
+    cache.put("a", "new", size=150)
+    assert "a" not in cache
+    assert cache.size == 0
+
+
+def test_replacing_an_entry_updates_the_size():
+    cache = LRUCache(max_bytes=100)
+    cache.put("a", "A", size=60)
+    cache.put("a", "AA", size=30)
+    assert cache.size == 30
+    cache.pop("a")
+    assert cache.size == 0 and len(cache) == 0
+
+
+def test_eviction_by_entries():
+    cache = LRUCache(max_entries=2)
+    for key in "abc":
+        cache.put(key, key)
+    assert list(cache.entries) == ["b", "c"]
+
+
+def test_zero_limits_do_not_evict():
+    cache = LRUCache()
+    for key in range(1000):
+        cache.put(key, key, size=1024 * 1024)
+    assert len(cache) == 1000
+    assert cache.evictions == 0
+
+
+def test_rejected_entries_are_misses():
+    cache = LRUCache(max_bytes=100)
+    cache.put("a", "stale", size=10)
+    assert cache.get("a", validate=lambda value: value != "stale") is None
+    assert "a" not in cache and cache.size == 0
+    cache.put("a", "fresh", size=10)
+    assert cache.get("a", validate=lambda value: value != "stale") == "fresh"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["hit_rate"] == pytest.approx(0.5)
@@ -0,0 +1,92 @@
+import pytest
+
+from benchmarks.fakeserver import FakeWorld
+from core.extractors import Extractor
+from core.request import WebWrapper
+from pages.overview import OverviewIngestion, OverviewPage
+
+ENDPOINT = "https://bench.tribalwars.local/game.php"
+
+
+def connect(world):
+    wrapper = WebWrapper(ENDPOINT, server="bench", endpoint=ENDPOINT)
+    wrapper.replay(adapter=world)
+    # the world answers at once, the pacer does not have to space the requests
+    wrapper.pacer.sleep = lambda seconds: None
+    return wrapper
+
+
+@pytest.fixture
+def world():
+    return FakeWorld(villages=4, padding=0)
+
+
+@pytest.fixture
+def ingestion(world):
+    wrapper = connect(world)
+    ingestion = OverviewIngestion(wrapper, OverviewPage(wrapper))
+    ingestion.ingest()
+    return ingestion
+
+
+def test_production_table_matches_the_village_pages(world, ingestion):
+    wrapper = ingestion.wrapper
+    for village_id in world.villages:
+        state = Extractor.game_state(wrapper.get_action(village_id, "overview"))["village"]
+        overview = ingestion.get(village_id).game_state()["village"]
+        for key in ("id", "name", "x", "y", "points", "wood", "stone", "iron", "storage_max", "pop", "pop_max"):
+            assert overview[key] == state[key], key
+
+
+def test_units_match_the_rally_point(world, ingestion):
+    wrapper = ingestion.wrapper
+    for village_id in world.villages:
+        page = wrapper.get_url(f"game.php?village={village_id}&screen=place&mode=units&display=units")
+        entry = ingestion.get(village_id)
+        assert {k: v for k, v in entry.units_home.items() if v > 0} == dict(Extractor.units_in_village(page))
+        assert entry.units_total == Extractor.units_in_total(page)
+
+
+def test_buildings_match_the_game_state(world, ingestion):
+    wrapper = ingestion.wrapper
+    for village_id in world.villages:
+        state = Extractor.game_state(wrapper.get_action(village_id, "main"))["village"]
+        assert ingestion.get(village_id).buildings == {k: int(v) for k, v in state["buildings"].items()}
+
+
+def test_no_incomings_on_the_account_skips_the_request(world, ingestion):
+    assert world.requests["overview_villages"] == 3
+    assert all(entry.incomings == 0 for entry in ingestion.villages.values())
+    assert all(entry.is_complete() for entry in ingestion.villages.values())
+
+
+def test_incomings_are_counted_per_target(world, ingestion):
+    first, second, _, _ = world.villages
+    rows = "".join(
+        f'<tr><td><a href="/game.php?village={target}&amp;screen=overview">Target</a></td></tr>'
+        for target in (first, first, second)
+    )
+    assert ingestion.parse_incomings(f'<table id="incomings_table"><tr><th>Command</th></tr>{rows}</table>')
+    counts = {village_id: entry.incomings for village_id, entry in ingestion.villages.items()}
+    assert counts == {village_id: 0 for village_id in world.villages} | {first: 2, second: 1}
+
+
+def test_unavailable_modes_are_kept_by_the_caller():
+    world = FakeWorld(villages=2, premium=False, padding=0)
+    wrapper = connect(world)
+    unavailable = set()
+    OverviewIngestion(wrapper, OverviewPage(wrapper), unavailable).ingest()
+    assert unavailable == {"units", "buildings"}
+    requests = world.requests["overview_villages"]
+
+    wrapper.page_cache.clear()
+    OverviewIngestion(wrapper, OverviewPage(wrapper), unavailable).ingest()
+    # only the production overview of the new ingestion
+    assert world.requests["overview_villages"] == requests + 1
+
+
+def test_unavailable_modes_are_not_shared():
+    world = FakeWorld(villages=2, premium=False, padding=0)
+    wrapper = connect(world)
+    OverviewIngestion(wrapper, OverviewPage(wrapper)).ingest()
+    assert OverviewIngestion(wrapper, OverviewPage(wrapper)).unavailable == set()
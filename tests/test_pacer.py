@@ -0,0 +1,115 @@
+import threading
+
+import pytest
+
+from core.pacer import FixedDelayPacer, Pacer, TokenBucketPacer, create_pacer
+
+
+class Clock:
+    """
+    Virtual clock, sleeping moves the time forward without waiting
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def bucket(**kwargs):
+    kwargs.setdefault("jitter", 0.0)
+    pacer = TokenBucketPacer(**kwargs)
+    pacer.clock = Clock()
+    pacer.sleep = lambda seconds: None
+    return pacer
+
+
+def test_rate_follows_the_delay_factor():
+    assert bucket(delay=1.0).rate() == pytest.approx(1 / 5)
+    assert bucket(delay=2.0).rate() == pytest.approx(1 / 10)
+    assert bucket(delay=2.0, max_per_minute=30).rate() == pytest.approx(0.5)
+
+
+def test_burst_is_sent_without_waiting():
+    pacer = bucket(max_per_minute=60, burst=3)
+    assert [pacer.acquire() for _ in range(5)] == [0.0, 0.0, 0.0, pytest.approx(1.0), pytest.approx(2.0)]
+
+
+def test_request_classes_cost_their_share():
+    pacer = bucket(max_per_minute=60, burst=1)
+    assert pacer.acquire("page") == 0.0
+    assert pacer.acquire("ajax") == pytest.approx(0.5)
+    assert pacer.acquire("command") == pytest.approx(2.0)
+    assert pacer.acquire("confirm") == pytest.approx(3.0)
+    # unknown classes cost as much as a page
+    assert pacer.acquire("unknown") == pytest.approx(4.0)
+
+
+def test_configured_costs_replace_the_defaults():
+    pacer = bucket(max_per_minute=60, burst=1, costs={"ajax": 0.0, "command": 4.0})
+    assert pacer.acquire("page") == 0.0
+    assert pacer.acquire("ajax") == 0.0
+    assert pacer.acquire("command") == pytest.approx(4.0)
+
+
+def test_tokens_refill_up_to_the_burst():
+    pacer = bucket(max_per_minute=60, burst=2)
+    pacer.acquire()
+    pacer.acquire()
+    pacer.clock.now = 100.0
+    assert pacer.acquire() == 0.0
+    assert pacer.acquire() == 0.0
+    assert pacer.acquire() == pytest.approx(1.0)
+
+
+def test_account_rate_holds_for_concurrent_pipelines():
+    per_minute, burst, threads, requests = 60, 3, 8, 25
+    pacer = bucket(max_per_minute=per_minute, burst=burst)
+    waits = []
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def pipeline():
+        start.wait()
+        for _ in range(requests):
+            wait = pacer.acquire("page")
+            with lock:
+                waits.append(wait)
+
+    workers = [threading.Thread(target=pipeline) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # every send slot is handed out once, no matter which pipeline asked for it
+    total = threads * requests
+    assert sorted(waits) == pytest.approx([0.0] * burst + [float(n) for n in range(1, total - burst + 1)])
+    # no minute has more requests than the budget and the burst
+    for second in range(int(max(waits))):
+        assert sum(second <= wait < second + 60 for wait in waits) <= per_minute + burst
+    assert pacer.stats()["requests"] == total
+
+
+def test_jitter_stays_within_its_bounds():
+    pacer = bucket(max_per_minute=60, burst=1, jitter=0.25)
+    pacer.acquire()
+    for expected in range(1, 50):
+        assert expected * 0.75 <= pacer.acquire() <= expected * 1.25
+
+
+def test_fixed_pacer_spaces_every_request():
+    pacer = FixedDelayPacer(max_per_minute=30)
+    pacer.clock = Clock()
+    pacer.sleep = lambda seconds: None
+    assert [pacer.acquire() for _ in range(4)] == [0.0, 2.0, 4.0, 6.0]
+
+
+def test_unknown_pacer_falls_back_to_the_token_bucket():
+    assert isinstance(create_pacer("bogus", burst=2.0), TokenBucketPacer)
+    assert type(create_pacer("none", burst=2.0)) is Pacer
+    assert isinstance(create_pacer("fixed", burst=2.0), FixedDelayPacer)
@@ -0,0 +1,248 @@
+import threading
+import time
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from core import pagecache
+from core.pagecache import PageCache, SingleFlight
+from core.recorder import build_response
+from core.request import WebWrapper
+
+BASE = "https://nl01.tribalwars.nl/game.php?"
+
+
+@pytest.fixture
+def cache():
+    return PageCache(max_age=300)
+
+
+@pytest.mark.parametrize("query", [
+    "village=1&screen=main&action=upgrade_building&id=barracks&h=abc",
+    "village=1&screen=place&ajaxaction=popup_command",
+    "village=1&screen=snob&h=abc",
+])
+def test_state_changing_urls(query):
+    assert PageCache.changes_state(BASE + query)
+    assert PageCache.key(BASE + query) is None
+
+
+@pytest.mark.parametrize("query", [
+    "screen=overview&intro",
+    "village=1&screen=api&ajax=quest_popup",
+    "village=1&screen=place&ajax=command",
+    "village=1",
+])
+def test_uncached_urls(query):
+    assert not PageCache.changes_state(BASE + query)
+    assert PageCache.key(BASE + query) is None
+
+
+def test_keys_ignore_parameter_order():
+    assert PageCache.key(BASE + "village=1&screen=place&mode=units") == \
+        PageCache.key(BASE + "mode=units&screen=place&village=1")
+    assert PageCache.key(BASE + "village=1&screen=place") != PageCache.key(BASE + "village=2&screen=place")
+
+
+def test_global_screens_are_shared_by_villages():
+    assert PageCache.key(BASE + "village=1&screen=report&mode=all") == \
+        PageCache.key(BASE + "village=2&screen=report&mode=all")
+
+
+def test_put_and_get(cache):
+    cache.put(BASE + "village=1&screen=main", "main page")
+    assert cache.get(BASE + "village=1&screen=main") == "main page"
+    assert cache.get(BASE + "village=2&screen=main") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_invalidate_drops_the_village_and_global_entries(cache):
+    cache.put(BASE + "village=1&screen=main", "main 1")
+    cache.put(BASE + "village=1&screen=place", "place 1")
+    cache.put(BASE + "village=2&screen=main", "main 2")
+    cache.put(BASE + "village=2&screen=report&mode=all", "reports")
+    cache.invalidate(BASE + "village=1&screen=main&action=upgrade_building&h=abc")
+    assert cache.get(BASE + "village=1&screen=main") is None
+    assert cache.get(BASE + "village=1&screen=place") is None
+    assert cache.get(BASE + "village=1&screen=report&mode=all") is None
+    assert cache.get(BASE + "village=2&screen=main") == "main 2"
+    assert cache.stats()["invalidations"] == 3
+
+
+def test_invalidate_without_village_drops_everything(cache):
+    cache.put(BASE + "village=1&screen=main", "main 1")
+    cache.put(BASE + "village=2&screen=main", "main 2")
+    cache.invalidate(BASE + "screen=settings&action=change&h=abc")
+    assert cache.get(BASE + "village=1&screen=main") is None
+    assert cache.get(BASE + "village=2&screen=main") is None
+
+
+def test_entries_expire(cache, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(pagecache.time, "monotonic", lambda: now[0])
+    cache.put(BASE + "village=1&screen=main", "main page")
+    now[0] += 299
+    assert cache.get(BASE + "village=1&screen=main") == "main page"
+    now[0] += 2
+    assert cache.get(BASE + "village=1&screen=main") is None
+
+
+def test_disabled_cache_stores_nothing():
+    cache = PageCache(max_age=0)
+    cache.put(BASE + "village=1&screen=main", "main page")
+    assert cache.get(BASE + "village=1&screen=main") is None
+    assert not cache.entries
+
+
+def test_clear_ends_the_cycle(cache):
+    cache.put(BASE + "village=1&screen=main", "main page")
+    cache.clear()
+    assert cache.get(BASE + "village=1&screen=main") is None
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def concurrently(amount, target):
+    threads = [threading.Thread(target=target) for _ in range(amount)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return object()
+
+    threads = concurrently(5, lambda: results.append(flight.do("main", fetch)))
+    wait_until(lambda: flight.shared == 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert len(results) == 5
+    assert all(result is results[0] for result in results)
+    assert flight.calls == {}
+
+
+def test_single_flight_failure_reaches_every_caller():
+    flight = SingleFlight()
+    release = threading.Event()
+    error = ConnectionError("reset")
+    errors = []
+
+    def fetch():
+        release.wait(5)
+        raise error
+
+    def caller():
+        try:
+            flight.do("main", fetch)
+        except ConnectionError as e:
+            errors.append(e)
+
+    threads = concurrently(4, caller)
+    wait_until(lambda: flight.shared == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert errors == [error] * 4
+    # the failure is not remembered, the next call runs again
+    assert flight.do("main", lambda: "page") == "page"
+
+
+def test_single_flight_keys_and_sequential_calls_run_separately():
+    flight = SingleFlight()
+    assert flight.do("main", lambda: 1) == 1
+    assert flight.do("main", lambda: 2) == 2
+    assert flight.do("barracks", lambda: 3) == 3
+    assert flight.shared == 0
+
+
+class SlowWorld(BaseAdapter):
+    """
+    Holds every request until it is released
+    """
+
+    def __init__(self, status=200, error=None):
+        super().__init__()
+        self.status = status
+        self.error = error
+        self.release = threading.Event()
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(request.url)
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        return build_response(request, self.status, b"<html><body>main</body></html>", {"content-type": "text/html"})
+
+    def close(self):
+        pass
+
+
+def slow_wrapper(world):
+    wrapper = WebWrapper("https://nl01.tribalwars.nl/", endpoint="https://nl01.tribalwars.nl/game.php")
+    wrapper.replay(adapter=world)
+    wrapper.pacer.sleep = lambda seconds: None
+    wrapper.retry.sleep = lambda seconds: None
+    wrapper.retry.breaker.threshold = 0
+    return wrapper
+
+
+def test_get_url_sends_concurrent_identical_requests_once():
+    world = SlowWorld()
+    wrapper = slow_wrapper(world)
+    pages = []
+    threads = concurrently(4, lambda: pages.append(wrapper.get_url("game.php?village=1&screen=main")))
+    wait_until(lambda: wrapper.in_flight.shared == 3)
+    world.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(world.urls) == 1
+    assert len(pages) == 4
+    assert all(page is pages[0] and page.status_code == 200 for page in pages)
+
+
+def test_get_url_failure_reaches_every_pipeline():
+    world = SlowWorld(status=503)
+    wrapper = slow_wrapper(world)
+    wrapper.retry.retries = 0
+    pages = []
+    threads = concurrently(3, lambda: pages.append(wrapper.get_url("game.php?village=1&screen=main")))
+    wait_until(lambda: wrapper.in_flight.shared == 2)
+    world.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(world.urls) == 1
+    # an error page is shared but not cached
+    assert [page.status_code for page in pages] == [503] * 3
+    assert wrapper.page_cache.get("https://nl01.tribalwars.nl/game.php?village=1&screen=main") is None
+
+
+def test_get_url_exception_reaches_every_pipeline():
+    world = SlowWorld(error=requests.exceptions.ConnectionError("reset"))
+    wrapper = slow_wrapper(world)
+    wrapper.retry.retries = 0
+    pages = []
+    threads = concurrently(3, lambda: pages.append(wrapper.get_url("game.php?village=1&screen=main")))
+    wait_until(lambda: wrapper.in_flight.shared == 2)
+    world.release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(world.urls) == 1
+    assert pages == [None] * 3
@@ -0,0 +1,100 @@
+import io
+
+import pytest
+from requests import Response
+
+from core.botprotection import PROTECTION_MARKER
+from core.request import WebWrapper
+
+HEAD = (
+    '<html><head><meta content="tok" name="csrf-token"/></head><body class="site">'
+    "<script>TribalWars.updateGameData({\"csrf\":\"tok\"});</script>"
+    '<a id="logout" href="/game.php?screen=&amp;action=logout&h=tok">Logout</a>'
+)
+URL = "https://nl01.tribalwars.nl/game.php?village=1&screen=market"
+
+
+class Body(io.BytesIO):
+    """
+    Streamed body that remembers if it was closed
+    """
+    closed_early = False
+
+    def close(self):
+        self.closed_early = self.tell() < len(self.getvalue())
+        super().close()
+
+
+def streamed(text):
+    response = Response()
+    response.status_code = 200
+    response.encoding = "utf-8"
+    response.headers["content-type"] = "text/html; charset=UTF-8"
+    response.url = URL
+    response.raw = Body(text.encode("utf-8"))
+    return response
+
+
+@pytest.fixture
+def wrapper():
+    wrapper = WebWrapper("https://nl01.tribalwars.nl/")
+    wrapper.peek_chunk_size = 1024
+    return wrapper
+
+
+def test_stops_when_the_markers_are_found(wrapper):
+    text = HEAD + '<span id="market_merchant_available_count">3</span>' + "x" * 50000
+    response = streamed(text)
+    page = wrapper.read_partial(URL, response, ['available_count">3'])
+    assert 'available_count">3' in page
+    assert not page.complete
+    assert len(page.text) < 4096
+    assert response.raw.closed_early
+    assert wrapper.metrics.snapshot()["endpoints"]["market"]["body_bytes"] < 4096
+
+
+def test_missing_marker_reads_the_whole_body(wrapper):
+    text = HEAD + "x" * 5000
+    page = wrapper.read_partial(URL, streamed(text), ['available_count">0'])
+    assert 'available_count">0' not in page
+    assert page.complete
+    assert page.text == text
+
+
+def test_stops_after_the_until_marker(wrapper):
+    text = HEAD + '<span id="market_merchant_available_count">0</span>' + "x" * 50000
+    page = wrapper.read_partial(
+        URL, streamed(text), ['available_count">0'], until='market_merchant_available_count">'
+    )
+    assert 'available_count">0' in page
+    assert not page.complete
+
+
+@pytest.mark.parametrize("offset", range(1000, 1040))
+def test_marker_split_across_chunks(wrapper, offset):
+    marker = 'market_merchant_available_count">7'
+    text = HEAD + "y" * (offset - len(HEAD)) + marker + "x" * 50000
+    page = wrapper.read_partial(URL, streamed(text), [marker])
+    assert marker in page
+    assert not page.complete
+
+
+def test_protection_marker_in_the_read_part(wrapper):
+    text = HEAD.replace('<body class="site">', f'<body class="site" {PROTECTION_MARKER}>') + "x" * 50000
+    page = wrapper.read_partial(URL, streamed(text), [])
+    assert PROTECTION_MARKER in page
+    assert not page.complete
+
+
+def test_unread_part_is_not_checked(wrapper):
+    text = HEAD + "x" * 50000 + PROTECTION_MARKER
+    response = streamed(text)
+    page = wrapper.read_partial(URL, response, [])
+    assert PROTECTION_MARKER not in page
+    assert response.raw.closed_early
+
+
+def test_session_tokens_are_read(wrapper):
+    page = wrapper.read_partial(URL, streamed(HEAD + "x" * 50000), [])
+    wrapper.post_process(page, remember=False)
+    assert wrapper.last_h == "tok"
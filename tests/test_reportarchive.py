@@ -0,0 +1,151 @@
+import os
+import time
+
+import pytest
+
+from core.reportarchive import ReportArchive
+
+
+def report(dest, report_type="attack", **extra):
+    return {"type": report_type, "origin": "1", "dest": dest, "losses": {}, "extra": extra}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "reports")
+
+
+def open_archive(path, **kwargs):
+    kwargs.setdefault("migrate", False)
+    # small segments, a few reports fill one
+    kwargs.setdefault("segment_bytes", 512)
+    return ReportArchive(path, **kwargs)
+
+
+def reopen(archive, path, **kwargs):
+    archive.close()
+    return open_archive(path, **kwargs)
+
+
+def fill(archive, amount, start=0):
+    now = int(time.time())
+    archive.put_many([
+        (str(1000 + i), report(str(i % 7), "scout" if i % 3 == 0 else "attack", note="x" * 40), now - amount + i)
+        for i in range(start, start + amount)
+    ])
+
+
+def test_put_get_and_grab(path):
+    archive = open_archive(path)
+    archive.put("1", report("10"))
+    archive.put("2", report("11", "scout"))
+    archive.put("1", report("12"))
+    assert archive.get("1")["dest"] == "12"
+    assert archive.get("3") is None
+    assert archive.count() == 2
+    # oldest write first, a replaced report moves to the end
+    assert list(archive.grab()) == ["2", "1"]
+    assert list(archive.grab(type="scout")) == ["2"]
+    assert list(archive.grab(dest="12")) == ["1"]
+    archive.close()
+
+
+def test_restart_reads_sealed_and_active_segments(path):
+    archive = open_archive(path)
+    fill(archive, 40)
+    expected = archive.grab()
+    archive = reopen(archive, path)
+    assert len(archive.segments) > 1
+    assert os.path.exists(archive.segment_path(archive.segments[0], "idx"))
+    assert archive.grab() == expected
+    fill(archive, 5, start=40)
+    assert archive.count() == 45
+    archive.close()
+
+
+def test_torn_record_at_the_end_is_dropped(path):
+    archive = open_archive(path, segment_bytes=1024 * 1024)
+    fill(archive, 5)
+    archive.close()
+    with open(archive.segment_path(archive.segments[-1]), "ab") as f:
+        f.write(b"\x01\x02\x03 interrupted write")
+    archive = open_archive(path, segment_bytes=1024 * 1024)
+    assert archive.count() == 5
+    archive.put("new", report("1"))
+    archive = reopen(archive, path, segment_bytes=1024 * 1024)
+    assert archive.count() == 6
+    assert archive.get("new")["dest"] == "1"
+    archive.close()
+
+
+def test_trim_keeps_the_newest_reports(path):
+    archive = open_archive(path)
+    fill(archive, 30)
+    newest = list(archive.grab())[-10:]
+    assert archive.trim(10) == 20
+    archive.compaction.join()
+    assert list(archive.grab()) == newest
+    assert archive.trim(10) == 0
+    archive = reopen(archive, path)
+    assert list(archive.grab()) == newest
+    archive.close()
+
+
+def test_trim_to_nothing_survives_a_restart(path):
+    archive = open_archive(path)
+    fill(archive, 30)
+    assert archive.trim(0) == 30
+    archive.compaction.join()
+    assert archive.count() == 0
+    archive = reopen(archive, path)
+    assert archive.count() == 0
+    assert archive.grab() == {}
+    # reports written after the trim are kept, also after another restart
+    archive.put("new", report("1"))
+    assert list(archive.grab()) == ["new"]
+    archive = reopen(archive, path)
+    assert list(archive.grab()) == ["new"]
+    archive.close()
+
+
+def test_compaction_removes_dead_segments(path):
+    archive = open_archive(path)
+    fill(archive, 40)
+    sealed = archive.segments[:-1]
+    archive.trim(5)
+    live = {item[2] for item in archive.index.values()}
+    archive.compaction.join()
+    # sealed segments without live reports are removed, the others are rewritten or kept
+    for number in sealed:
+        if number not in live:
+            assert not os.path.exists(archive.segment_path(number))
+            assert not os.path.exists(archive.segment_path(number, "idx"))
+    assert len(archive.segments) < len(sealed)
+    kept = archive.grab()
+    assert len(kept) == 5
+    archive = reopen(archive, path)
+    assert archive.grab() == kept
+    archive.close()
+
+
+def test_expire_by_report_time(path):
+    archive = open_archive(path)
+    now = int(time.time())
+    archive.put("old", report("1"), when=now - 10 * 86400)
+    archive.put("new", report("1"), when=now - 3600)
+    assert archive.expire(86400) == 1
+    assert list(archive.grab()) == ["new"]
+    archive = reopen(archive, path)
+    # the retention is stored with the archive
+    assert list(archive.grab()) == ["new"]
+    assert archive.expire(0) == 0
+    archive.close()
+
+
+def test_readonly_reader_sees_the_writes(path):
+    archive = open_archive(path)
+    fill(archive, 20)
+    reader = open_archive(path, readonly=True)
+    assert reader.grab() == archive.grab()
+    reader.close()
+    archive.close()
@@ -0,0 +1,108 @@
+import logging
+
+import pytest
+
+from benchmarks.reports import generate, previous_has_resources_left, previous_safe_to_engage
+from game.reports import ReportManager
+
+
+def manager_with(reports=None):
+    manager = ReportManager()
+    manager.logger = logging.getLogger("Reports")
+    manager.last_reports = dict(reports or {})
+    manager.index_reports()
+    return manager
+
+
+def report(dest, when, report_type="attack", losses=None, resources=None):
+    extra = {"when": when, "units_sent": {"light": 10}, "units_losses": losses or {}}
+    if report_type == "scout":
+        extra.update(defence_units={}, defence_losses={}, resources=resources or {})
+    return {"type": report_type, "origin": "1", "dest": dest, "losses": losses or {}, "extra": extra}
+
+
+@pytest.fixture(scope="module")
+def generated():
+    return generate(2000, 60, seed=3)
+
+
+def test_index_matches_the_full_scan(generated, capsys):
+    targets, reports = generated
+    manager = manager_with(reports)
+    for vid in targets + ["unknown"]:
+        assert manager.has_resources_left(vid) == previous_has_resources_left(manager, vid)
+        assert manager.safe_to_engage(vid) == previous_safe_to_engage(manager, vid)
+
+
+def test_remember_matches_a_rebuild(generated, capsys):
+    targets, reports = generated
+    incremental = manager_with()
+    # read in a different order than the ids, like pages of the report list
+    for report_id in sorted(reports, key=lambda key: int(key) % 97):
+        incremental.remember(report_id, reports[report_id])
+    rebuilt = manager_with(reports)
+    assert incremental.by_destination == rebuilt.by_destination
+    for vid in targets:
+        assert incremental.has_resources_left(vid) == rebuilt.has_resources_left(vid)
+        assert incremental.safe_to_engage(vid) == rebuilt.safe_to_engage(vid)
+
+
+def test_destination_lists_are_sorted_by_report_id():
+    manager = manager_with()
+    for report_id in ("30", "4", "200", "x"):
+        manager.remember(report_id, report("1", 100))
+    assert manager.by_destination["1"] == [(-1, "x"), (4, "4"), (30, "30"), (200, "200")]
+
+
+def test_newest_report_decides(capsys):
+    manager = manager_with()
+    manager.remember("1", report("5", 100, losses={"light": 10}))
+    assert manager.safe_to_engage("5") == 0
+    manager.remember("2", report("5", 200))
+    assert manager.safe_to_engage("5") == 1
+    # an older report that is read later does not change the verdict
+    manager.remember("0", report("5", 50, losses={"light": 10}))
+    assert manager.safe_to_engage("5") == 1
+
+
+def test_latest_report_time_gives_the_resources():
+    manager = manager_with()
+    manager.remember("1", report("5", 100, "scout", resources={"wood": "10"}))
+    manager.remember("2", report("5", 300, "scout", resources={"wood": "30"}))
+    manager.remember("3", report("5", 200, "scout", resources={"wood": "20"}))
+    assert manager.has_resources_left("5") == (True, {"wood": "30"})
+    manager.remember("4", report("5", 400))
+    assert manager.has_resources_left("5") == (False, {})
+
+
+def test_report_stored_again_updates_the_village(capsys):
+    manager = manager_with()
+    manager.remember("1", report("5", 100, "scout", resources={"wood": "10"}))
+    manager.remember("2", report("5", 300, "scout", resources={"wood": "30"}))
+    assert manager.has_resources_left("5") == (True, {"wood": "30"})
+    assert manager.safe_to_engage("5") == 1
+    # the newest report is stored again with an earlier time and losses
+    manager.remember("2", report("5", 50, losses={"light": 10}))
+    assert manager.has_resources_left("5") == (True, {"wood": "10"})
+    assert manager.safe_to_engage("5") == 0
+    assert manager.by_destination["5"] == [(1, "1"), (2, "2")]
+
+
+def test_report_moved_to_another_village(capsys):
+    manager = manager_with()
+    manager.remember("1", report("5", 100, "scout", resources={"wood": "10"}))
+    manager.remember("2", report("5", 200, losses={"light": 10}))
+    assert manager.safe_to_engage("5") == 0
+    manager.remember("2", report("6", 200, losses={"light": 10}))
+    assert manager.by_destination["5"] == [(1, "1")]
+    assert manager.by_destination["6"] == [(2, "2")]
+    assert manager.safe_to_engage("5") == 1
+    assert manager.safe_to_engage("6") == 0
+    assert manager.has_resources_left("5") == (True, {"wood": "10"})
+    assert manager.has_resources_left("6") == (False, {})
+
+
+def test_unknown_village():
+    manager = manager_with()
+    assert manager.safe_to_engage("404") == -1
+    assert manager.has_resources_left("404") == (False, {})
@@ -0,0 +1,166 @@
+import io
+
+import pytest
+import requests
+from requests import Response
+
+from core.exceptions import CircuitOpenException, RequestFailedException
+from core.resilience import Backoff, CircuitBreaker, RetryPolicy, classify
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def respond(status):
+    response = Response()
+    response.status_code = status
+    response.raw = io.BytesIO(b"")
+    return response
+
+
+class Endpoint:
+    """
+    Fake request that answers with the queued results, exceptions are raised
+    """
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0) if len(self.results) > 1 else self.results[0]
+        if isinstance(result, Exception):
+            raise result
+        return respond(result)
+
+
+@pytest.fixture
+def policy():
+    policy = RetryPolicy(retries=3, breaker=CircuitBreaker(threshold=0))
+    policy.sleep = lambda seconds: None
+    policy.breaker.clock = Clock()
+    return policy
+
+
+def test_classify():
+    assert classify(exception=requests.exceptions.ConnectTimeout()) == "transient_unsent"
+    assert classify(exception=requests.exceptions.ReadTimeout()) == "transient"
+    assert classify(exception=requests.exceptions.ConnectionError()) == "transient"
+    assert classify(exception=ValueError()) == "permanent"
+    assert classify(response=respond(503)) == "transient"
+    assert classify(response=respond(404)) is None
+    assert classify(response=respond(200)) is None
+
+
+def test_backoff_is_bounded():
+    backoff = Backoff(base=2.0, factor=2.0, max_delay=10.0)
+    for attempt in range(1, 10):
+        assert 0 <= backoff.delay(attempt) <= min(10.0, 2.0 * 2 ** (attempt - 1))
+
+
+def test_transient_failures_are_retried(policy):
+    endpoint = Endpoint(requests.exceptions.ReadTimeout(), 502, 200)
+    assert policy.call("main", endpoint).status_code == 200
+    assert endpoint.calls == 3
+    assert policy.retried == 2
+
+
+def test_retries_stop_after_the_configured_amount(policy):
+    endpoint = Endpoint(requests.exceptions.ConnectionError("refused"))
+    with pytest.raises(RequestFailedException) as error:
+        policy.call("main", endpoint)
+    assert error.value.transient
+    assert endpoint.calls == policy.retries + 1
+
+
+def test_error_page_is_returned_after_the_last_retry(policy):
+    endpoint = Endpoint(503)
+    assert policy.call("main", endpoint).status_code == 503
+    assert endpoint.calls == policy.retries + 1
+
+
+def test_permanent_failures_are_not_retried(policy):
+    endpoint = Endpoint(ValueError("bad url"))
+    with pytest.raises(RequestFailedException) as error:
+        policy.call("main", endpoint)
+    assert not error.value.transient
+    assert endpoint.calls == 1
+
+
+def test_actions_are_only_retried_when_they_were_not_sent(policy):
+    sent = Endpoint(requests.exceptions.ReadTimeout())
+    with pytest.raises(RequestFailedException):
+        policy.call("place", sent, idempotent=False)
+    assert sent.calls == 1
+
+    unsent = Endpoint(requests.exceptions.ConnectTimeout(), 200)
+    assert policy.call("place", unsent, idempotent=False).status_code == 200
+    assert unsent.calls == 2
+
+
+def test_breaker_opens_after_the_threshold():
+    breaker = CircuitBreaker(threshold=3, reset_timeout=120)
+    breaker.clock = Clock()
+    for _ in range(2):
+        breaker.failure("main")
+    breaker.check("main")
+    breaker.failure("main")
+    with pytest.raises(CircuitOpenException) as error:
+        breaker.check("main")
+    assert error.value.retry_after == pytest.approx(120)
+    # other endpoints are not affected
+    breaker.check("barracks")
+
+
+def test_breaker_half_open_trial():
+    breaker = CircuitBreaker(threshold=2, reset_timeout=120)
+    breaker.clock = clock = Clock()
+    breaker.failure("main")
+    breaker.failure("main")
+    clock.now += 119
+    with pytest.raises(CircuitOpenException):
+        breaker.check("main")
+
+    clock.now += 1
+    # the trial request goes through, the next one waits for its result
+    breaker.check("main")
+    with pytest.raises(CircuitOpenException):
+        breaker.check("main")
+
+    # a failed trial closes the endpoint for another reset_timeout
+    breaker.failure("main")
+    clock.now += 60
+    with pytest.raises(CircuitOpenException):
+        breaker.check("main")
+
+    clock.now += 60
+    breaker.check("main")
+    breaker.success("main")
+    assert breaker.state() == {}
+    breaker.check("main")
+    # the failure count starts over
+    breaker.failure("main")
+    breaker.check("main")
+
+
+def test_threshold_zero_disables_the_breaker():
+    breaker = CircuitBreaker(threshold=0)
+    for _ in range(50):
+        breaker.failure("main")
+    breaker.check("main")
+
+
+def test_open_breaker_stops_the_retries(policy):
+    policy.breaker.threshold = 2
+    endpoint = Endpoint(requests.exceptions.ReadTimeout())
+    with pytest.raises(CircuitOpenException):
+        policy.call("main", endpoint)
+    assert endpoint.calls == 2
+    with pytest.raises(CircuitOpenException):
+        policy.call("main", Endpoint(200))
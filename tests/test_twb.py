@@ -0,0 +1,57 @@
+import pytest
+import requests
+
+from core.exceptions import CircuitOpenException, RequestFailedException, VillageInitException
+from core.request import WebWrapper
+from twb import TWB
+
+
+class FakeVillage:
+    """
+    Village whose run raises the given exception
+    """
+    village_id = "1"
+    def_man = None
+
+    def __init__(self, error=None):
+        self.error = error
+        self.wrapper = WebWrapper("https://nl01.tribalwars.nl/")
+
+    def run(self, config=None):
+        if self.error:
+            raise self.error
+
+    def get_config(self, section, parameter, default=None):
+        return default
+
+
+@pytest.mark.parametrize("error", [
+    RequestFailedException("game.php", "timeout", transient=True),
+    CircuitOpenException("game.php", 30),
+    requests.exceptions.ConnectionError("refused"),
+])
+def test_failed_request_skips_the_village(error):
+    states = {}
+    TWB.run_village(FakeVillage(error), config={}, defense_states=states)
+    assert states == {}
+
+
+@pytest.mark.parametrize("error", [
+    KeyError("units"),
+    TypeError("'NoneType' object is not subscriptable"),
+    VillageInitException("Error reading game data"),
+])
+def test_other_errors_are_raised(error):
+    village = FakeVillage(error)
+    village.wrapper.last_error = requests.exceptions.ReadTimeout("earlier request")
+    with pytest.raises(type(error)):
+        TWB.run_village(village, config={}, defense_states={})
+
+
+@pytest.mark.parametrize("value, expected", [
+    (4, 4), ("2", 2), (1.0, 1), (0, 1), (-3, 1), (2.5, 1), ("many", 1), (None, 1), (float("inf"), 1),
+])
+def test_concurrent_villages_is_validated(value, expected):
+    wrapper = WebWrapper("https://nl01.tribalwars.nl/")
+    wrapper.set_concurrency(value)
+    assert wrapper.concurrency == expected
@@ -0,0 +1,21 @@
+from core.extractors import Extractor
+
+
+def units_page(cells):
+    return (
+        '<html><body><table id="units_home"><tr><th>Village</th></tr>'
+        f"<tr>{cells}</tr><tr><td>Support</td></tr></table></body></html>"
+    )
+
+
+def test_units_in_village_are_ints():
+    text = units_page(
+        "<td class='unit-item unit-item-spear'>120</td>"
+        "<td class='unit-item unit-item-sword hidden'>0</td>"
+        "<td class='unit-item unit-item-knight tooltip'>1</td>"
+    )
+    assert Extractor.units_in_village(text) == [("spear", 120), ("knight", 1)]
+
+
+def test_units_in_village_without_table():
+    assert Extractor.units_in_village("<html><body></body></html>") == []
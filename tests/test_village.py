@@ -0,0 +1,17 @@
+import logging
+
+from game.buildingmanager import BuildingManager
+from game.village import Village
+
+
+def test_disabled_builder_drops_the_state_of_an_earlier_run():
+    village = Village(village_id="1", wrapper=None)
+    village.logger = logging.getLogger("Village test")
+    village.config = {"villages": {"1": {"building": False}}}
+    village.builder = BuildingManager(wrapper=None, village_id="1")
+    village.builder.game_state = {"village": {"wood": 100}}
+
+    village.run_builder()
+
+    # update_totals falls back to the game state of this cycle
+    assert village.builder.game_state == {}
@@ -18,6 +18,7 @@ TWB - an open source Tribal Wars bot
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 
+import asyncio
 import collections
 import copy
 import datetime
@@ -34,12 +35,13 @@ import requests
 
 from core.notification import Notification
 from core.updater import check_update
+from core.cachestore import CacheStore
 from core.filemanager import FileManager
 from core.request import WebWrapper
 from game.village import Village
 from manager import VillageManager
-from pages.overview import OverviewPage
-from core.exceptions import UnsupportedPythonVersion
+from pages.overview import OverviewIngestion, OverviewPage
+from core.exceptions import RequestFailedException, UnsupportedPythonVersion
 from core.extractors import Extractor
 
 coloredlogs.install(
@@ -75,6 +77,8 @@ class TWB:
     should_run = True
     runs = 0
     found_villages = []
+    # overview modes that are not available on this account (no premium), they are not requested again
+    overview_unavailable = None
 
     @staticmethod
     def internet_online():
@@ -147,7 +151,7 @@ class TWB:
             template["server"]["server"] = sub_parts.lower()
             template["bot"]["user_agent"] = browser_ua
 
-            FileManager.save_json_file(template, "config.json")
+            FileManager.save_json_file(template, "config.json", pretty=True)
             print("Deployed new configuration file")
             return True
 
@@ -179,7 +183,7 @@ class TWB:
             FileManager.copy_file("config.json", "config.bak")
 
             config = self.merge_configs(config, template)
-            FileManager.save_json_file(config, "config.json")
+            FileManager.save_json_file(config, "config.json", pretty=True)
 
             print("Deployed new configuration file")
 
@@ -236,7 +240,7 @@ class TWB:
 
         original["villages"][village_id] = template if template else original["village_template"]
 
-        FileManager.save_json_file(original, "config.json")
+        FileManager.save_json_file(original, "config.json", pretty=True)
         print("Deployed new configuration file")
         return original
 
@@ -309,7 +313,9 @@ class TWB:
             reporter_constr=config["reporting"]["connection_string"],
         )
 
+        self.wrapper.set_transport(config["bot"].get("transport", "requests"))
         self.wrapper.start()
+        self.wrapper.protection.write_status()
         if not config["bot"].get("user_agent", None):
             print(
                 "No custom user agent was supplied, this will likely get you banned."
@@ -318,9 +324,23 @@ class TWB:
             )
             return
         self.wrapper.headers["user-agent"] = config["bot"]["user_agent"]
+        self.wrapper.set_concurrency(config["bot"].get("concurrent_villages", 1))
+        self.wrapper.page_cache.max_age = config["bot"].get("page_cache_max_age", 300)
+        read_cache_bytes = int(config["bot"].get("read_cache_max_mb", 32) * 1024 * 1024)
+        FileManager.read_cache.max_bytes = read_cache_bytes
+        CacheStore.shared().cache.max_bytes = read_cache_bytes
+        self.wrapper.set_pacer(
+            config["bot"].get("pacer", "token_bucket"),
+            burst=float(config["bot"].get("pacer_burst", 3)),
+        )
+        self.wrapper.max_requests_per_minute = config["bot"].get("max_requests_per_minute", 0)
+        self.wrapper.set_timeout(config["bot"].get("request_timeout", [10, 30]))
+        self.wrapper.retry.retries = config["bot"].get("request_retries", 3)
+        self.wrapper.retry.breaker.threshold = config["bot"].get("circuit_breaker_threshold", 5)
         for vid in config["villages"]:
             v = Village(wrapper=self.wrapper, village_id=vid)
             self.villages.append(copy.deepcopy(v))
+        self.overview_unavailable = set()
         # setup additional builder
         rm = None
         defense_states = {}
@@ -342,14 +362,23 @@ class TWB:
                 )
                 time.sleep(sleep)
             else:
+                # files changed since the last cycle (config.json) are picked up again
+                FileManager.new_cycle()
                 config = self.config()
+                self.wrapper.page_cache.clear()
                 overview_page, config = self.get_overview(config)
                 has_changed, new_cf = self.get_world_options(overview_page, config)
                 if has_changed:
                     print("Updated world options")
                     config = self.merge_configs(config, new_cf)
-                    FileManager.save_json_file(config, "config.json")
+                    FileManager.save_json_file(config, "config.json", pretty=True)
                     print("Deployed new configuration file")
+                ingestion = None
+                if config["bot"].get("overview_ingestion", True) and len(self.found_villages) > 1:
+                    # one request per overview screen instead of a few requests per village
+                    ingestion = OverviewIngestion(self.wrapper, overview_page, self.overview_unavailable)
+                    ingestion.ingest()
+                runnable = []
                 village_number = 1
                 for village in self.villages:
                     if village.village_id not in self.found_villages:
@@ -375,22 +404,16 @@ class TWB:
                         num_pad = fs % village_number
                         template = template.replace("{num}", num_pad)
                         village.village_set_name = template
-
-                    village.run(config=config)
-
-                    if (
-                            village.get_config(
-                                section="units", parameter="manage_defence", default=False
-                            )
-                            and village.def_man
-                    ):
-                        defense_states[village.village_id] = (
-                            village.def_man.under_attack
-                            if village.def_man.allow_support_recv
-                            else False
-                        )
+                    village.overview = ingestion.get(village.village_id) if ingestion else None
+                    runnable.append(village)
                     village_number += 1
 
+                if self.wrapper.concurrency > 1 and len(runnable) > 1:
+                    asyncio.run(self.run_villages_async(runnable, config, defense_states))
+                else:
+                    for village in runnable:
+                        self.run_village(village, config, defense_states)
+
                 if len(defense_states) and config["farms"]["farm"]:
                     for village in self.villages:
                         print("Syncing attack states")
@@ -409,6 +432,16 @@ class TWB:
                 self.runs += 1
 
                 VillageManager.farm_manager(verbose=True)
+                # write the queued cache entries before sleeping
+                FileManager.flush()
+                self.wrapper.pacer.log_stats()
+                self.wrapper.page_cache.log_stats()
+                FileManager.read_cache.log_stats()
+                CacheStore.shared().cache.log_stats()
+                self.wrapper.metrics.log_stats()
+                self.wrapper.metrics.dump()
+                if self.wrapper.in_flight.shared:
+                    logging.info("%d page requests were shared with concurrent villages", self.wrapper.in_flight.shared)
                 print(
                     "Dead for %.2f minutes (next run at: %s)"
                     % (sleep / 60, dt_next.time())
@@ -416,14 +449,50 @@ class TWB:
                 sys.stdout.flush()
                 time.sleep(sleep)
 
+    @staticmethod
+    def run_village(village, config, defense_states):
+        """
+        Runs a single village pipeline and stores its defence state
+        A village whose requests failed (server down, circuit open) is skipped until the next cycle,
+        the state of the other villages (map, reports, session) stays warm, any other error is a bug and is raised
+        """
+        try:
+            village.run(config=config)
+        except (RequestFailedException, requests.RequestException) as e:
+            logging.warning(
+                "Village %s skipped this cycle after a failed request: %s", village.village_id, str(e)
+            )
+            return
+
+        if (
+                village.get_config(
+                    section="units", parameter="manage_defence", default=False
+                )
+                and village.def_man
+        ):
+            defense_states[village.village_id] = (
+                village.def_man.under_attack
+                if village.def_man.allow_support_recv
+                else False
+            )
+
+    async def run_villages_async(self, villages, config, defense_states):
+        """
+        Runs the village pipelines concurrently
+        All pipelines share the request budget of the web wrapper so the account request rate stays capped
+        """
+        await asyncio.gather(
+            *[
+                self.wrapper.run_async(self.run_village, village, config, defense_states)
+                for village in villages
+            ]
+        )
+
     def start(self):
         """
         First run, verify if dirctory structure exist
         """
         directories = [
-            "cache/attacks",
-            "cache/reports",
-            "cache/villages",
             "cache/world",
             "cache/logs",
             "cache/managed",
@@ -3,7 +3,9 @@ import os
 import sys
 sys.path.insert(0, "../")
 
-from flask import Flask, jsonify, send_from_directory, request, render_template
+from flask import Flask, jsonify, send_from_directory, request, render_template, Response
+
+from core.metrics import RequestMetrics
 
 try:
     from webmanager.helpfile import help_file, buildings
@@ -157,7 +159,8 @@ def sync():
         "config": config,
         "reports": n_items,
         "bot": managed,
-        "status": bot_status
+        "status": bot_status,
+        "protection": DataReader.protection_grab()
     }
     return out_struct
 
@@ -167,12 +170,24 @@ def get_vars():
     return jsonify(sync())
 
 
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    snapshot = DataReader.metrics_grab()
+    return Response(RequestMetrics.to_prometheus(snapshot), mimetype="text/plain; version=0.0.4")
+
+
 @app.route('/bot/start')
 def start_bot():
     bm.start()
     return jsonify(bm.is_running())
 
 
+@app.route('/bot/resume', methods=['POST'])
+def resume_bot():
+    DataReader.resume_flag_set()
+    return jsonify(True)
+
+
 @app.route('/bot/stop')
 def stop_bot():
     bm.stop()
@@ -5,10 +5,17 @@ import subprocess
 
 import psutil
 
+from core.cachestore import CacheStore, TABLES
+from core.reportarchive import ReportArchive
+
 
 class DataReader:
     @staticmethod
     def cache_grab(cache_location):
+        if cache_location == "reports":
+            return ReportArchive(readonly=True).grab()
+        if cache_location in TABLES:
+            return CacheStore.shared().grab(cache_location)
         output = {}
         c_path = os.path.join(
             os.path.dirname(__file__),
@@ -21,7 +28,7 @@ class DataReader:
             if not existing.endswith(".json"):
                 continue
             t_path = os.path.join(os.path.dirname(__file__), "..", "cache", cache_location, existing)
-            with open(t_path, 'r') as f:
+            with open(t_path, 'r', encoding="utf-8") as f:
                 try:
                     output[existing.replace('.json', '')] = json.load(f)
                 except Exception as e:
@@ -31,6 +38,33 @@ class DataReader:
 
         return output
 
+    @staticmethod
+    def metrics_grab():
+        t_path = os.path.join(os.path.dirname(__file__), "..", "cache", "metrics.json")
+        if not os.path.exists(t_path):
+            return {}
+        with open(t_path, 'r', encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except Exception:
+                return {}
+
+    @staticmethod
+    def protection_grab():
+        t_path = os.path.join(os.path.dirname(__file__), "..", "cache", "bot_protection.json")
+        if not os.path.exists(t_path):
+            return {"state": "running"}
+        with open(t_path, 'r', encoding="utf-8") as f:
+            try:
+                return json.load(f)
+            except Exception:
+                return {"state": "running"}
+
+    @staticmethod
+    def resume_flag_set():
+        with open(os.path.join(os.path.dirname(__file__), "..", "cache", "resume"), 'w') as f:
+            f.write("resume")
+
     @staticmethod
     def template_grab(template_location):
         output = []
@@ -45,7 +79,7 @@ class DataReader:
 
     @staticmethod
     def config_grab():
-        with open(os.path.join(os.path.dirname(__file__), "..", "config.json"), 'r') as f:
+        with open(os.path.join(os.path.dirname(__file__), "..", "config.json"), 'r', encoding="utf-8") as f:
             return json.load(f)
 
     @staticmethod
@@ -55,7 +89,7 @@ class DataReader:
         except:
             pass
         config_file_path = os.path.join(os.path.dirname(__file__), "..", "config.json")
-        with open(config_file_path, 'r') as config_file:
+        with open(config_file_path, 'r', encoding="utf-8") as config_file:
             template = json.load(config_file, object_pairs_hook=collections.OrderedDict)
             if "." in parameter:
                 section, param = parameter.split('.')
@@ -70,7 +104,7 @@ class DataReader:
     @staticmethod
     def village_config_set(village_id, parameter, value):
         config_file_path = os.path.join(os.path.dirname(__file__), "..", "config.json")
-        with open(config_file_path, 'r') as config_file:
+        with open(config_file_path, 'r', encoding="utf-8") as config_file:
             template = json.load(config_file, object_pairs_hook=collections.OrderedDict)
             if village_id not in template['villages']:
                 return False
@@ -88,7 +122,7 @@ class DataReader:
         c_path = os.path.join(os.path.dirname(__file__), "..", "cache", "session.json")
         if not os.path.exists(c_path):
             return {"raw": "", "endpoint": "None", "server": "None", "world": "None"}
-        with open(c_path, 'r') as session_file:
+        with open(c_path, 'r', encoding="utf-8") as session_file:
             session_data = json.load(session_file)
             cookies = []
             for c in session_data['cookies']: